@@ -1,12 +1,38 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, session
+from flask import (Flask, render_template, request, redirect, url_for, flash, session, g, jsonify,
+                   Response, stream_template, stream_with_context, send_file, get_flashed_messages, abort,
+                   has_app_context)
 import mysql.connector
+import numpy as np
+from mysql.connector.errors import PoolError
 from werkzeug.security import generate_password_hash, check_password_hash
+from werkzeug.utils import safe_join
+from werkzeug.middleware.proxy_fix import ProxyFix
 from functools import wraps
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeout
+from contextlib import contextmanager
 from datetime import datetime, date, timedelta
+from collections import deque, OrderedDict, namedtuple, defaultdict
+from bisect import bisect_left
+import heapq
+import threading
+import time
 import traceback
+import os
+import gzip
+import zlib
+import hashlib
+import mimetypes
+import csv
+import io
+import json
+
+try:
+    import brotli
+except ImportError:   # без пакета Brotli статика отдаётся в gzip
+    brotli = None
 
 app = Flask(__name__)
-app.secret_key = 'your_secret_key_change_in_production_2024'  # поменяй в проде
+app.secret_key = 'your_secret_key_change_in_production_2024'  # в проде задай CLEANPRO_SECRET_KEY
 
 # Добавляем функцию для форматирования даты в шаблоны
 @app.template_filter('datetimeformat')
@@ -21,24 +47,829 @@ def datetimeformat(value, format='%d.%m.%Y %H:%M'):
     return value.strftime(format)
 
 # Конфигурация базы данных — поменяй при необходимости
-db_config = {
-    'host': '127.0.0.1',
-    'user': 'root',
-    'password': '',
-    'database': 'cleaning_company',
-    'charset': 'utf8mb4'
-}
+# (или задай переменными окружения CLEANPRO_DB_HOST, CLEANPRO_DB_PASSWORD и т. д., см. create_app)
+app.config.update(
+    DB_HOST='127.0.0.1',
+    DB_PORT=3306,
+    DB_USER='root',
+    DB_PASSWORD='',
+    DB_NAME='cleaning_company',
+)
+
+
+def db_config():
+    """Параметры подключения к MySQL из app.config"""
+    return {
+        'host': app.config['DB_HOST'],
+        'port': app.config['DB_PORT'],
+        'user': app.config['DB_USER'],
+        'password': app.config['DB_PASSWORD'],
+        'database': app.config['DB_NAME'],
+        'charset': 'utf8mb4'
+    }
+
+
+# Настройки пула соединений
+app.config.update(
+    DB_POOL_SIZE=5,            # сколько соединений держим открытыми постоянно
+    DB_POOL_MAX_OVERFLOW=10,   # сколько можно открыть сверх размера при пиковой нагрузке
+    DB_POOL_TIMEOUT=10,        # сколько секунд ждать свободного соединения
+    DB_POOL_RECYCLE=3600,      # через сколько секунд переоткрывать соединение
+)
+
+
+class ConnectionPool:
+    """
+    Пул соединений с MySQL.
+    - size соединений живут постоянно, ещё max_overflow открываются при нехватке
+      и закрываются при возврате;
+    - при выдаче соединение проверяется (ping) и пересоздаётся, если сервер его закрыл
+      или оно старше recycle секунд;
+    - если все соединения заняты, запрос ждёт до timeout секунд, затем PoolError.
+    """
+
+    def __init__(self, config, size=5, max_overflow=10, timeout=10, recycle=3600):
+        self.config = config
+        self.size = size
+        self.max_overflow = max_overflow
+        self.timeout = timeout
+        self.recycle = recycle
+        self._idle = deque()     # (conn, время создания)
+        self._born = {}          # id(conn) -> время создания для выданных соединений
+        self._opened = 0         # открытых соединений: свободные + выданные
+        self._cond = threading.Condition()
+        # Счётчики
+        self.in_use = 0
+        self.waits = 0
+        self.wait_time = 0.0
+        self.timeouts = 0
+        self.created = 0
+        self.discarded = 0
+
+    def _connect(self):
+        conn = mysql.connector.connect(**self.config)
+        conn.autocommit = False
+        return conn
+
+    def _is_healthy(self, conn, born):
+        if self.recycle and time.monotonic() - born > self.recycle:
+            return False
+        try:
+            conn.ping(reconnect=False)
+            return True
+        except mysql.connector.Error:
+            return False
+
+    @staticmethod
+    def _close_quietly(conn):
+        try:
+            conn.close()
+        except mysql.connector.Error:
+            pass
+
+    def acquire(self):
+        """Взять соединение из пула (или открыть новое в пределах лимита)"""
+        with self._cond:
+            if not self._idle and self._opened >= self.size + self.max_overflow:
+                self.waits += 1
+                started = time.monotonic()
+                while not self._idle and self._opened >= self.size + self.max_overflow:
+                    remaining = self.timeout - (time.monotonic() - started)
+                    if remaining <= 0:
+                        self.wait_time += time.monotonic() - started
+                        self.timeouts += 1
+                        raise PoolError('Нет свободных соединений с базой данных')
+                    self._cond.wait(remaining)
+                self.wait_time += time.monotonic() - started
+
+            if self._idle:
+                conn, born = self._idle.pop()
+            else:
+                conn, born = None, None
+                self._opened += 1    # резервируем место под новое соединение
+            self.in_use += 1
+
+        # Проверка и открытие соединения — вне блокировки, это сетевые операции
+        try:
+            if conn is not None and not self._is_healthy(conn, born):
+                self._close_quietly(conn)
+                conn = None
+                with self._cond:
+                    self.discarded += 1
+            if conn is None:
+                conn = self._connect()
+                born = time.monotonic()
+                with self._cond:
+                    self.created += 1
+        except mysql.connector.Error:
+            with self._cond:
+                self._opened -= 1
+                self.in_use -= 1
+                self._cond.notify()
+            raise
+
+        with self._cond:
+            self._born[id(conn)] = born
+        return conn
+
+    def release(self, conn):
+        """Вернуть соединение в пул; незавершённая транзакция откатывается"""
+        healthy = True
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except mysql.connector.Error:
+            healthy = False
+
+        with self._cond:
+            born = self._born.pop(id(conn), 0)
+            self.in_use -= 1
+            keep = healthy and len(self._idle) < self.size
+            if keep:
+                self._idle.append((conn, born))
+            else:
+                self._opened -= 1
+                if not healthy:
+                    self.discarded += 1
+            self._cond.notify()
+
+        if not keep:
+            self._close_quietly(conn)
+
+    def stats(self):
+        with self._cond:
+            return {
+                'size': self.size,
+                'max_overflow': self.max_overflow,
+                'in_use': self.in_use,
+                'idle': len(self._idle),
+                'waits': self.waits,
+                'wait_time': round(self.wait_time, 3),
+                'timeouts': self.timeouts,
+                'created': self.created,
+                'discarded': self.discarded,
+            }
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Пул создаётся при первом обращении, с настройками из app.config"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(
+                    db_config(),
+                    size=app.config['DB_POOL_SIZE'],
+                    max_overflow=app.config['DB_POOL_MAX_OVERFLOW'],
+                    timeout=app.config['DB_POOL_TIMEOUT'],
+                    recycle=app.config['DB_POOL_RECYCLE'],
+                )
+    return _pool
 
 
 def get_db_connection():
-    """Получить соединение с базой данных"""
+    """Получить соединение с базой данных (одно на запрос, возвращается в пул в конце запроса)"""
+    if 'db_conn' not in g:
+        try:
+            g.db_conn = get_pool().acquire()
+        except mysql.connector.Error as err:
+            print(f"Ошибка подключения к БД: {err}")
+            return None
+    return g.db_conn
+
+
+@app.teardown_appcontext
+def release_db_connection(exc):
+    conn = g.pop('db_conn', None)
+    if conn is not None:
+        get_pool().release(conn)
+
+
+# ========== КЭШИ ==========
+app.config.update(
+    DASHBOARD_CACHE_TTL=60,        # секунд; кэш сбрасывается раньше, если изменились данные
+    SHARED_TABLE_VERSIONS=True,    # версии таблиц общие для всех процессов (таблица TableVersion)
+    SHARED_TABLE_VERSIONS_TTL=5,   # секунд между сверками общих версий с БД в одном процессе
+)
+
+# Версии таблиц: каждая запись в таблицу увеличивает её версию, и всё, что
+# было закэшировано по старой версии, перестаёт считаться актуальным.
+# У таблицы две версии: своя версия процесса (сбрасывает его кэш сразу после записи)
+# и общая из таблицы TableVersion — её увеличивает любой рабочий процесс после записи.
+# Процесс сверяет общие версии с БД не чаще раза в SHARED_TABLE_VERSIONS_TTL секунд,
+# поэтому запись из другого процесса становится видна в кэшах не позже чем через этот
+# интервал, а попадания в кэш между сверками обходятся без запросов к БД.
+_table_versions = {}      # таблица -> версия этого процесса
+_shared_versions = {}     # таблица -> версия из TableVersion на момент последней сверки
+_shared_synced_at = None  # time.monotonic() последней сверки
+_table_versions_lock = threading.Lock()
+_table_versions_error = None
+
+
+def report_table_versions_error(err):
+    """Ошибку работы с TableVersion печатаем один раз, а не на каждый запрос"""
+    global _table_versions_error
+    if str(err) != _table_versions_error:
+        _table_versions_error = str(err)
+        print(f'Общие версии таблиц недоступны (выполните init-db): {err}')
+
+
+def touch_tables(*tables):
+    """Отметить, что данные в таблицах изменились (вызывать после commit)"""
+    with _table_versions_lock:
+        for table in tables:
+            _table_versions[table] = _table_versions.get(table, 0) + 1
+
+    if not tables or not app.config['SHARED_TABLE_VERSIONS'] or not has_app_context():
+        return
+    conn = get_db_connection()
+    if not conn:
+        return
+    cursor = conn.cursor()
     try:
-        conn = mysql.connector.connect(**db_config)
-        conn.autocommit = False
-        return conn
+        cursor.execute(f'''
+            INSERT INTO TableVersion (TableName, Version) VALUES {', '.join(['(%s, 1)'] * len(tables))}
+            ON DUPLICATE KEY UPDATE Version = Version + 1
+        ''', tables)
+        conn.commit()
+    except mysql.connector.Error as err:
+        conn.rollback()
+        report_table_versions_error(err)
+    finally:
+        cursor.close()
+
+
+def sync_table_versions():
+    """Прочитать общие версии из TableVersion — не чаще раза в SHARED_TABLE_VERSIONS_TTL секунд"""
+    global _shared_synced_at
+    if not app.config['SHARED_TABLE_VERSIONS'] or not has_app_context():
+        return
+    now = time.monotonic()
+    with _table_versions_lock:
+        if _shared_synced_at is not None and now - _shared_synced_at < app.config['SHARED_TABLE_VERSIONS_TTL']:
+            return
+        # Отмечаем сверку сразу: параллельные запросы не идут в БД за тем же самым,
+        # а при ошибке следующая попытка будет только через интервал
+        _shared_synced_at = now
+    conn = get_db_connection()
+    if not conn:
+        return
+    opened = not conn.in_transaction
+    cursor = conn.cursor()
+    try:
+        cursor.execute('SELECT TableName, Version FROM TableVersion')
+        versions = dict(cursor.fetchall())
     except mysql.connector.Error as err:
-        print(f"Ошибка подключения к БД: {err}")
+        report_table_versions_error(err)
+        return
+    finally:
+        cursor.close()
+        if opened:
+            # Не оставляем открытой транзакцию, начатую этим чтением
+            conn.rollback()
+    with _table_versions_lock:
+        _shared_versions.clear()
+        _shared_versions.update(versions)
+
+
+def table_versions(tables):
+    sync_table_versions()
+    with _table_versions_lock:
+        return tuple((_table_versions.get(table, 0), _shared_versions.get(table, 0)) for table in tables)
+
+
+class TableCache:
+    """
+    Кэш результатов запросов.
+    Запись устаревает, если истёк ttl или изменилась версия любой из таблиц,
+    из которых она построена. При maxsize вытесняются давно не используемые записи.
+    """
+
+    def __init__(self, ttl=None, maxsize=None):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._data = OrderedDict()   # key -> (версии таблиц, срок жизни, значение)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_load(self, key, tables, loader):
+        """Вернуть значение из кэша или вычислить его через loader() и запомнить"""
+        # Версии берём до загрузки: если таблицу изменят во время загрузки,
+        # запись сразу окажется устаревшей
+        versions = table_versions(tables)
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[0] == versions and (entry[1] is None or entry[1] > time.monotonic()):
+                self._data.move_to_end(key)
+                self.hits += 1
+                return entry[2]
+            self.misses += 1
+
+        value = loader()
+        expires = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self._data[key] = (versions, expires, value)
+            self._data.move_to_end(key)
+            if self.maxsize:
+                while len(self._data) > self.maxsize:
+                    self._data.popitem(last=False)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'entries': len(self._data),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / total, 3) if total else 0,
+            }
+
+
+dashboard_cache = TableCache(ttl=app.config['DASHBOARD_CACHE_TTL'])
+DASHBOARD_TABLES = ('Client', 'Object', 'Employee', 'Service', 'Schedule')
+
+
+# ========== СТАТИКА И СЖАТИЕ ОТВЕТОВ ==========
+# CSS и JS лежат в static/ и подключаются через asset_url('css/base.css') — адрес содержит хэш
+# содержимого (/assets/css/base.3f2a9c1b7e.css), поэтому браузер хранит файл без перепроверок,
+# а после изменения файла адрес меняется сам. Сжатые варианты (brotli, gzip) готовятся один раз
+# при первом обращении к файлу и хранятся в памяти; HTML и JSON сжимаются gzip на лету.
+app.config.update(
+    ASSETS_MAX_AGE=365 * 24 * 3600,   # сколько браузер хранит файл с хэшем в адресе, секунд
+    COMPRESS_MIN_SIZE=500,            # ответы меньше стольких байт не сжимаем
+    COMPRESS_LEVEL=6,                 # уровень gzip для HTML и JSON
+)
+
+ASSETS_DIR = os.path.join(app.root_path, 'static')
+ASSET_DIGEST_LENGTH = 10
+ASSET_COMPRESS_TYPES = ('text/css', 'text/javascript', 'application/javascript', 'image/svg+xml')
+COMPRESS_MIMETYPES = ('text/html', 'application/json')
+
+# variants: кодировка ('br', 'gzip', None — без сжатия) -> содержимое
+Asset = namedtuple('Asset', 'digest mtime mimetype variants')
+
+_assets = {}
+_assets_lock = threading.Lock()
+
+
+def load_asset(path, full_path, mtime):
+    """Прочитать файл, посчитать хэш и подготовить сжатые варианты"""
+    with open(full_path, 'rb') as f:
+        data = f.read()
+    mimetype = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+    variants = {None: data}
+    if mimetype in ASSET_COMPRESS_TYPES:
+        if brotli is not None:
+            variants['br'] = brotli.compress(data, quality=11)
+        variants['gzip'] = gzip.compress(data, compresslevel=9, mtime=0)
+        # Сжатый вариант, который не меньше исходного, не нужен
+        for encoding in [encoding for encoding in variants if encoding and len(variants[encoding]) >= len(data)]:
+            del variants[encoding]
+    digest = hashlib.sha256(data).hexdigest()[:ASSET_DIGEST_LENGTH]
+    return Asset(digest, mtime, mimetype, variants)
+
+
+def get_asset(path):
+    """
+    Файл из static/ с хэшем и сжатыми вариантами; None, если файла нет.
+    В режиме отладки изменения файла подхватываются сразу (по времени изменения).
+    """
+    asset = _assets.get(path)
+    if asset is not None and not app.debug:
+        return asset
+    full_path = safe_join(ASSETS_DIR, path)
+    if full_path is None or not os.path.isfile(full_path):
         return None
+    mtime = os.path.getmtime(full_path)
+    if asset is None or asset.mtime != mtime:
+        asset = load_asset(path, full_path, mtime)
+        with _assets_lock:
+            _assets[path] = asset
+    return asset
+
+
+def preload_assets():
+    """Подготовить все файлы из static/ заранее (при старте рабочего процесса)"""
+    for folder, _, names in os.walk(ASSETS_DIR):
+        for name in names:
+            get_asset(os.path.relpath(os.path.join(folder, name), ASSETS_DIR).replace(os.sep, '/'))
+
+
+@app.template_global()
+def asset_url(path):
+    """Адрес файла из static/ с хэшем содержимого в имени"""
+    asset = get_asset(path)
+    if asset is None:
+        return url_for('static', filename=path)
+    root, ext = os.path.splitext(path)
+    return url_for('static_asset', filename=f'{root}.{asset.digest}{ext}')
+
+
+@app.route('/assets/<path:filename>')
+def static_asset(filename):
+    """Файл с хэшем в имени: долгий кэш, brotli или gzip, если браузер их принимает"""
+    root, ext = os.path.splitext(filename)
+    root, _, digest = root.rpartition('.')
+    if not root or len(digest) != ASSET_DIGEST_LENGTH:
+        abort(404)
+    asset = get_asset(root + ext)
+    if asset is None:
+        abort(404)
+
+    encoding = next((encoding for encoding in ('br', 'gzip')
+                     if encoding in asset.variants and request.accept_encodings[encoding]), None)
+    response = Response(asset.variants[encoding], mimetype=asset.mimetype)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    response.set_etag(asset.digest + (f'-{encoding}' if encoding else ''))
+    if digest == asset.digest:
+        response.cache_control.public = True
+        response.cache_control.max_age = app.config['ASSETS_MAX_AGE']
+        response.cache_control.immutable = True
+    else:
+        # Страница открыта до обновления файла: отдаём текущий, но без долгого кэша
+        response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+
+def gzip_stream(response):
+    """Сжимать потоковый ответ по кускам: каждый кусок уходит в браузер сразу, как и без сжатия"""
+    source = response.response
+    chunks = response.iter_encoded()
+    level = app.config['COMPRESS_LEVEL']
+
+    def compressed():
+        compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)   # формат gzip
+        try:
+            for chunk in chunks:
+                data = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+                if data:
+                    yield data
+            yield compressor.flush()
+        finally:
+            # Клиент ушёл, не дочитав: закрываем исходный поток (он возвращает соединение с БД)
+            if hasattr(source, 'close'):
+                source.close()
+
+    return compressed()
+
+
+@app.after_request
+def compress_response(response):
+    """Сжать HTML и JSON, если браузер принимает gzip"""
+    if (response.mimetype not in COMPRESS_MIMETYPES or response.status_code != 200
+            or response.direct_passthrough or 'Content-Encoding' in response.headers):
+        return response
+    response.vary.add('Accept-Encoding')
+    if not request.accept_encodings['gzip']:
+        return response
+    if response.is_streamed:
+        response.response = gzip_stream(response)
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < app.config['COMPRESS_MIN_SIZE']:
+            return response
+        response.set_data(gzip.compress(data, compresslevel=app.config['COMPRESS_LEVEL']))
+    response.headers['Content-Encoding'] = 'gzip'
+    return response
+
+
+# ========== СПРАВОЧНИКИ ==========
+app.config.update(
+    REFERENCE_CACHE_TTL=300,   # секунд; в своём процессе сбрасывается сразу после записи
+    REFERENCE_CACHE_SIZE=64,   # не больше стольких наборов справочных данных в памяти
+)
+
+# Справочники (услуги, активные сотрудники, клиенты, объекты) меняются редко,
+# а читаются на каждой форме — держим их в памяти до записи в соответствующую таблицу
+reference_cache = TableCache(ttl=app.config['REFERENCE_CACHE_TTL'], maxsize=app.config['REFERENCE_CACHE_SIZE'])
+
+
+class ReferenceData:
+    """Строки справочника в исходном порядке и те же строки по ID"""
+
+    __slots__ = ('rows', 'by_id')
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.by_id = {row['ID']: row for row in rows}
+
+
+def load_reference(key, tables, query):
+    """Справочник из кэша; при промахе — один запрос к БД"""
+    def load():
+        conn = get_db_connection()
+        if not conn:
+            raise mysql.connector.Error('Ошибка подключения к базе данных')
+        cursor = conn.cursor(dictionary=True)
+        try:
+            cursor.execute(query)
+            return ReferenceData(cursor.fetchall())
+        finally:
+            cursor.close()
+
+    return reference_cache.get_or_load(key, tables, load)
+
+
+def get_client_choices():
+    return load_reference('clients', ('Client',), 'SELECT ID, FullName FROM Client ORDER BY FullName')
+
+
+def get_object_choices():
+    return load_reference('objects', ('Object', 'Client'), '''
+        SELECT o.ID, o.ObjectName, c.FullName as ClientName
+        FROM Object o JOIN Client c ON o.ClientID = c.ID
+        ORDER BY o.ObjectName
+    ''')
+
+
+def get_services_reference():
+    return load_reference('services', ('Service',),
+                          'SELECT ID, ServiceName, PricePerUnit, Unit, Duration FROM Service ORDER BY ServiceName')
+
+
+def get_active_employees():
+    return load_reference('active_employees', ('Employee',),
+                          'SELECT ID, FullName FROM Employee WHERE Status = "Активен" ORDER BY FullName')
+
+
+# ========== СХЕМА БД (индексы и служебные таблицы) ==========
+# Всё ниже создаётся командой `flask --app app init-db`, если ещё не существует
+
+# Служебные таблицы: (имя, определение столбцов)
+SCHEMA_TABLES = [
+    ('ScheduleSeries', '''
+        ID INT AUTO_INCREMENT PRIMARY KEY,
+        Weekdays VARCHAR(20) NOT NULL,
+        IntervalWeeks INT NOT NULL DEFAULT 1,
+        StartDate DATE NOT NULL,
+        EndDate DATE NULL,
+        OccurrenceCount INT NULL,
+        CreatedAt DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+    '''),
+    # Итоги заказов по дням для отчётов (см. СВОДКИ ПО ЗАКАЗАМ)
+    ('ScheduleRollup', '''
+        EntityType VARCHAR(10) NOT NULL,
+        EntityID INT NOT NULL,
+        Day DATE NOT NULL,
+        OrderCount INT NOT NULL DEFAULT 0,
+        CompletedCount INT NOT NULL DEFAULT 0,
+        CompletedRevenue DECIMAL(14, 2) NOT NULL DEFAULT 0,
+        PRIMARY KEY (EntityType, EntityID, Day)
+    '''),
+    # Общие для всех процессов версии таблиц, по которым сбрасываются кэши (см. КЭШИ)
+    ('TableVersion', '''
+        TableName VARCHAR(64) NOT NULL PRIMARY KEY,
+        Version BIGINT NOT NULL DEFAULT 0
+    '''),
+    # Фоновые выгрузки отчётов (см. ФОНОВЫЕ ЗАДАНИЯ)
+    ('ReportJob', '''
+        ID INT AUTO_INCREMENT PRIMARY KEY,
+        UserID INT NOT NULL,
+        JobType VARCHAR(20) NOT NULL,
+        Format VARCHAR(10) NOT NULL,
+        Params TEXT NOT NULL,
+        Status VARCHAR(20) NOT NULL DEFAULT 'queued',
+        RowsDone INT NOT NULL DEFAULT 0,
+        RowsTotal INT NULL,
+        CancelRequested TINYINT(1) NOT NULL DEFAULT 0,
+        FileName VARCHAR(255) NULL,
+        Error TEXT NULL,
+        CreatedAt DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        StartedAt DATETIME NULL,
+        UpdatedAt DATETIME NULL,
+        FinishedAt DATETIME NULL,
+        ExpiresAt DATETIME NULL,
+        KEY idx_report_job_user (UserID, ID),
+        KEY idx_report_job_status (Status, ExpiresAt)
+    '''),
+]
+
+# Дополнительные столбцы существующих таблиц: (таблица, столбец, определение)
+SCHEMA_COLUMNS = [
+    ('Schedule', 'SeriesID', 'INT NULL'),
+    ('ReportJob', 'UpdatedAt', 'DATETIME NULL'),   # последняя отметка прогресса выполняющегося задания
+]
+
+# (таблица, имя индекса, столбцы)
+SCHEMA_INDEXES = [
+    ('Schedule', 'idx_schedule_status_date', '(Status, ScheduledDate, ScheduledTime)'),
+    ('Schedule', 'idx_schedule_date_time', '(ScheduledDate, ScheduledTime)'),
+    ('Schedule', 'idx_schedule_series', '(SeriesID, ScheduledDate)'),
+    ('Schedule', 'idx_schedule_employee_date', '(EmployeeID, ScheduledDate, ScheduledTime)'),
+    ('Schedule', 'idx_schedule_object_date', '(ObjectID, ScheduledDate)'),
+    ('Employee', 'idx_employee_status', '(Status)'),
+    # итоги за период в отчётах: диапазон по Day внутри одного типа сущности, без чтения строк таблицы
+    ('ScheduleRollup', 'idx_rollup_type_day',
+     '(EntityType, Day, EntityID, OrderCount, CompletedCount, CompletedRevenue)'),
+    # поиск и сортировка в списках (CLIENT_LIST, OBJECT_LIST, EMPLOYEE_LIST, SERVICE_LIST)
+    ('Client', 'idx_client_fullname', '(FullName)'),
+    ('Client', 'idx_client_company', '(CompanyName)'),
+    ('Client', 'idx_client_phone', '(Phone)'),
+    ('Object', 'idx_object_name', '(ObjectName)'),
+    ('Object', 'idx_object_address', '(Address)'),
+    ('Object', 'idx_object_area', '(Area)'),
+    ('Object', 'idx_object_type', '(ObjectType)'),
+    ('Employee', 'idx_employee_fullname', '(FullName)'),
+    ('Employee', 'idx_employee_position', '(Position)'),
+    ('Employee', 'idx_employee_phone', '(Phone)'),
+    ('Service', 'idx_service_name', '(ServiceName)'),
+    ('Service', 'idx_service_price', '(PricePerUnit)'),
+]
+
+
+def ensure_schema(conn):
+    """Создать недостающие таблицы, столбцы и индексы; повторный запуск ничего не меняет"""
+    cursor = conn.cursor(buffered=True)
+    try:
+        for table, definition in SCHEMA_TABLES:
+            cursor.execute(f'CREATE TABLE IF NOT EXISTS {table} ({definition}) DEFAULT CHARSET=utf8mb4')
+
+        for table, column, definition in SCHEMA_COLUMNS:
+            cursor.execute(
+                '''SELECT 1 FROM information_schema.COLUMNS
+                   WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND COLUMN_NAME = %s
+                   LIMIT 1''',
+                (table, column)
+            )
+            if cursor.fetchone():
+                continue
+            cursor.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+            print(f'Добавлен столбец {table}.{column}')
+
+        for table, name, columns in SCHEMA_INDEXES:
+            cursor.execute(
+                '''SELECT 1 FROM information_schema.STATISTICS
+                   WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND INDEX_NAME = %s
+                   LIMIT 1''',
+                (table, name)
+            )
+            if cursor.fetchone():
+                continue
+            cursor.execute(f'CREATE INDEX {name} ON {table} {columns}')
+            print(f'Создан индекс {name} на {table} {columns}')
+        conn.commit()
+    finally:
+        cursor.close()
+
+
+@app.cli.command('init-db')
+def init_db_command():
+    """Создать таблицы, столбцы и индексы, которые нужны приложению"""
+    conn = get_db_connection()
+    if not conn:
+        raise SystemExit('Ошибка подключения к базе данных')
+    ensure_schema(conn)
+    if rollups_missing(conn):
+        print(f'Сводки отчётов построены: {rebuild_rollups(conn)} строк')
+    print('Схема БД в порядке')
+
+
+# ========== СВОДКИ ПО ЗАКАЗАМ (ScheduleRollup) ==========
+# Итоги заказов по дням для каждого клиента, объекта, сотрудника и услуги. Отчёты по сущностям
+# читают их вместо соединения со всей историей Schedule. Каждая запись в Schedule правит сводку
+# в той же транзакции: вклад затронутых заказов вычитается до изменения и добавляется после.
+# Полный пересчёт: `flask --app app rebuild-rollups`.
+
+# (EntityType, ID сущности в заказе, нужный для него JOIN)
+ROLLUP_ENTITIES = (
+    ('client', 'o.ClientID', 'JOIN Object o ON s.ObjectID = o.ID'),
+    ('object', 's.ObjectID', ''),
+    ('employee', 's.EmployeeID', ''),
+    ('service', 's.ServiceID', ''),
+)
+
+
+def rollup_select(where):
+    """SELECT итогов по (сущность, день) для заказов s, подходящих под where; параметры where — на каждую сущность"""
+    return ' UNION ALL '.join(f'''
+        SELECT '{entity}' as Entity, {column} as EntityRef, s.ScheduledDate as OrderDay,
+               COUNT(*) as Orders,
+               COUNT(CASE WHEN s.Status = "Выполнено" THEN 1 END) as Completed,
+               COALESCE(SUM(CASE WHEN s.Status = "Выполнено" THEN s.Cost END), 0) as Revenue
+        FROM Schedule s {join}
+        WHERE ({where}) AND {column} IS NOT NULL
+        GROUP BY {column}, s.ScheduledDate''' for entity, column, join in ROLLUP_ENTITIES)
+
+
+def rollup_delta(conn, where, params, sign):
+    """
+    Прибавить (sign=1) или вычесть (sign=-1) вклад заказов s, подходящих под where, одним
+    INSERT ... SELECT ... ON DUPLICATE KEY UPDATE. Commit делает вызывающий.
+    """
+    cursor = conn.cursor()
+    try:
+        cursor.execute(f'''
+            INSERT INTO ScheduleRollup (EntityType, EntityID, Day, OrderCount, CompletedCount, CompletedRevenue)
+            SELECT Entity, EntityRef, OrderDay, %s * Orders, %s * Completed, %s * Revenue
+            FROM ({rollup_select(where)}) d
+            ON DUPLICATE KEY UPDATE
+                OrderCount = OrderCount + VALUES(OrderCount),
+                CompletedCount = CompletedCount + VALUES(CompletedCount),
+                CompletedRevenue = CompletedRevenue + VALUES(CompletedRevenue)
+        ''', [sign] * 3 + list(params) * len(ROLLUP_ENTITIES))
+    finally:
+        cursor.close()
+
+
+@contextmanager
+def rollup_changes(conn, where, params):
+    """
+    Обёртка вокруг изменения заказов: вычесть их вклад до, прибавить после.
+    where должен выбирать те же строки и после изменения (обычно это список ID).
+    """
+    rollup_delta(conn, where, params, -1)
+    yield
+    rollup_delta(conn, where, params, 1)
+
+
+def locked_schedule_ids(conn, query, params=()):
+    """ID заказов из query (SELECT s.ID ...), заблокированных до конца транзакции"""
+    cursor = conn.cursor()
+    try:
+        cursor.execute(query + ' FOR UPDATE', params)
+        return [row[0] for row in cursor.fetchall()]
+    finally:
+        cursor.close()
+
+
+@contextmanager
+def rollup_changes_for(conn, query, params=()):
+    """
+    rollup_changes для заказов, которые выбирает query до изменения. Нужен, когда само изменение
+    выводит строки из-под условия (отмена меняет статус, по которому заказы отбирались) или удаляет их.
+    """
+    ids = locked_schedule_ids(conn, query, params)
+    if not ids:
+        yield
+        return
+    with rollup_changes(conn, f"s.ID IN ({', '.join(['%s'] * len(ids))})", ids):
+        yield
+
+
+def rebuild_rollups(conn):
+    """Пересчитать ScheduleRollup целиком по Schedule (в одной транзакции). Возвращает число строк сводки."""
+    cursor = conn.cursor()
+    try:
+        cursor.execute('DELETE FROM ScheduleRollup')
+        cursor.execute(f'''
+            INSERT INTO ScheduleRollup (EntityType, EntityID, Day, OrderCount, CompletedCount, CompletedRevenue)
+            SELECT Entity, EntityRef, OrderDay, Orders, Completed, Revenue
+            FROM ({rollup_select('1=1')}) d
+        ''')
+        rows = cursor.rowcount
+        conn.commit()
+    except mysql.connector.Error:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+    touch_tables('Schedule')
+    return rows
+
+
+def rollups_missing(conn):
+    """Сводка пуста, а заказы есть — например, таблицу только что создал init-db"""
+    cursor = conn.cursor()
+    try:
+        cursor.execute('''SELECT EXISTS(SELECT 1 FROM Schedule),
+                                 EXISTS(SELECT 1 FROM ScheduleRollup)''')
+        has_schedules, has_rollups = cursor.fetchone()
+    finally:
+        cursor.close()
+    return bool(has_schedules) and not has_rollups
+
+
+@app.cli.command('rebuild-rollups')
+def rebuild_rollups_command():
+    """Пересчитать сводки отчётов (ScheduleRollup) по всем заказам"""
+    conn = get_db_connection()
+    if not conn:
+        raise SystemExit('Ошибка подключения к базе данных')
+    print(f'Сводки пересчитаны: {rebuild_rollups(conn)} строк')
+
+
+def month_bounds(day=None):
+    """Первый день месяца и первый день следующего — для индексируемого фильтра по дате"""
+    day = day or date.today()
+    start = day.replace(day=1)
+    if start.month == 12:
+        end = start.replace(year=start.year + 1, month=1)
+    else:
+        end = start.replace(month=start.month + 1)
+    return start, end
 
 
 # Декоратор для проверки авторизации
@@ -53,6 +884,139 @@ def login_required(f):
 
 
 # ========== АВТОРИЗАЦИЯ ==========
+app.config.update(
+    PASSWORD_HASH_WORKERS=2,        # одновременных проверок пароля в процессе (хэширование — нагрузка на CPU)
+    PASSWORD_HASH_QUEUE=16,         # проверок в работе и в очереди; сверх этого вход сразу отклоняется
+    PASSWORD_HASH_TIMEOUT=10,       # секунд ждать результата проверки
+    LOGIN_USER_FAILURES=5,          # неудачных входов под одним логином ...
+    LOGIN_USER_WINDOW=300,          # ... за столько секунд, дальше логин временно блокируется
+    LOGIN_IP_FAILURES=30,           # неудачных входов с одного IP ...
+    LOGIN_IP_WINDOW=60,             # ... за столько секунд (успешные входы не считаются: из-за NAT
+                                    # или прокси с одного адреса приходят целые смены)
+    PROXY_FIX_X_FOR=0,              # сколько обратных прокси перед приложением (nginx — 1): адрес клиента
+                                    # берётся из X-Forwarded-For; 0 — заголовку не доверять
+)
+# Ограничители и пул хэширования — в памяти процесса: при нескольких рабочих процессах
+# gunicorn каждый считает свои попытки, то есть пороги действуют на процесс.
+
+
+class RateLimiter:
+    """
+    Скользящее окно событий по ключу (логин, IP) в памяти процесса.
+    Ключей хранится не больше maxsize, давно не встречавшиеся вытесняются.
+    """
+
+    def __init__(self, limit, window, maxsize=10000):
+        self.limit = limit
+        self.window = window
+        self.maxsize = maxsize
+        self._events = OrderedDict()   # key -> deque моментов событий
+        self._lock = threading.Lock()
+        self.rejected = 0
+
+    def _recent(self, key, now):
+        events = self._events.get(key)
+        if events is None:
+            return None
+        while events and events[0] <= now - self.window:
+            events.popleft()
+        return events
+
+    def retry_after(self, key):
+        """Через сколько секунд ключ снова разрешён; 0 — разрешён сейчас"""
+        now = time.monotonic()
+        with self._lock:
+            events = self._recent(key, now)
+            if events is None or len(events) < self.limit:
+                return 0
+            self.rejected += 1
+            return int(events[0] + self.window - now) + 1
+
+    def hit(self, key):
+        now = time.monotonic()
+        with self._lock:
+            events = self._recent(key, now)
+            if events is None:
+                events = self._events[key] = deque()
+            events.append(now)
+            self._events.move_to_end(key)
+            while len(self._events) > self.maxsize:
+                self._events.popitem(last=False)
+
+    def reset(self, key):
+        with self._lock:
+            self._events.pop(key, None)
+
+    def stats(self):
+        with self._lock:
+            return {'keys': len(self._events), 'rejected': self.rejected}
+
+
+login_user_limiter = RateLimiter(app.config['LOGIN_USER_FAILURES'], app.config['LOGIN_USER_WINDOW'])
+login_ip_limiter = RateLimiter(app.config['LOGIN_IP_FAILURES'], app.config['LOGIN_IP_WINDOW'])
+
+# Хэширование паролей — в отдельном ограниченном пуле потоков: при массовом входе одновременно
+# считается не больше PASSWORD_HASH_WORKERS хэшей (hashlib отпускает GIL, остальные запросы
+# процесса продолжают обслуживаться), а сверх PASSWORD_HASH_QUEUE вход отклоняется сразу.
+_password_executor = None
+_password_lock = threading.Lock()
+_password_slots = threading.BoundedSemaphore(app.config['PASSWORD_HASH_QUEUE'])
+
+# Для несуществующего логина проверяем пароль против этого хэша, чтобы по времени ответа
+# нельзя было узнать, есть ли такой пользователь
+_DUMMY_PASSWORD_HASH = generate_password_hash('dummy-password')
+
+
+class PasswordCheckBusy(Exception):
+    pass
+
+
+def get_password_executor():
+    global _password_executor
+    if _password_executor is None:
+        with _password_lock:
+            if _password_executor is None:
+                _password_executor = ThreadPoolExecutor(max_workers=app.config['PASSWORD_HASH_WORKERS'],
+                                                        thread_name_prefix='password')
+    return _password_executor
+
+
+def run_password_task(func, *args):
+    """Выполнить func(*args) в пуле хэширования; PasswordCheckBusy, если очередь полна или ответа нет"""
+    if not _password_slots.acquire(blocking=False):
+        raise PasswordCheckBusy()
+    try:
+        future = get_password_executor().submit(func, *args)
+    except RuntimeError:
+        _password_slots.release()
+        raise PasswordCheckBusy()
+    future.add_done_callback(lambda _: _password_slots.release())
+    try:
+        return future.result(timeout=app.config['PASSWORD_HASH_TIMEOUT'])
+    except FuturesTimeout:
+        raise PasswordCheckBusy()
+
+
+def verify_password(password_hash, password):
+    return run_password_task(check_password_hash, password_hash or _DUMMY_PASSWORD_HASH, password)
+
+
+def hash_password(password):
+    return run_password_task(generate_password_hash, password)
+
+
+def apply_proxy_fix():
+    """За обратным прокси брать адрес и схему клиента из X-Forwarded-* (PROXY_FIX_X_FOR прокси)"""
+    if app.config['PROXY_FIX_X_FOR'] and not isinstance(app.wsgi_app, ProxyFix):
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['PROXY_FIX_X_FOR'],
+                                x_proto=app.config['PROXY_FIX_X_FOR'])
+
+
+def login_throttled(username, ip):
+    """Секунды до следующей разрешённой попытки (0 — можно): по IP и по логину"""
+    return max(login_ip_limiter.retry_after(ip), login_user_limiter.retry_after(username.lower()))
+
+
 @app.route('/')
 def index():
     if 'user_id' in session:
@@ -70,6 +1034,13 @@ def login():
             flash('Заполните все поля', 'error')
             return render_template('login.html')
 
+        # Подбор пароля отсекаем до запроса к БД и хэширования
+        ip = request.remote_addr or ''
+        wait = login_throttled(username, ip)
+        if wait:
+            flash(f'Слишком много попыток входа. Повторите через {wait} сек.', 'error')
+            return render_template('login.html'), 429
+
         conn = get_db_connection()
         if not conn:
             flash('Ошибка подключения к базе данных', 'error')
@@ -77,23 +1048,33 @@ def login():
 
         cursor = conn.cursor(dictionary=True)
         try:
-            cursor.execute('SELECT * FROM User WHERE Username = %s', (username,))
+            cursor.execute('SELECT ID, Username, FullName, Role, Password FROM User WHERE Username = %s', (username,))
             user = cursor.fetchone()
-
-            if user and check_password_hash(user['Password'], password):
-                session['user_id'] = user['ID']
-                session['username'] = user['Username']
-                session['fullname'] = user['FullName']
-                session['role'] = user['Role']
-                flash(f'Добро пожаловать, {user["FullName"]}!', 'success')
-                return redirect(url_for('dashboard'))
-            else:
-                flash('Неверный логин или пароль', 'error')
         except mysql.connector.Error as err:
             flash(f'Ошибка при входе: {err}', 'error')
+            return render_template('login.html')
         finally:
             cursor.close()
-            conn.close()
+        # Соединение больше не нужно — возвращаем его в пул, пока ждём хэширования
+        release_db_connection(None)
+
+        try:
+            valid = verify_password(user['Password'] if user else None, password) and user is not None
+        except PasswordCheckBusy:
+            flash('Сервер занят проверкой входов. Повторите через несколько секунд', 'error')
+            return render_template('login.html'), 503
+
+        if valid:
+            login_user_limiter.reset(username.lower())
+            session['user_id'] = user['ID']
+            session['username'] = user['Username']
+            session['fullname'] = user['FullName']
+            session['role'] = user['Role']
+            flash(f'Добро пожаловать, {user["FullName"]}!', 'success')
+            return redirect(url_for('dashboard'))
+        login_user_limiter.hit(username.lower())
+        login_ip_limiter.hit(ip)
+        flash('Неверный логин или пароль', 'error')
 
     return render_template('login.html')
 
@@ -131,10 +1112,13 @@ def register():
             if cursor.fetchone():
                 flash('Пользователь с таким логином уже существует', 'error')
                 cursor.close()
-                conn.close()
                 return render_template('register.html')
 
-            hashed_password = generate_password_hash(password)
+            try:
+                hashed_password = hash_password(password)
+            except PasswordCheckBusy:
+                flash('Сервер занят, повторите регистрацию через несколько секунд', 'error')
+                return render_template('register.html')
             cursor.execute(
                 '''INSERT INTO User (Username, Password, FullName, Email, Role) 
                    VALUES (%s, %s, %s, %s, %s)''',
@@ -148,7 +1132,6 @@ def register():
             flash(f'Ошибка при регистрации: {err}', 'error')
         finally:
             cursor.close()
-            conn.close()
 
     return render_template('register.html')
 
@@ -160,105 +1143,309 @@ def logout():
     return redirect(url_for('login'))
 
 
+# ========== СТРОКИ ЗАКАЗОВ ==========
+# Страницы с заказами читают строки обычным (не dictionary) курсором в именованные
+# кортежи: только нужные странице столбцы, без словаря на каждую строку.
+# Время форматируется в SQL (TIME_FORMAT), поэтому в Python строки не перебираются.
+# mysql-connector подставляет только %s, так что '%H:%i' экранировать не нужно.
+SCHEDULE_TIME_SQL = "TIME_FORMAT(s.ScheduledTime, '%H:%i') as ScheduledTime"
+
+SCHEDULE_JOINS_SQL = '''
+    FROM Schedule s
+    JOIN Object o ON s.ObjectID = o.ID
+    JOIN Client c ON o.ClientID = c.ID
+    JOIN Service srv ON s.ServiceID = srv.ID
+    LEFT JOIN Employee e ON s.EmployeeID = e.ID
+'''
+
+# Списки: /schedules, ближайшие заказы на главной
+ScheduleListRow = namedtuple('ScheduleListRow', [
+    'ID', 'ScheduledDate', 'ScheduledTime', 'Status', 'Cost', 'SeriesID',
+    'ObjectName', 'ClientName', 'EmployeeName', 'ServiceName',
+])
+SCHEDULE_LIST_SQL = f'''
+    SELECT s.ID, s.ScheduledDate, {SCHEDULE_TIME_SQL}, s.Status, s.Cost, s.SeriesID,
+           o.ObjectName, c.FullName as ClientName, e.FullName as EmployeeName, srv.ServiceName
+    {SCHEDULE_JOINS_SQL}
+'''
+
+# Отчёт по расписанию: плюс адрес объекта и телефон клиента
+ScheduleReportRow = namedtuple('ScheduleReportRow', ScheduleListRow._fields + ('ObjectAddress', 'ClientPhone'))
+SCHEDULE_REPORT_SQL = f'''
+    SELECT s.ID, s.ScheduledDate, {SCHEDULE_TIME_SQL}, s.Status, s.Cost, s.SeriesID,
+           o.ObjectName, c.FullName as ClientName, e.FullName as EmployeeName, srv.ServiceName,
+           o.Address as ObjectAddress, c.Phone as ClientPhone
+    {SCHEDULE_JOINS_SQL}
+'''
+
+# Форма редактирования: все поля заказа и подписи выбранных объекта, услуги и сотрудника
+ScheduleFormRow = namedtuple('ScheduleFormRow', [
+    'ID', 'ObjectID', 'ServiceID', 'EmployeeID', 'ScheduledDate', 'ScheduledTime', 'Duration',
+    'Status', 'Cost', 'Notes', 'SeriesID', 'ObjectLabel', 'ServiceName', 'EmployeeName',
+])
+SCHEDULE_FORM_SQL = f'''
+    SELECT s.ID, s.ObjectID, s.ServiceID, s.EmployeeID, s.ScheduledDate, {SCHEDULE_TIME_SQL},
+           s.Duration, s.Status, s.Cost, s.Notes, s.SeriesID,
+           CONCAT(o.ObjectName, ' (', c.FullName, ')') as ObjectLabel,
+           srv.ServiceName, e.FullName as EmployeeName
+    {SCHEDULE_JOINS_SQL}
+'''
+
+
+def fetch_rows(cursor, row_type):
+    '''Все строки результата обычного курсора как row_type'''
+    return [row_type._make(row) for row in cursor.fetchall()]
+
+
+def fetch_row(cursor, row_type):
+    row = cursor.fetchone()
+    return row_type._make(row) if row else None
+
+
 # ========== DASHBOARD ==========
+def load_dashboard_stats(conn):
+    """Счётчики и ближайшие заказы для главной страницы"""
+    cursor = conn.cursor(dictionary=True)
+    stats = {}
+    try:
+        # Все счётчики одним запросом. Заказы считаются за один проход по индексу
+        # (Status, ScheduledDate): все запланированные + выполненные за текущий месяц.
+        month_start, month_end = month_bounds()
+        cursor.execute('''
+            SELECT
+                (SELECT COUNT(*) FROM Client) as clients_count,
+                (SELECT COUNT(*) FROM Object) as objects_count,
+                (SELECT COUNT(*) FROM Employee WHERE Status = "Активен") as employees_count,
+                (SELECT COUNT(*) FROM Service) as services_count,
+                sch.scheduled_count, sch.completed_month, sch.revenue_month
+            FROM (
+                SELECT COUNT(CASE WHEN Status = "Запланировано" THEN 1 END) as scheduled_count,
+                       COUNT(CASE WHEN Status = "Выполнено" THEN 1 END) as completed_month,
+                       SUM(CASE WHEN Status = "Выполнено" THEN Cost END) as revenue_month
+                FROM Schedule
+                WHERE Status = "Запланировано"
+                   OR (Status = "Выполнено" AND ScheduledDate >= %s AND ScheduledDate < %s)
+            ) sch
+        ''', (month_start, month_end))
+        for key, value in cursor.fetchone().items():
+            stats[key] = value or 0
+    finally:
+        cursor.close()
+
+    cursor = conn.cursor()
+    try:
+        cursor.execute(SCHEDULE_LIST_SQL + '''
+            WHERE s.Status = "Запланировано" AND s.ScheduledDate >= CURDATE()
+            ORDER BY s.ScheduledDate, s.ScheduledTime
+            LIMIT 5
+        ''')
+        stats['upcoming_schedules'] = fetch_rows(cursor, ScheduleListRow)
+    finally:
+        cursor.close()
+    return stats
+
+
 @app.route('/dashboard')
 @login_required
 def dashboard():
-    conn = get_db_connection()
-    if not conn:
-        flash('Ошибка подключения к базе данных', 'error')
-        return render_template('dashboard.html', stats={})
+    def load():
+        # Соединение нужно только при промахе кэша
+        conn = get_db_connection()
+        if not conn:
+            raise mysql.connector.Error('Ошибка подключения к базе данных')
+        return load_dashboard_stats(conn)
 
-    cursor = conn.cursor(dictionary=True)
-    stats = {}
     try:
-        cursor.execute('SELECT COUNT(*) as total FROM Client')
-        stats['clients_count'] = cursor.fetchone()['total'] or 0
+        stats = dashboard_cache.get_or_load(date.today(), DASHBOARD_TABLES, load)
+    except mysql.connector.Error as err:
+        flash(f'Ошибка при получении статистики: {err}', 'error')
+        stats = {}
 
-        cursor.execute('SELECT COUNT(*) as total FROM Object')
-        stats['objects_count'] = cursor.fetchone()['total'] or 0
+    return render_template('dashboard.html', stats=stats)
 
-        cursor.execute('SELECT COUNT(*) as total FROM Employee WHERE Status = "Активен"')
-        stats['employees_count'] = cursor.fetchone()['total'] or 0
 
-        cursor.execute('SELECT COUNT(*) as total FROM Service')
-        stats['services_count'] = cursor.fetchone()['total'] or 0
+# ========== СПИСКИ: поиск, сортировка, страницы ==========
+app.config.update(
+    LIST_PAGE_SIZE=50,         # строк на странице списков клиентов, объектов, сотрудников, услуг
+)
 
-        cursor.execute('SELECT COUNT(*) as total FROM Schedule WHERE Status = "Запланировано"')
-        stats['scheduled_count'] = cursor.fetchone()['total'] or 0
+# Для каждого списка: столбцы для поиска по началу строки и допустимые сортировки.
+# На все эти столбцы есть индексы (SCHEMA_INDEXES), поэтому и фильтр, и ORDER BY ... LIMIT
+# читают только нужную страницу.
+CLIENT_LIST = {
+    'search': ['c.FullName', 'c.CompanyName', 'c.Phone'],
+    'sort': {'name': 'c.FullName', 'company': 'c.CompanyName', 'id': 'c.ID'},
+    'default_sort': 'name',
+    'id_column': 'c.ID',
+}
+OBJECT_LIST = {
+    'search': ['o.ObjectName', 'o.Address'],
+    'sort': {'name': 'o.ObjectName', 'address': 'o.Address', 'area': 'o.Area', 'type': 'o.ObjectType', 'id': 'o.ID'},
+    'default_sort': 'name',
+    'id_column': 'o.ID',
+}
+EMPLOYEE_LIST = {
+    'search': ['e.FullName', 'e.Position', 'e.Phone'],
+    'sort': {'name': 'e.FullName', 'position': 'e.Position', 'status': 'e.Status', 'id': 'e.ID'},
+    'default_sort': 'name',
+    'id_column': 'e.ID',
+}
+SERVICE_LIST = {
+    'search': ['s.ServiceName'],
+    'sort': {'name': 's.ServiceName', 'price': 's.PricePerUnit', 'id': 's.ID'},
+    'default_sort': 'name',
+    'id_column': 's.ID',
+}
 
-        cursor.execute('''SELECT COUNT(*) as total FROM Schedule 
-                          WHERE Status = "Выполнено" 
-                          AND MONTH(ScheduledDate) = MONTH(CURDATE())
-                          AND YEAR(ScheduledDate) = YEAR(CURDATE())''')
-        stats['completed_month'] = cursor.fetchone()['total'] or 0
 
-        cursor.execute('''SELECT SUM(Cost) as total FROM Schedule 
-                          WHERE Status = "Выполнено" 
-                          AND MONTH(ScheduledDate) = MONTH(CURDATE())
-                          AND YEAR(ScheduledDate) = YEAR(CURDATE())''')
-        stats['revenue_month'] = cursor.fetchone()['total'] or 0
+def like_prefix(text):
+    """Шаблон LIKE "начинается с text" (спецсимволы LIKE экранируются)"""
+    return text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
 
-        cursor.execute('''
-            SELECT s.*, o.ObjectName, c.FullName as ClientName, e.FullName as EmployeeName, srv.ServiceName
-            FROM Schedule s
-            JOIN Object o ON s.ObjectID = o.ID
-            JOIN Client c ON o.ClientID = c.ID
-            JOIN Service srv ON s.ServiceID = srv.ID
-            LEFT JOIN Employee e ON s.EmployeeID = e.ID
-            WHERE s.Status = "Запланировано" AND s.ScheduledDate >= CURDATE()
-            ORDER BY s.ScheduledDate, s.ScheduledTime
-            LIMIT 5
-        ''')
-        upcoming_schedules = cursor.fetchall()
-        
-        # Конвертируем timedelta в строку времени для каждого расписания
-        for schedule in upcoming_schedules:
-            if schedule.get('ScheduledTime') and isinstance(schedule['ScheduledTime'], timedelta):
-                # Конвертируем timedelta в строку формата HH:MM
-                total_seconds = int(schedule['ScheduledTime'].total_seconds())
-                hours = total_seconds // 3600
-                minutes = (total_seconds % 3600) // 60
-                schedule['ScheduledTime'] = f"{hours:02d}:{minutes:02d}"
-        
-        stats['upcoming_schedules'] = upcoming_schedules
 
-    except mysql.connector.Error as err:
-        flash(f'Ошибка при получении статистики: {err}', 'error')
-    finally:
+def list_query_args(spec, args=None):
+    """Параметры списка из строки запроса (или словаря args): q (поиск), sort, dir, page"""
+    args = request.args if args is None else args
+    sort = args.get('sort', '')
+    try:
+        page = max(int(args.get('page', 1)), 1)
+    except ValueError:
+        page = 1
+    sort = sort if sort in spec['sort'] else spec['default_sort']
+    direction = args.get('dir')
+    if direction not in ('asc', 'desc'):
+        direction = spec.get('default_dir', {}).get(sort, 'asc')
+    return {
+        'q': args.get('q', '').strip(),
+        'sort': sort,
+        'dir': direction,
+        'page': page,
+        'has_next': False,
+    }
+
+
+def build_list_query(query, spec, list_args, where=None, params=None, paged=True):
+    """Дописать к SELECT фильтр, сортировку и LIMIT/OFFSET текущей страницы (paged=False — все строки)"""
+    conditions = [where] if where else []
+    params = list(params or [])
+    if list_args['q']:
+        conditions.append('(' + ' OR '.join(f'{column} LIKE %s' for column in spec['search']) + ')')
+        params += [like_prefix(list_args['q'])] * len(spec['search'])
+    if conditions:
+        query += ' WHERE ' + ' AND '.join(conditions)
+
+    direction = list_args['dir'].upper()
+    query += f" ORDER BY {spec['sort'][list_args['sort']]} {direction}, {spec['id_column']} {direction}"
+    if not paged:
+        return query, params
+
+    page_size = app.config['LIST_PAGE_SIZE']
+    query += ' LIMIT %s OFFSET %s'
+    params += [page_size + 1, (list_args['page'] - 1) * page_size]  # +1 строка: есть ли следующая страница
+    return query, params
+
+
+def page_rows(rows, list_args):
+    """Отрезать лишнюю строку и отметить в list_args, есть ли следующая страница"""
+    page_size = app.config['LIST_PAGE_SIZE']
+    list_args['has_next'] = len(rows) > page_size
+    return rows[:page_size]
+
+
+# ========== ПОТОКОВАЯ ОТДАЧА БОЛЬШИХ СТРАНИЦ ==========
+app.config.update(
+    STREAM_FETCH_ROWS=500,         # сколько строк читать из БД за раз
+    STREAM_FLUSH_BYTES=16 * 1024,  # отправлять HTML кусками примерно такого размера
+)
+
+
+def stream_rows(conn, query, params=(), row_type=None):
+    """
+    Выполнить запрос на небуферизованном курсоре и вернуть генератор строк
+    (row_type — именованный кортеж для строк, иначе словари).
+    В памяти одновременно не больше STREAM_FETCH_ROWS строк. Запрос выполняется
+    сразу, чтобы ошибку можно было показать обычным flash, а не посреди страницы.
+    Пока генератор не дочитан, другие запросы на этом соединении выполнять нельзя.
+    """
+    cursor = conn.cursor(dictionary=row_type is None, buffered=False)
+    try:
+        cursor.execute(query, params)
+    except mysql.connector.Error:
         cursor.close()
-        conn.close()
+        raise
 
-    return render_template('dashboard.html', stats=stats)
+    def rows():
+        try:
+            while True:
+                batch = cursor.fetchmany(app.config['STREAM_FETCH_ROWS'])
+                if not batch:
+                    break
+                if row_type:
+                    yield from map(row_type._make, batch)
+                else:
+                    yield from batch
+        finally:
+            try:
+                cursor.close()
+            except mysql.connector.Error:
+                # Клиент ушёл, не дочитав страницу: соединение с недочитанным
+                # результатом пул закроет при возврате
+                pass
+
+    return rows()
+
+
+def stream_page(template_name, **context):
+    """
+    Отдать страницу потоком (stream_template): шапка уходит в браузер сразу,
+    строки таблицы — по мере чтения из БД, кусками по STREAM_FLUSH_BYTES.
+    """
+    # Сообщения flash забираем из сессии до отправки заголовков:
+    # после начала потока изменённую сессию уже не сохранить
+    get_flashed_messages(with_categories=True)
+    flush_bytes = app.config['STREAM_FLUSH_BYTES']
+    pieces = stream_template(template_name, **context)
+
+    def chunks():
+        buffer, size = [], 0
+        for piece in pieces:
+            buffer.append(piece)
+            size += len(piece)
+            if size >= flush_bytes:
+                yield ''.join(buffer)
+                buffer, size = [], 0
+        if buffer:
+            yield ''.join(buffer)
+
+    return Response(chunks(), mimetype='text/html')
 
 
 # ========== CLIENTS ==========
 @app.route('/clients')
 @login_required
 def clients():
+    list_args = list_query_args(CLIENT_LIST)
     conn = get_db_connection()
     if not conn:
         flash('Ошибка подключения к базе данных', 'error')
-        return render_template('clients.html', clients=[])
+        return render_template('clients.html', clients=[], list_args=list_args)
 
     cursor = conn.cursor(dictionary=True)
     try:
-        cursor.execute('''
-            SELECT c.*, COUNT(o.ID) as objects_count
+        # Количество объектов считается подзапросом только для клиентов текущей страницы
+        query, params = build_list_query('''
+            SELECT c.*, (SELECT COUNT(*) FROM Object o WHERE o.ClientID = c.ID) as objects_count
             FROM Client c
-            LEFT JOIN Object o ON c.ID = o.ClientID
-            GROUP BY c.ID
-            ORDER BY c.FullName
-        ''')
-        clients = cursor.fetchall()
+        ''', CLIENT_LIST, list_args)
+        cursor.execute(query, params)
+        clients = page_rows(cursor.fetchall(), list_args)
     except mysql.connector.Error as err:
         flash(f'Ошибка при получении данных: {err}', 'error')
         clients = []
     finally:
         cursor.close()
-        conn.close()
 
-    return render_template('clients.html', clients=clients)
+    return render_template('clients.html', clients=clients, list_args=list_args)
 
 
 @app.route('/add_client', methods=['GET', 'POST'])
@@ -291,6 +1478,7 @@ def add_client():
                 )
             )
             conn.commit()
+            touch_tables('Client')
             flash('Клиент успешно добавлен', 'success')
             return redirect(url_for('clients'))
         except mysql.connector.Error as err:
@@ -298,7 +1486,6 @@ def add_client():
             flash(f'Ошибка при добавлении клиента: {err}', 'error')
         finally:
             cursor.close()
-            conn.close()
 
     return render_template('add_client.html')
 
@@ -334,6 +1521,7 @@ def edit_client(id):
                 )
             )
             conn.commit()
+            touch_tables('Client')
             flash('Клиент успешно обновлен', 'success')
             return redirect(url_for('clients'))
         except mysql.connector.Error as err:
@@ -341,13 +1529,11 @@ def edit_client(id):
             flash(f'Ошибка при обновлении клиента: {err}', 'error')
         finally:
             cursor.close()
-            conn.close()
 
     cursor = conn.cursor(dictionary=True)
     cursor.execute('SELECT * FROM Client WHERE ID = %s', (id,))
     client = cursor.fetchone()
     cursor.close()
-    conn.close()
 
     if not client:
         flash('Клиент не найден', 'error')
@@ -366,15 +1552,17 @@ def delete_client(id):
 
     cursor = conn.cursor()
     try:
-        cursor.execute('DELETE FROM Client WHERE ID = %s', (id,))
+        # Заказы удаляются каскадом или теряют ссылку — их вклад в сводки пересчитывается
+        with rollup_changes_for(conn, 'SELECT s.ID FROM Schedule s JOIN Object o ON s.ObjectID = o.ID WHERE o.ClientID = %s', (id,)):
+            cursor.execute('DELETE FROM Client WHERE ID = %s', (id,))
         conn.commit()
+        touch_tables('Client', 'Object', 'Schedule')  # с учётом каскадного удаления
         flash('Клиент успешно удален', 'success')
     except mysql.connector.Error as err:
         conn.rollback()
         flash(f'Ошибка при удалении клиента: {err}', 'error')
     finally:
         cursor.close()
-        conn.close()
 
     return redirect(url_for('clients'))
 
@@ -383,28 +1571,28 @@ def delete_client(id):
 @app.route('/objects')
 @login_required
 def objects():
+    list_args = list_query_args(OBJECT_LIST)
     conn = get_db_connection()
     if not conn:
         flash('Ошибка подключения к базе данных', 'error')
-        return render_template('objects.html', objects=[])
+        return render_template('objects.html', objects=[], list_args=list_args)
 
     cursor = conn.cursor(dictionary=True)
     try:
-        cursor.execute('''
+        query, params = build_list_query('''
             SELECT o.*, c.FullName as ClientName
             FROM Object o
             JOIN Client c ON o.ClientID = c.ID
-            ORDER BY o.ObjectName
-        ''')
-        objects = cursor.fetchall()
+        ''', OBJECT_LIST, list_args)
+        cursor.execute(query, params)
+        objects = page_rows(cursor.fetchall(), list_args)
     except mysql.connector.Error as err:
         flash(f'Ошибка при получении данных: {err}', 'error')
         objects = []
     finally:
         cursor.close()
-        conn.close()
 
-    return render_template('objects.html', objects=objects)
+    return render_template('objects.html', objects=objects, list_args=list_args)
 
 
 @app.route('/add_object', methods=['GET', 'POST'])
@@ -441,6 +1629,7 @@ def add_object():
                 )
             )
             conn.commit()
+            touch_tables('Object')
             flash('Объект успешно добавлен', 'success')
             return redirect(url_for('objects'))
         except mysql.connector.Error as err:
@@ -451,17 +1640,12 @@ def add_object():
             flash('Ошибка в данных. Проверьте правильность ввода', 'error')
         finally:
             cursor.close()
-            conn.close()
-
-    conn = get_db_connection()
-    if not conn:
-        return render_template('add_object.html', clients=[])
 
-    cursor = conn.cursor(dictionary=True)
-    cursor.execute('SELECT ID, FullName FROM Client ORDER BY FullName')
-    clients = cursor.fetchall()
-    cursor.close()
-    conn.close()
+    try:
+        clients = get_client_choices().rows
+    except mysql.connector.Error as err:
+        flash(f'Ошибка при получении списка клиентов: {err}', 'error')
+        clients = []
 
     return render_template('add_object.html', clients=clients)
 
@@ -486,21 +1670,26 @@ def edit_object(id):
         cursor = conn.cursor()
         try:
             area = request.form.get('area', '').strip()
-            cursor.execute(
-                '''UPDATE Object SET ClientID=%s, ObjectName=%s, Address=%s, Area=%s, 
-                   ObjectType=%s, AccessInfo=%s, Notes=%s WHERE ID=%s''',
-                (
-                    int(client_id),
-                    object_name,
-                    address,
-                    float(area) if area else None,
-                    request.form.get('object_type', 'Офис'),
-                    request.form.get('access_info', '').strip() or None,
-                    request.form.get('notes', '').strip() or None,
-                    id
+            # Смена клиента переносит заказы объекта в сводку другого клиента
+            moved = '''SELECT s.ID FROM Schedule s JOIN Object o ON s.ObjectID = o.ID
+                       WHERE o.ID = %s AND o.ClientID != %s'''
+            with rollup_changes_for(conn, moved, (id, int(client_id))):
+                cursor.execute(
+                    '''UPDATE Object SET ClientID=%s, ObjectName=%s, Address=%s, Area=%s, 
+                       ObjectType=%s, AccessInfo=%s, Notes=%s WHERE ID=%s''',
+                    (
+                        int(client_id),
+                        object_name,
+                        address,
+                        float(area) if area else None,
+                        request.form.get('object_type', 'Офис'),
+                        request.form.get('access_info', '').strip() or None,
+                        request.form.get('notes', '').strip() or None,
+                        id
+                    )
                 )
-            )
             conn.commit()
+            touch_tables('Object')
             flash('Объект успешно обновлен', 'success')
             return redirect(url_for('objects'))
         except mysql.connector.Error as err:
@@ -511,7 +1700,6 @@ def edit_object(id):
             flash('Ошибка в данных', 'error')
         finally:
             cursor.close()
-            conn.close()
 
     cursor = conn.cursor(dictionary=True)
     cursor.execute('SELECT * FROM Object WHERE ID = %s', (id,))
@@ -519,14 +1707,16 @@ def edit_object(id):
 
     if not obj:
         cursor.close()
-        conn.close()
         flash('Объект не найден', 'error')
         return redirect(url_for('objects'))
 
-    cursor.execute('SELECT ID, FullName FROM Client ORDER BY FullName')
-    clients = cursor.fetchall()
     cursor.close()
-    conn.close()
+
+    try:
+        clients = get_client_choices().rows
+    except mysql.connector.Error as err:
+        flash(f'Ошибка при получении списка клиентов: {err}', 'error')
+        clients = []
 
     return render_template('edit_object.html', object=obj, clients=clients)
 
@@ -541,15 +1731,17 @@ def delete_object(id):
 
     cursor = conn.cursor()
     try:
-        cursor.execute('DELETE FROM Object WHERE ID = %s', (id,))
+        # Заказы удаляются каскадом или теряют ссылку — их вклад в сводки пересчитывается
+        with rollup_changes_for(conn, 'SELECT s.ID FROM Schedule s WHERE s.ObjectID = %s', (id,)):
+            cursor.execute('DELETE FROM Object WHERE ID = %s', (id,))
         conn.commit()
+        touch_tables('Object', 'Schedule')  # с учётом каскадного удаления
         flash('Объект успешно удален', 'success')
     except mysql.connector.Error as err:
         conn.rollback()
         flash(f'Ошибка при удалении объекта: {err}', 'error')
     finally:
         cursor.close()
-        conn.close()
 
     return redirect(url_for('objects'))
 
@@ -558,23 +1750,24 @@ def delete_object(id):
 @app.route('/employees')
 @login_required
 def employees():
+    list_args = list_query_args(EMPLOYEE_LIST)
     conn = get_db_connection()
     if not conn:
         flash('Ошибка подключения к базе данных', 'error')
-        return render_template('employees.html', employees=[])
+        return render_template('employees.html', employees=[], list_args=list_args)
 
     cursor = conn.cursor(dictionary=True)
     try:
-        cursor.execute('SELECT * FROM Employee ORDER BY FullName')
-        employees = cursor.fetchall()
+        query, params = build_list_query('SELECT e.* FROM Employee e', EMPLOYEE_LIST, list_args)
+        cursor.execute(query, params)
+        employees = page_rows(cursor.fetchall(), list_args)
     except mysql.connector.Error as err:
         flash(f'Ошибка при получении данных: {err}', 'error')
         employees = []
     finally:
         cursor.close()
-        conn.close()
 
-    return render_template('employees.html', employees=employees)
+    return render_template('employees.html', employees=employees, list_args=list_args)
 
 
 @app.route('/add_employee', methods=['GET', 'POST'])
@@ -613,6 +1806,7 @@ def add_employee():
                 )
             )
             conn.commit()
+            touch_tables('Employee')
             flash('Сотрудник успешно добавлен', 'success')
             return redirect(url_for('employees'))
         except mysql.connector.Error as err:
@@ -623,7 +1817,6 @@ def add_employee():
             flash('Ошибка в данных', 'error')
         finally:
             cursor.close()
-            conn.close()
 
     return render_template('add_employee.html')
 
@@ -665,6 +1858,7 @@ def edit_employee(id):
                 )
             )
             conn.commit()
+            touch_tables('Employee')
             flash('Сотрудник успешно обновлен', 'success')
             return redirect(url_for('employees'))
         except mysql.connector.Error as err:
@@ -675,13 +1869,11 @@ def edit_employee(id):
             flash('Ошибка в данных', 'error')
         finally:
             cursor.close()
-            conn.close()
 
     cursor = conn.cursor(dictionary=True)
     cursor.execute('SELECT * FROM Employee WHERE ID = %s', (id,))
     employee = cursor.fetchone()
     cursor.close()
-    conn.close()
 
     if not employee:
         flash('Сотрудник не найден', 'error')
@@ -700,15 +1892,17 @@ def delete_employee(id):
 
     cursor = conn.cursor()
     try:
-        cursor.execute('DELETE FROM Employee WHERE ID = %s', (id,))
+        # Заказы удаляются каскадом или теряют ссылку — их вклад в сводки пересчитывается
+        with rollup_changes_for(conn, 'SELECT s.ID FROM Schedule s WHERE s.EmployeeID = %s', (id,)):
+            cursor.execute('DELETE FROM Employee WHERE ID = %s', (id,))
         conn.commit()
+        touch_tables('Employee', 'Schedule')  # с учётом каскадного удаления
         flash('Сотрудник успешно удален', 'success')
     except mysql.connector.Error as err:
         conn.rollback()
         flash(f'Ошибка при удалении сотрудника: {err}', 'error')
     finally:
         cursor.close()
-        conn.close()
 
     return redirect(url_for('employees'))
 
@@ -717,23 +1911,24 @@ def delete_employee(id):
 @app.route('/services')
 @login_required
 def services():
+    list_args = list_query_args(SERVICE_LIST)
     conn = get_db_connection()
     if not conn:
         flash('Ошибка подключения к базе данных', 'error')
-        return render_template('services.html', services=[])
+        return render_template('services.html', services=[], list_args=list_args)
 
     cursor = conn.cursor(dictionary=True)
     try:
-        cursor.execute('SELECT * FROM Service ORDER BY ServiceName')
-        services = cursor.fetchall()
+        query, params = build_list_query('SELECT s.* FROM Service s', SERVICE_LIST, list_args)
+        cursor.execute(query, params)
+        services = page_rows(cursor.fetchall(), list_args)
     except mysql.connector.Error as err:
         flash(f'Ошибка при получении услуг: {err}', 'error')
         services = []
     finally:
         cursor.close()
-        conn.close()
 
-    return render_template('services.html', services=services)
+    return render_template('services.html', services=services, list_args=list_args)
 
 
 @app.route('/add_service', methods=['GET', 'POST'])
@@ -772,6 +1967,7 @@ def add_service():
                 )
             )
             conn.commit()
+            touch_tables('Service')
             flash('Услуга добавлена', 'success')
             return redirect(url_for('services'))
         except mysql.connector.Error as err:
@@ -782,7 +1978,6 @@ def add_service():
             flash('Неправильный формат чисел', 'error')
         finally:
             cursor.close()
-            conn.close()
 
     return render_template('add_service.html')
 
@@ -823,7 +2018,11 @@ def edit_service(id):
                 )
             )
             conn.commit()
+            touch_tables('Service')
             flash('Услуга обновлена', 'success')
+            if request.form.get('reprice'):
+                # Показываем, как изменятся запланированные заказы этой услуги
+                return redirect(url_for('reprice_schedules', service_id=id))
             return redirect(url_for('services'))
         except mysql.connector.Error as err:
             conn.rollback()
@@ -833,13 +2032,11 @@ def edit_service(id):
             flash('Неправильный формат чисел', 'error')
         finally:
             cursor.close()
-            conn.close()
 
     cursor = conn.cursor(dictionary=True)
     cursor.execute('SELECT * FROM Service WHERE ID = %s', (id,))
     service = cursor.fetchone()
     cursor.close()
-    conn.close()
 
     if not service:
         flash('Услуга не найдена', 'error')
@@ -858,99 +2055,451 @@ def delete_service(id):
 
     cursor = conn.cursor()
     try:
-        cursor.execute('DELETE FROM Service WHERE ID = %s', (id,))
+        # Заказы удаляются каскадом или теряют ссылку — их вклад в сводки пересчитывается
+        with rollup_changes_for(conn, 'SELECT s.ID FROM Schedule s WHERE s.ServiceID = %s', (id,)):
+            cursor.execute('DELETE FROM Service WHERE ID = %s', (id,))
         conn.commit()
+        touch_tables('Service', 'Schedule')  # с учётом каскадного удаления
         flash('Услуга удалена', 'success')
     except mysql.connector.Error as err:
         conn.rollback()
         flash(f'Ошибка при удалении услуги: {err}', 'error')
     finally:
         cursor.close()
-        conn.close()
 
     return redirect(url_for('services'))
 
 
-# ========== SCHEDULES (Расписания / Заказы) ==========
-def calculate_cost_if_empty(conn, object_id, service_id, provided_cost):
+# ========== ПОИСК ДЛЯ ФОРМ (автодополнение) ==========
+app.config.update(
+    SEARCH_RESULTS_LIMIT=10,
+)
+
+
+def normalize_search_text(text):
+    return (text or '').lower().replace('ё', 'е').strip()
+
+
+class PrefixIndex:
     """
-    Логика расчёта стоимости:
-    - Если provided_cost (передан пользователем), вернуть его.
-    - Иначе:
-        * если Service.Unit == 'кв.м' и у объекта есть Area -> PricePerUnit * Area
-        * иначе -> PricePerUnit (как базовая стоимость)
-    Возвращает Decimal (float) или None.
+    Поиск по началу строки или любого слова в ней.
+    Ключи хранятся отсортированными, поиск — bisect до первого подходящего ключа
+    и чтение подряд, пока ключи начинаются с запроса.
     """
-    if provided_cost:
-        try:
-            return float(provided_cost)
-        except Exception:
+
+    def __init__(self, items):
+        # items: (ID, подпись, текст для поиска)
+        entries = []
+        for item_id, label, text in items:
+            text = normalize_search_text(text)
+            for key in {text, *text.split()}:
+                entries.append((key, item_id, label))
+        entries.sort()
+        self._keys = [entry[0] for entry in entries]
+        self._entries = entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def search(self, prefix, limit):
+        prefix = normalize_search_text(prefix)
+        found = []
+        seen = set()
+        i = bisect_left(self._keys, prefix)
+        while i < len(self._keys) and self._keys[i].startswith(prefix) and len(found) < limit:
+            key, item_id, label = self._entries[i]
+            if item_id not in seen:
+                seen.add(item_id)
+                found.append({'id': item_id, 'label': label})
+            i += 1
+        return found
+
+
+# Для каждого справочника: откуда брать строки и как из строки получить (ID, подпись, текст для поиска)
+SEARCH_SOURCES = {
+    'objects': (
+        get_object_choices, ('Object', 'Client'),
+        lambda row: (row['ID'], f"{row['ObjectName']} ({row['ClientName']})", f"{row['ObjectName']} {row['ClientName']}"),
+    ),
+    'services': (
+        get_services_reference, ('Service',),
+        lambda row: (row['ID'], row['ServiceName'], row['ServiceName']),
+    ),
+    'employees': (
+        get_active_employees, ('Employee',),
+        lambda row: (row['ID'], row['FullName'], row['FullName']),
+    ),
+}
+
+
+def get_search_index(kind):
+    """Индекс справочника; перестраивается при первом поиске после записи в его таблицы"""
+    source, tables, to_item = SEARCH_SOURCES[kind]
+    return reference_cache.get_or_load(
+        ('search', kind), tables,
+        lambda: PrefixIndex(to_item(row) for row in source().rows)
+    )
+
+
+@app.route('/api/search/<kind>')
+@login_required
+def search_api(kind):
+    """Подсказки для полей выбора объекта, услуги, сотрудника: ?q=начало&limit=10"""
+    if kind not in SEARCH_SOURCES:
+        return jsonify(error='Неизвестный справочник'), 404
+    try:
+        limit = min(max(int(request.args.get('limit', app.config['SEARCH_RESULTS_LIMIT'])), 1), 50)
+    except ValueError:
+        limit = app.config['SEARCH_RESULTS_LIMIT']
+    try:
+        index = get_search_index(kind)
+    except mysql.connector.Error as err:
+        return jsonify(error=str(err)), 503
+    return jsonify(index.search(request.args.get('q', ''), limit))
+
+
+# ========== SCHEDULES (Расписания / Заказы) ==========
+def calculate_cost_if_empty(conn, object_id, service_id, provided_cost):
+    """
+    Логика расчёта стоимости:
+    - Если provided_cost (передан пользователем), вернуть его.
+    - Иначе:
+        * если Service.Unit == 'кв.м' и у объекта есть Area -> PricePerUnit * Area
+        * иначе -> PricePerUnit (как базовая стоимость)
+    Возвращает Decimal (float) или None.
+    """
+    if provided_cost:
+        try:
+            return float(provided_cost)
+        except Exception:
             return None
 
+    # Цена и единица услуги — из справочника в памяти, в БД идём только за площадью
+    srv = get_services_reference().by_id.get(service_id)
+    if not srv or srv['PricePerUnit'] is None:
+        return None
+    price = float(srv['PricePerUnit'])
+    unit = srv.get('Unit') or ''
+
+    if unit != 'кв.м':
+        # Для других единиц нам достаточно базовой цены
+        return round(price, 2)
+
     cursor = conn.cursor(dictionary=True)
     try:
-        cursor.execute('SELECT PricePerUnit, Unit FROM Service WHERE ID = %s', (service_id,))
-        srv = cursor.fetchone()
-        if not srv or srv['PricePerUnit'] is None:
-            return None
-        price = float(srv['PricePerUnit'])
-        unit = srv.get('Unit') or ''
-
-        if unit == 'кв.м':
-            cursor.execute('SELECT Area FROM Object WHERE ID = %s', (object_id,))
-            obj = cursor.fetchone()
-            if obj and obj.get('Area'):
-                try:
-                    area = float(obj['Area'])
-                    return round(price * area, 2)
-                except Exception:
-                    return round(price, 2)
-            else:
+        cursor.execute('SELECT Area FROM Object WHERE ID = %s', (object_id,))
+        obj = cursor.fetchone()
+        if obj and obj.get('Area'):
+            try:
+                area = float(obj['Area'])
+                return round(price * area, 2)
+            except Exception:
                 return round(price, 2)
         else:
-            # Для других единиц нам достаточно базовой цены
             return round(price, 2)
     finally:
         cursor.close()
 
 
+app.config.update(
+    SCHEDULES_PAGE_SIZE=50,    # строк на странице /schedules
+)
+
+
+def schedule_cursor(schedule):
+    """
+    Курсор страницы — ключ сортировки строки: "дата_время_ID".
+    Время может быть не задано: "2024-05-01__17". Время в формах вводится с точностью
+    до минуты, поэтому HH:MM из строки списка однозначно задаёт позицию.
+    """
+    return f"{schedule.ScheduledDate}_{schedule.ScheduledTime or ''}_{schedule.ID}"
+
+
+def parse_schedule_cursor(value):
+    """Разобрать курсор; для некорректного значения — None (первая страница)"""
+    try:
+        day, scheduled_time, schedule_id = value.split('_')
+        if scheduled_time:
+            # проверка формата; в старых ссылках время с секундами
+            datetime.strptime(scheduled_time, '%H:%M:%S' if scheduled_time.count(':') == 2 else '%H:%M')
+        return date.fromisoformat(day), scheduled_time or None, int(schedule_id)
+    except (AttributeError, ValueError):
+        return None
+
+
+def schedule_keyset_condition(cursor_key, backward):
+    """
+    Условие "строки после курсора" для порядка ScheduledDate DESC, ScheduledTime DESC, ID DESC
+    (backward=True — строки перед курсором). В MySQL при сортировке DESC строки без времени
+    идут последними в своём дне, это учтено отдельно.
+    Условие начинается с диапазона по ScheduledDate, поэтому читается по индексу
+    (ScheduledDate, ScheduledTime) с того места, где остановилась предыдущая страница.
+    """
+    day, scheduled_time, schedule_id = cursor_key
+    if not backward:
+        if scheduled_time is not None:
+            return ('''(s.ScheduledDate < %s OR (s.ScheduledDate = %s AND (
+                          s.ScheduledTime < %s OR s.ScheduledTime IS NULL
+                          OR (s.ScheduledTime = %s AND s.ID < %s))))''',
+                    [day, day, scheduled_time, scheduled_time, schedule_id])
+        return ('''(s.ScheduledDate < %s OR (s.ScheduledDate = %s
+                      AND s.ScheduledTime IS NULL AND s.ID < %s))''',
+                [day, day, schedule_id])
+    if scheduled_time is not None:
+        return ('''(s.ScheduledDate > %s OR (s.ScheduledDate = %s AND (
+                      s.ScheduledTime > %s OR (s.ScheduledTime = %s AND s.ID > %s))))''',
+                [day, day, scheduled_time, scheduled_time, schedule_id])
+    return ('''(s.ScheduledDate > %s OR (s.ScheduledDate = %s
+                  AND (s.ScheduledTime IS NOT NULL OR s.ID > %s)))''',
+            [day, day, schedule_id])
+
+
+def schedules_stream(conn):
+    """Все заказы одной страницей, потоком (/schedules?all=1)"""
+    try:
+        rows = stream_rows(conn, SCHEDULE_LIST_SQL + '''
+            ORDER BY s.ScheduledDate DESC, s.ScheduledTime DESC, s.ID DESC
+        ''', row_type=ScheduleListRow)
+    except mysql.connector.Error as err:
+        flash(f'Ошибка при получении расписания: {err}', 'error')
+        rows = []
+    return stream_page('schedules.html', schedules=rows, next_cursor=None, prev_cursor=None, show_all=True)
+
+
 @app.route('/schedules')
 @login_required
 def schedules():
+    """Список заказов постранично: страница выбирается по курсору (after/before), а не по OFFSET"""
     conn = get_db_connection()
     if not conn:
         flash('Ошибка подключения к базе данных', 'error')
-        return render_template('schedules.html', schedules=[])
+        return render_template('schedules.html', schedules=[], next_cursor=None, prev_cursor=None)
+
+    if request.args.get('all'):
+        return schedules_stream(conn)
+
+    page_size = app.config['SCHEDULES_PAGE_SIZE']
+    after = parse_schedule_cursor(request.args.get('after'))
+    before = parse_schedule_cursor(request.args.get('before')) if not after else None
+
+    query = SCHEDULE_LIST_SQL
+    params = []
+    if after or before:
+        condition, params = schedule_keyset_condition(after or before, backward=bool(before))
+        query += ' WHERE ' + condition
+    if before:
+        query += ' ORDER BY s.ScheduledDate, s.ScheduledTime, s.ID'
+    else:
+        query += ' ORDER BY s.ScheduledDate DESC, s.ScheduledTime DESC, s.ID DESC'
+    query += ' LIMIT %s'
+    params.append(page_size + 1)  # лишняя строка показывает, есть ли ещё страница
 
-    cursor = conn.cursor(dictionary=True)
+    cursor = conn.cursor()
+    next_cursor = prev_cursor = None
     try:
-        cursor.execute('''
-            SELECT s.*, o.ObjectName, c.FullName as ClientName, e.FullName as EmployeeName, srv.ServiceName
-            FROM Schedule s
-            JOIN Object o ON s.ObjectID = o.ID
-            JOIN Client c ON o.ClientID = c.ID
-            JOIN Service srv ON s.ServiceID = srv.ID
-            LEFT JOIN Employee e ON s.EmployeeID = e.ID
-            ORDER BY s.ScheduledDate DESC, s.ScheduledTime DESC
-        ''')
-        schedules = cursor.fetchall()
-        
-        # Конвертируем timedelta в строку времени для каждого расписания
-        for schedule in schedules:
-            if schedule.get('ScheduledTime') and isinstance(schedule['ScheduledTime'], timedelta):
-                # Конвертируем timedelta в строку формата HH:MM
-                total_seconds = int(schedule['ScheduledTime'].total_seconds())
-                hours = total_seconds // 3600
-                minutes = (total_seconds % 3600) // 60
-                schedule['ScheduledTime'] = f"{hours:02d}:{minutes:02d}"
+        cursor.execute(query, params)
+        schedules = fetch_rows(cursor, ScheduleListRow)
+        has_more = len(schedules) > page_size
+        schedules = schedules[:page_size]
+        if before:
+            schedules.reverse()
+
+        if schedules:
+            # Лишняя строка означает продолжение в ту сторону, куда листали;
+            # в обратную сторону страница есть всегда — мы оттуда пришли
+            if has_more or before:
+                next_cursor = schedule_cursor(schedules[-1])
+            if after or (before and has_more):
+                prev_cursor = schedule_cursor(schedules[0])
     except mysql.connector.Error as err:
         flash(f'Ошибка при получении расписания: {err}', 'error')
         schedules = []
     finally:
         cursor.close()
-        conn.close()
 
-    return render_template('schedules.html', schedules=schedules)
+    return render_template('schedules.html', schedules=schedules,
+                           next_cursor=next_cursor, prev_cursor=prev_cursor)
+
+
+# Пересечения заказов одного сотрудника
+app.config.update(
+    DEFAULT_ORDER_DURATION=60,     # минут, если длительность не указана ни в заказе, ни в услуге
+)
+
+
+def time_to_minutes(value):
+    """ScheduledTime (timedelta или "HH:MM[:SS]") -> минуты от начала суток; None, если времени нет"""
+    if value is None or value == '':
+        return None
+    if isinstance(value, timedelta):
+        return int(value.total_seconds()) // 60
+    hours, minutes = str(value).split(':')[:2]
+    return int(hours) * 60 + int(minutes)
+
+
+def minutes_to_time(minutes):
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+def order_duration(duration, service_id):
+    """Длительность заказа: указанная, иначе из услуги, иначе DEFAULT_ORDER_DURATION"""
+    if duration:
+        return int(duration)
+    service = get_services_reference().by_id.get(service_id)
+    if service and service['Duration']:
+        return int(service['Duration'])
+    return app.config['DEFAULT_ORDER_DURATION']
+
+
+def find_booking_conflicts(conn, employee_id, days, start, duration, exclude_ids=()):
+    """
+    Заказы сотрудника, пересекающиеся с интервалом [start, start + duration) в каждый из дней days.
+    Один запрос по индексу (EmployeeID, ScheduledDate, ScheduledTime) на весь диапазон дней,
+    пересечение проверяется уже в памяти. exclude_ids — сами сохраняемые заказы.
+    Возвращает список строк-конфликтов.
+    """
+    end = start + duration
+    exclude_ids = list(exclude_ids) or [0]
+    cursor = conn.cursor(dictionary=True)
+    try:
+        cursor.execute(f'''
+            SELECT s.ID, s.ScheduledDate, s.ScheduledTime,
+                   COALESCE(s.Duration, srv.Duration, %s) as Minutes, o.ObjectName
+            FROM Schedule s
+            JOIN Service srv ON s.ServiceID = srv.ID
+            JOIN Object o ON s.ObjectID = o.ID
+            WHERE s.EmployeeID = %s AND s.ScheduledDate >= %s AND s.ScheduledDate <= %s
+              AND s.ScheduledTime IS NOT NULL AND s.ScheduledTime < %s
+              AND s.Status != "Отменено" AND s.ID NOT IN ({', '.join(['%s'] * len(exclude_ids))})
+        ''', (app.config['DEFAULT_ORDER_DURATION'], employee_id, min(days), max(days),
+              minutes_to_time(end) if end < 24 * 60 else '24:00', *exclude_ids))
+        days = set(days)
+        conflicts = []
+        for row in cursor.fetchall():
+            other_start = time_to_minutes(row['ScheduledTime'])
+            if row['ScheduledDate'] in days and other_start + int(row['Minutes']) > start:
+                row['ScheduledTime'] = minutes_to_time(other_start)
+                conflicts.append(row)
+        return conflicts
+    finally:
+        cursor.close()
+
+
+def booking_conflict_message(conflicts):
+    shown = ', '.join(f"#{row['ID']} {row['ScheduledDate']:%d.%m} {row['ScheduledTime']} ({row['ObjectName']})"
+                      for row in conflicts[:5])
+    more = f' и ещё {len(conflicts) - 5}' if len(conflicts) > 5 else ''
+    return f'Сотрудник уже занят в это время: {shown}{more}. Отметьте «Разрешить пересечение», чтобы сохранить всё равно'
+
+
+def check_booking(conn, form, days, exclude_ids=()):
+    """Проверка при сохранении: текст ошибки, если сотрудник занят хотя бы в один из дней days, иначе None"""
+    employee_id = form.get('employee_id')
+    start = time_to_minutes(form.get('scheduled_time'))
+    if not employee_id or start is None or form.get('allow_overlap'):
+        return None
+    duration = order_duration(form.get('duration'), int(form.get('service_id')))
+    conflicts = find_booking_conflicts(conn, int(employee_id), days, start, duration, exclude_ids)
+    return booking_conflict_message(conflicts) if conflicts else None
+
+
+def find_overlapping_pairs(bookings):
+    """
+    Все пары пересекающихся заказов. bookings отсортированы по (сотрудник, дата, начало),
+    у каждого есть 'start' и 'end' в минутах. Проход по началам с кучей активных интервалов
+    (по времени окончания): O(n log n + число пар) вместо сравнения всех пар.
+    """
+    pairs = []
+    active = []
+    group = None
+    for booking in bookings:
+        key = (booking['EmployeeID'], booking['ScheduledDate'])
+        if key != group:
+            group = key
+            active = []
+        while active and active[0][0] <= booking['start']:
+            heapq.heappop(active)
+        for _, _, other in active:
+            pairs.append((other, booking))
+        heapq.heappush(active, (booking['end'], booking['ID'], booking))
+    return pairs
+
+
+# Повторяющиеся заказы (серии)
+app.config.update(
+    SERIES_MAX_OCCURRENCES=500,    # не больше стольких заказов в одной серии
+)
+
+
+def parse_recurrence(form, start):
+    """
+    Правило повтора из формы: дни недели (repeat_days, 0 — понедельник),
+    каждые N недель (repeat_interval), до даты (repeat_until) и/или N раз (repeat_count).
+    Возвращает (правило, None) или (None, текст ошибки).
+    """
+    try:
+        weekdays = sorted({int(day) for day in form.getlist('repeat_days')})
+        interval = int(form.get('repeat_interval') or 1)
+        until = date.fromisoformat(form['repeat_until']) if form.get('repeat_until') else None
+        count = int(form['repeat_count']) if form.get('repeat_count') else None
+    except ValueError:
+        return None, 'Ошибка в параметрах повтора'
+
+    if not weekdays or not all(0 <= day <= 6 for day in weekdays):
+        return None, 'Выберите дни недели для повтора'
+    if interval < 1:
+        return None, 'Интервал повтора должен быть не меньше 1 недели'
+    if until is None and count is None:
+        return None, 'Укажите дату окончания или количество повторов'
+    if until is not None and until < start:
+        return None, 'Дата окончания повтора раньше даты начала'
+    if count is not None and count < 1:
+        return None, 'Количество повторов должно быть положительным'
+    return {'weekdays': weekdays, 'interval': interval, 'until': until, 'count': count}, None
+
+
+def expand_recurrence(start, weekdays, interval=1, until=None, count=None, limit=None):
+    """
+    Даты серии: дни weekdays каждой interval-й недели, считая с недели start,
+    начиная с самого start, пока не достигнуты until и/или count (и не больше limit дат).
+    """
+    anchor = start - timedelta(days=start.weekday())   # понедельник первой недели
+    limit = min(count, limit) if count and limit else (count or limit)
+    dates = []
+    day = start
+    while (limit is None or len(dates) < limit) and (until is None or day <= until):
+        if day.weekday() in weekdays and (day - anchor).days // 7 % interval == 0:
+            dates.append(day)
+        day += timedelta(days=1)
+    return dates
+
+
+def insert_schedule_series(conn, rule, dates, values):
+    """
+    Записать серию и все её заказы (в текущей транзакции, commit делает вызывающий).
+    values — (ObjectID, ServiceID, EmployeeID, ScheduledTime, Duration, Status, Cost, Notes),
+    общие для всех заказов серии. Возвращает ID серии.
+    """
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            '''INSERT INTO ScheduleSeries (Weekdays, IntervalWeeks, StartDate, EndDate, OccurrenceCount)
+               VALUES (%s, %s, %s, %s, %s)''',
+            (','.join(map(str, rule['weekdays'])), rule['interval'], dates[0], rule['until'], rule['count'])
+        )
+        series_id = cursor.lastrowid
+        object_id, service_id, employee_id, scheduled_time, duration, status, cost, notes = values
+        # Одна многострочная вставка вместо запроса на каждый заказ
+        cursor.executemany(
+            '''INSERT INTO Schedule (ObjectID, ServiceID, EmployeeID, ScheduledDate, ScheduledTime, Duration, Status, Cost, Notes, SeriesID)
+               VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)''',
+            [(object_id, service_id, employee_id, day, scheduled_time, duration, status, cost, notes, series_id)
+             for day in dates]
+        )
+        rollup_delta(conn, 's.SeriesID = %s', [series_id], 1)
+    finally:
+        cursor.close()
+    return series_id
 
 
 @app.route('/add_schedule', methods=['GET', 'POST'])
@@ -974,13 +2523,18 @@ def add_schedule():
 
         if not all([object_id, service_id, scheduled_date]):
             flash('Заполните обязательные поля (объект, услуга, дата)', 'error')
-            cursor = conn.cursor()
-            cursor.close()
-            conn.close()
             return redirect(url_for('add_schedule'))
 
+        if request.form.get('repeat'):
+            return add_schedule_series(conn, scheduled_date)
+
         cursor = conn.cursor()
         try:
+            conflict = check_booking(conn, request.form, [date.fromisoformat(scheduled_date)])
+            if conflict:
+                flash(conflict, 'error')
+                return redirect(url_for('add_schedule'))
+
             # Попробуем посчитать стоимость, если не задана
             cost = calculate_cost_if_empty(conn, int(object_id), int(service_id), cost_input)
             cursor.execute(
@@ -998,7 +2552,9 @@ def add_schedule():
                     notes
                 )
             )
+            rollup_delta(conn, 's.ID = %s', [cursor.lastrowid], 1)
             conn.commit()
+            touch_tables('Schedule')
             flash('Расписание добавлено', 'success')
             return redirect(url_for('schedules'))
         except mysql.connector.Error as err:
@@ -1009,20 +2565,111 @@ def add_schedule():
             flash('Ошибка в форматах полей', 'error')
         finally:
             cursor.close()
-            conn.close()
 
-    # GET — загрузить объекты, услуги, сотрудников
-    cursor = conn.cursor(dictionary=True)
-    cursor.execute('SELECT ID, ObjectName FROM Object ORDER BY ObjectName')
-    objects = cursor.fetchall()
-    cursor.execute('SELECT ID, ServiceName FROM Service ORDER BY ServiceName')
-    services = cursor.fetchall()
-    cursor.execute('SELECT ID, FullName FROM Employee WHERE Status = "Активен" ORDER BY FullName')
-    employees = cursor.fetchall()
-    cursor.close()
-    conn.close()
+    # GET — объект, услуга и сотрудник выбираются через /api/search/<kind>
+    return render_template('add_schedule.html')
+
+
+def add_schedule_series(conn, scheduled_date):
+    """Создать серию заказов по правилу повтора из формы add_schedule"""
+    form = request.form
+    try:
+        start = date.fromisoformat(scheduled_date)
+    except ValueError:
+        flash('Ошибка в форматах полей', 'error')
+        return redirect(url_for('add_schedule'))
+
+    rule, error = parse_recurrence(form, start)
+    if error:
+        flash(error, 'error')
+        return redirect(url_for('add_schedule'))
+
+    max_occurrences = app.config['SERIES_MAX_OCCURRENCES']
+    dates = expand_recurrence(start, rule['weekdays'], rule['interval'], rule['until'], rule['count'],
+                              limit=max_occurrences + 1)
+    if not dates:
+        flash('По заданному правилу не получилось ни одной даты', 'error')
+        return redirect(url_for('add_schedule'))
+    if len(dates) > max_occurrences:
+        flash(f'Слишком много повторов: в одной серии может быть не больше {max_occurrences} заказов', 'error')
+        return redirect(url_for('add_schedule'))
+
+    try:
+        conflict = check_booking(conn, form, dates)
+        if conflict:
+            flash(conflict, 'error')
+            return redirect(url_for('add_schedule'))
+
+        object_id = int(form['object_id'])
+        service_id = int(form['service_id'])
+        employee_id = form.get('employee_id')
+        duration = form.get('duration')
+        # Цена одинакова для всех заказов серии — считаем её один раз
+        cost = calculate_cost_if_empty(conn, object_id, service_id, form.get('cost') or None)
+        values = (
+            object_id,
+            service_id,
+            int(employee_id) if employee_id else None,
+            form.get('scheduled_time') or None,
+            int(duration) if duration else None,
+            form.get('status') or 'Запланировано',
+            cost,
+            form.get('notes') or None,
+        )
+        insert_schedule_series(conn, rule, dates, values)
+        conn.commit()
+        touch_tables('Schedule')
+        flash(f'Добавлена серия из {len(dates)} заказов: с {dates[0]:%d.%m.%Y} по {dates[-1]:%d.%m.%Y}', 'success')
+        return redirect(url_for('schedules'))
+    except mysql.connector.Error as err:
+        conn.rollback()
+        flash(f'Ошибка при добавлении серии: {err}', 'error')
+    except ValueError:
+        conn.rollback()
+        flash('Ошибка в форматах полей', 'error')
+    return redirect(url_for('add_schedule'))
+
+
+# Следующие запланированные заказы серии заказа cur (сам заказ не входит)
+SERIES_FUTURE_WHERE = '''s.SeriesID = cur.SeriesID AND s.ScheduledDate >= cur.ScheduledDate
+                         AND s.ID != cur.ID AND s.Status = "Запланировано"'''
+
 
-    return render_template('add_schedule.html', objects=objects, services=services, employees=employees)
+def series_future_rows(conn, schedule_id):
+    """Заказы, которые изменит update_series_from: [(ID, ScheduledDate)]"""
+    cursor = conn.cursor()
+    try:
+        cursor.execute(f'''
+            SELECT s.ID, s.ScheduledDate FROM Schedule s
+            JOIN Schedule cur ON cur.ID = %s
+            WHERE {SERIES_FUTURE_WHERE}
+        ''', (schedule_id,))
+        return cursor.fetchall()
+    finally:
+        cursor.close()
+
+
+def update_series_from(conn, schedule_id, values):
+    """
+    "Эту и последующие": одним UPDATE перенести общие поля заказа на все следующие
+    запланированные заказы его серии (сам заказ обновляет вызывающий).
+    values — (ObjectID, ServiceID, EmployeeID, ScheduledTime, Duration, Cost, Notes).
+    Возвращает число изменённых заказов.
+    """
+    cursor = conn.cursor()
+    try:
+        with rollup_changes_for(conn, f'SELECT s.ID FROM Schedule s JOIN Schedule cur ON cur.ID = %s WHERE {SERIES_FUTURE_WHERE}',
+                                (schedule_id,)):
+            cursor.execute(f'''
+                UPDATE Schedule s
+                JOIN Schedule cur ON cur.ID = %s
+                SET s.ObjectID=%s, s.ServiceID=%s, s.EmployeeID=%s, s.ScheduledTime=%s,
+                    s.Duration=%s, s.Cost=%s, s.Notes=%s
+                WHERE {SERIES_FUTURE_WHERE}
+            ''', (schedule_id, *values))
+        return cursor.rowcount
+    finally:
+        cursor.close()
 
 
 @app.route('/edit_schedule/<int:id>', methods=['GET', 'POST'])
@@ -1050,25 +2697,53 @@ def edit_schedule(id):
 
         cursor = conn.cursor()
         try:
+            # При "эту и последующие" время и сотрудник меняются во всех следующих заказах серии —
+            # проверяем их дни вместе с этим заказом, а сами заказы серии не считаем помехой
+            days, exclude_ids = [date.fromisoformat(scheduled_date)], [id]
+            if request.form.get('apply_to') == 'future':
+                for future_id, future_date in series_future_rows(conn, id):
+                    days.append(future_date)
+                    exclude_ids.append(future_id)
+            conflict = check_booking(conn, request.form, days, exclude_ids)
+            if conflict:
+                flash(conflict, 'error')
+                return redirect(url_for('edit_schedule', id=id))
+
             cost = calculate_cost_if_empty(conn, int(object_id), int(service_id), cost_input)
-            cursor.execute(
-                '''UPDATE Schedule SET ObjectID=%s, ServiceID=%s, EmployeeID=%s, ScheduledDate=%s, ScheduledTime=%s,
-                   Duration=%s, Status=%s, Cost=%s, Notes=%s WHERE ID=%s''',
-                (
+            future_updated = 0
+            if request.form.get('apply_to') == 'future':
+                future_updated = update_series_from(conn, id, (
                     int(object_id),
                     int(service_id),
                     int(employee_id) if employee_id else None,
-                    scheduled_date,
                     scheduled_time,
                     int(duration) if duration else None,
-                    status,
                     cost,
                     notes,
-                    id
+                ))
+            with rollup_changes(conn, 's.ID = %s', [id]):
+                cursor.execute(
+                    '''UPDATE Schedule SET ObjectID=%s, ServiceID=%s, EmployeeID=%s, ScheduledDate=%s, ScheduledTime=%s,
+                       Duration=%s, Status=%s, Cost=%s, Notes=%s WHERE ID=%s''',
+                    (
+                        int(object_id),
+                        int(service_id),
+                        int(employee_id) if employee_id else None,
+                        scheduled_date,
+                        scheduled_time,
+                        int(duration) if duration else None,
+                        status,
+                        cost,
+                        notes,
+                        id
+                    )
                 )
-            )
             conn.commit()
-            flash('Расписание обновлено', 'success')
+            touch_tables('Schedule')
+            if future_updated:
+                flash(f'Расписание обновлено, а также {future_updated} последующих заказов серии', 'success')
+            else:
+                flash('Расписание обновлено', 'success')
             return redirect(url_for('schedules'))
         except mysql.connector.Error as err:
             conn.rollback()
@@ -1078,36 +2753,17 @@ def edit_schedule(id):
             flash('Ошибка в форматах полей', 'error')
         finally:
             cursor.close()
-            conn.close()
 
-    # GET - загрузить данные для формы
-    cursor = conn.cursor(dictionary=True)
-    cursor.execute('SELECT * FROM Schedule WHERE ID = %s', (id,))
-    schedule = cursor.fetchone()
+    # GET - загрузить данные для формы (подписи выбранных объекта, услуги и сотрудника)
+    cursor = conn.cursor()
+    cursor.execute(SCHEDULE_FORM_SQL + ' WHERE s.ID = %s', (id,))
+    schedule = fetch_row(cursor, ScheduleFormRow)
+    cursor.close()
     if not schedule:
-        cursor.close()
-        conn.close()
         flash('Запись не найдена', 'error')
         return redirect(url_for('schedules'))
-    
-    # Конвертируем timedelta в строку времени для формы
-    if schedule.get('ScheduledTime') and isinstance(schedule['ScheduledTime'], timedelta):
-        # Конвертируем timedelta в строку формата HH:MM
-        total_seconds = int(schedule['ScheduledTime'].total_seconds())
-        hours = total_seconds // 3600
-        minutes = (total_seconds % 3600) // 60
-        schedule['ScheduledTime'] = f"{hours:02d}:{minutes:02d}"
-
-    cursor.execute('SELECT ID, ObjectName FROM Object ORDER BY ObjectName')
-    objects = cursor.fetchall()
-    cursor.execute('SELECT ID, ServiceName FROM Service ORDER BY ServiceName')
-    services = cursor.fetchall()
-    cursor.execute('SELECT ID, FullName FROM Employee WHERE Status = "Активен" ORDER BY FullName')
-    employees = cursor.fetchall()
-    cursor.close()
-    conn.close()
 
-    return render_template('edit_schedule.html', schedule=schedule, objects=objects, services=services, employees=employees)
+    return render_template('edit_schedule.html', schedule=schedule)
 
 
 @app.route('/delete_schedule/<int:id>')
@@ -1120,236 +2776,1095 @@ def delete_schedule(id):
 
     cursor = conn.cursor()
     try:
+        rollup_delta(conn, 's.ID = %s', [id], -1)
         cursor.execute('DELETE FROM Schedule WHERE ID = %s', (id,))
         conn.commit()
+        touch_tables('Schedule')
         flash('Запись расписания удалена', 'success')
     except mysql.connector.Error as err:
         conn.rollback()
         flash(f'Ошибка при удалении записи: {err}', 'error')
     finally:
         cursor.close()
-        conn.close()
 
     return redirect(url_for('schedules'))
 
 
-# ========== REPORTS (Отчеты) ==========
-@app.route('/reports')
-@login_required
-def reports():
-    """Главная страница отчетов"""
-    return render_template('reports.html', current_date=datetime.now())
-
-
-@app.route('/reports/clients')
+@app.route('/cancel_series/<int:id>')
 @login_required
-def report_clients():
-    """Отчет по клиентам"""
+def cancel_series(id):
+    """Отменить этот и все последующие запланированные заказы серии"""
     conn = get_db_connection()
     if not conn:
-        flash('Ошибка подключения к базе данных', 'error')
-        return render_template('report_clients.html', clients=[], stats={})
+        flash('Ошибка подключения к БД', 'error')
+        return redirect(url_for('schedules'))
 
-    cursor = conn.cursor(dictionary=True)
-    stats = {}
+    cursor = conn.cursor()
     try:
-        # Получаем всех клиентов с дополнительной информацией
-        cursor.execute('''
-            SELECT c.*, COUNT(o.ID) as objects_count,
-                   COALESCE(SUM(CASE WHEN s.Status = "Выполнено" THEN s.Cost ELSE 0 END), 0) as total_revenue,
-                   COUNT(DISTINCT s.ID) as total_orders
-            FROM Client c
-            LEFT JOIN Object o ON c.ID = o.ClientID
-            LEFT JOIN Schedule s ON o.ID = s.ObjectID
-            GROUP BY c.ID
-            ORDER BY c.FullName
-        ''')
-        clients = cursor.fetchall()
+        series_where = '''s.SeriesID = cur.SeriesID AND s.ScheduledDate >= cur.ScheduledDate
+                          AND s.Status = "Запланировано"'''
+        with rollup_changes_for(conn, f'SELECT s.ID FROM Schedule s JOIN Schedule cur ON cur.ID = %s WHERE {series_where}',
+                                (id,)):
+            cursor.execute(f'''
+                UPDATE Schedule s
+                JOIN Schedule cur ON cur.ID = %s
+                SET s.Status = "Отменено"
+                WHERE {series_where}
+            ''', (id,))
+        cancelled = cursor.rowcount
+        conn.commit()
+        touch_tables('Schedule')
+        flash(f'Отменено заказов серии: {cancelled}', 'success')
+    except mysql.connector.Error as err:
+        conn.rollback()
+        flash(f'Ошибка при отмене серии: {err}', 'error')
+    finally:
+        cursor.close()
 
-        # Статистика
-        cursor.execute('SELECT COUNT(*) as total FROM Client')
-        stats['total'] = cursor.fetchone()['total'] or 0
+    return redirect(url_for('schedules'))
 
-        cursor.execute('SELECT COUNT(*) as total FROM Client WHERE Phone IS NOT NULL AND Phone != ""')
-        stats['with_phone'] = cursor.fetchone()['total'] or 0
 
-        cursor.execute('SELECT COUNT(*) as total FROM Client WHERE Email IS NOT NULL AND Email != ""')
-        stats['with_email'] = cursor.fetchone()['total'] or 0
+# Массовая смена статуса
+SCHEDULE_STATUSES = ('Запланировано', 'В процессе', 'Выполнено', 'Отменено')
+BULK_STATUS_MAX_IDS = 1000
 
-        cursor.execute('''
-            SELECT COUNT(DISTINCT c.ID) as total
-            FROM Client c
-            JOIN Object o ON c.ID = o.ClientID
-        ''')
-        stats['with_objects'] = cursor.fetchone()['total'] or 0
 
-    except mysql.connector.Error as err:
-        flash(f'Ошибка при получении данных: {err}', 'error')
-        clients = []
+def bulk_set_status(conn, ids, status):
+    """
+    Сменить статус сразу многим заказам: блокировка строк (SELECT ... FOR UPDATE) и один
+    UPDATE ... WHERE ID IN (...) в одной транзакции, кэши сбрасываются один раз.
+    Стоимость и остальные поля не трогаются.
+    Возвращает {ID: 'updated' | 'unchanged' | 'not_found'}.
+    """
+    ids = list(dict.fromkeys(ids))
+    placeholders = ', '.join(['%s'] * len(ids))
+    cursor = conn.cursor()
+    try:
+        cursor.execute(f'SELECT ID, Status FROM Schedule WHERE ID IN ({placeholders}) FOR UPDATE', ids)
+        current = dict(cursor.fetchall())
+        results = {schedule_id: 'not_found' for schedule_id in ids}
+        changed = []
+        for schedule_id, old_status in current.items():
+            if old_status == status:
+                results[schedule_id] = 'unchanged'
+            else:
+                results[schedule_id] = 'updated'
+                changed.append(schedule_id)
+        if changed:
+            id_list = ', '.join(['%s'] * len(changed))
+            with rollup_changes(conn, f's.ID IN ({id_list})', changed):
+                cursor.execute(f'UPDATE Schedule SET Status = %s WHERE ID IN ({id_list})', [status] + changed)
+        conn.commit()
+    except mysql.connector.Error:
+        conn.rollback()
+        raise
     finally:
         cursor.close()
-        conn.close()
+    if changed:
+        touch_tables('Schedule')
+    return results
+
 
-    return render_template('report_clients.html', clients=clients, stats=stats, current_date=datetime.now())
+def parse_bulk_status(ids, status):
+    """Проверка входных данных: (список ID, None) или (None, текст ошибки)"""
+    if status not in SCHEDULE_STATUSES:
+        return None, 'Неизвестный статус'
+    try:
+        ids = [int(schedule_id) for schedule_id in ids]
+    except (TypeError, ValueError):
+        return None, 'ID заказов должны быть числами'
+    if not ids:
+        return None, 'Не выбрано ни одного заказа'
+    if len(ids) > BULK_STATUS_MAX_IDS:
+        return None, f'За один раз можно изменить не больше {BULK_STATUS_MAX_IDS} заказов'
+    return ids, None
 
 
-@app.route('/reports/objects')
+@app.route('/schedules/bulk_status', methods=['POST'])
 @login_required
-def report_objects():
-    """Отчет по объектам"""
+def bulk_status():
+    """Массовая смена статуса отмеченных на странице /schedules заказов"""
+    status = request.form.get('status')
+    ids, error = parse_bulk_status(request.form.getlist('ids'), status)
+    # Возвращаемся на ту же страницу списка
+    back = url_for('schedules', **{key: request.form[key] for key in ('after', 'before') if request.form.get(key)})
+    if error:
+        flash(error, 'error')
+        return redirect(back)
+
     conn = get_db_connection()
     if not conn:
-        flash('Ошибка подключения к базе данных', 'error')
-        return render_template('report_objects.html', objects=[], stats={})
+        flash('Ошибка подключения к БД', 'error')
+        return redirect(back)
 
-    cursor = conn.cursor(dictionary=True)
-    stats = {}
     try:
-        cursor.execute('''
-            SELECT o.*, c.FullName as ClientName,
-                   COUNT(s.ID) as total_orders,
-                   COALESCE(SUM(CASE WHEN s.Status = "Выполнено" THEN s.Cost ELSE 0 END), 0) as total_revenue,
-                   MAX(s.ScheduledDate) as last_service_date
-            FROM Object o
-            JOIN Client c ON o.ClientID = c.ID
-            LEFT JOIN Schedule s ON o.ID = s.ObjectID
-            GROUP BY o.ID
-            ORDER BY o.ObjectName
-        ''')
-        objects = cursor.fetchall()
-
-        # Статистика
-        cursor.execute('SELECT COUNT(*) as total FROM Object')
-        stats['total'] = cursor.fetchone()['total'] or 0
+        results = bulk_set_status(conn, ids, status)
+    except mysql.connector.Error as err:
+        flash(f'Ошибка при смене статуса: {err}', 'error')
+        return redirect(back)
 
-        cursor.execute('SELECT SUM(Area) as total FROM Object WHERE Area IS NOT NULL')
-        stats['total_area'] = cursor.fetchone()['total'] or 0
+    counts = {result: list(results.values()).count(result) for result in ('updated', 'unchanged', 'not_found')}
+    flash(f'Статус «{status}» установлен для {counts["updated"]} заказ(ов)', 'success')
+    if counts['unchanged']:
+        flash(f'Уже были в этом статусе: {counts["unchanged"]}', 'info')
+    if counts['not_found']:
+        flash(f'Не найдены (возможно, удалены): {counts["not_found"]}', 'error')
+    return redirect(back)
 
-        cursor.execute('''
-            SELECT COUNT(DISTINCT o.ID) as total
-            FROM Object o
-            JOIN Schedule s ON o.ID = s.ObjectID
-            WHERE s.Status = "Выполнено"
-        ''')
-        stats['with_services'] = cursor.fetchone()['total'] or 0
 
-        cursor.execute('SELECT COUNT(DISTINCT ObjectType) as total FROM Object WHERE ObjectType IS NOT NULL')
-        stats['types_count'] = cursor.fetchone()['total'] or 0
+@app.route('/api/schedules/status', methods=['POST'])
+@login_required
+def bulk_status_api():
+    """
+    Массовая смена статуса: JSON {"ids": [1, 2, 3], "status": "Выполнено"}.
+    Ответ: {"status": ..., "updated": N, "results": {"1": "updated", "2": "unchanged", "3": "not_found"}}
+    """
+    payload = request.get_json(silent=True) or {}
+    ids = payload.get('ids')
+    if not isinstance(ids, list):
+        return jsonify(error='Ожидается JSON с полями ids (список) и status'), 400
+    ids, error = parse_bulk_status(ids, payload.get('status'))
+    if error:
+        return jsonify(error=error), 400
 
+    conn = get_db_connection()
+    if not conn:
+        return jsonify(error='Ошибка подключения к базе данных'), 503
+    try:
+        results = bulk_set_status(conn, ids, payload['status'])
     except mysql.connector.Error as err:
-        flash(f'Ошибка при получении данных: {err}', 'error')
-        objects = []
-    finally:
-        cursor.close()
-        conn.close()
-
-    return render_template('report_objects.html', objects=objects, stats=stats, current_date=datetime.now())
+        return jsonify(error=str(err)), 500
+    return jsonify(status=payload['status'],
+                   updated=list(results.values()).count('updated'),
+                   results={str(schedule_id): result for schedule_id, result in results.items()})
 
 
-@app.route('/reports/employees')
+@app.route('/schedules/conflicts')
 @login_required
-def report_employees():
-    """Отчет по сотрудникам"""
+def schedule_conflicts():
+    """Все пересечения заказов сотрудников за период (по умолчанию — текущий месяц)"""
+    month_start, month_end = month_bounds()
+    try:
+        date_from = date.fromisoformat(request.args.get('date_from') or month_start.isoformat()).isoformat()
+        date_to = date.fromisoformat(request.args.get('date_to') or (month_end - timedelta(days=1)).isoformat()).isoformat()
+    except ValueError:
+        flash('Неверный период: даты — ГГГГ-ММ-ДД', 'error')
+        date_from, date_to = month_start.isoformat(), (month_end - timedelta(days=1)).isoformat()
+
     conn = get_db_connection()
     if not conn:
         flash('Ошибка подключения к базе данных', 'error')
-        return render_template('report_employees.html', employees=[], stats={})
+        return render_template('schedule_conflicts.html', pairs=[], date_from=date_from, date_to=date_to)
 
     cursor = conn.cursor(dictionary=True)
-    stats = {}
+    pairs = []
     try:
         cursor.execute('''
-            SELECT e.*,
-                   COUNT(s.ID) as total_orders,
-                   COALESCE(SUM(CASE WHEN s.Status = "Выполнено" THEN s.Cost ELSE 0 END), 0) as total_revenue,
-                   COUNT(CASE WHEN s.Status = "Выполнено" THEN 1 END) as completed_orders
-            FROM Employee e
-            LEFT JOIN Schedule s ON e.ID = s.EmployeeID
-            GROUP BY e.ID
-            ORDER BY e.FullName
-        ''')
-        employees = cursor.fetchall()
-
-        # Статистика
-        cursor.execute('SELECT COUNT(*) as total FROM Employee')
-        stats['total'] = cursor.fetchone()['total'] or 0
-
-        cursor.execute('SELECT COUNT(*) as total FROM Employee WHERE Status = "Активен"')
-        stats['active'] = cursor.fetchone()['total'] or 0
-
-        cursor.execute('SELECT COUNT(*) as total FROM Employee WHERE Status = "Неактивен"')
-        stats['inactive'] = cursor.fetchone()['total'] or 0
-
-        cursor.execute('SELECT AVG(Salary) as avg FROM Employee WHERE Salary IS NOT NULL AND Status = "Активен"')
-        result = cursor.fetchone()
-        stats['avg_salary'] = result['avg'] if result['avg'] else 0
-
-        cursor.execute('SELECT SUM(Salary) as total FROM Employee WHERE Status = "Активен"')
-        stats['total_salary'] = cursor.fetchone()['total'] or 0
-
+            SELECT s.ID, s.EmployeeID, e.FullName as EmployeeName, s.ScheduledDate, s.ScheduledTime,
+                   COALESCE(s.Duration, srv.Duration, %s) as Minutes, o.ObjectName, s.Status
+            FROM Schedule s
+            JOIN Service srv ON s.ServiceID = srv.ID
+            JOIN Object o ON s.ObjectID = o.ID
+            JOIN Employee e ON s.EmployeeID = e.ID
+            WHERE s.ScheduledDate >= %s AND s.ScheduledDate <= %s
+              AND s.ScheduledTime IS NOT NULL AND s.Status != "Отменено"
+            ORDER BY s.EmployeeID, s.ScheduledDate, s.ScheduledTime
+        ''', (app.config['DEFAULT_ORDER_DURATION'], date_from, date_to))
+        bookings = cursor.fetchall()
+        for booking in bookings:
+            booking['start'] = time_to_minutes(booking['ScheduledTime'])
+            booking['end'] = booking['start'] + int(booking['Minutes'])
+            booking['ScheduledTime'] = minutes_to_time(booking['start'])
+        pairs = find_overlapping_pairs(bookings)
     except mysql.connector.Error as err:
-        flash(f'Ошибка при получении данных: {err}', 'error')
-        employees = []
+        flash(f'Ошибка при поиске пересечений: {err}', 'error')
     finally:
         cursor.close()
-        conn.close()
 
-    return render_template('report_employees.html', employees=employees, stats=stats, current_date=datetime.now())
+    return render_template('schedule_conflicts.html', pairs=pairs, date_from=date_from, date_to=date_to)
 
 
-@app.route('/reports/services')
+# Массовый пересчёт стоимости запланированных заказов
+REPRICE_PREVIEW_LIMIT = 200
+
+# То же правило, что в calculate_cost_if_empty, но для всех строк сразу
+REPRICE_COST_SQL = '''ROUND(CASE WHEN srv.Unit = 'кв.м' AND o.Area IS NOT NULL AND o.Area <> 0
+                        THEN srv.PricePerUnit * o.Area ELSE srv.PricePerUnit END, 2)'''
+
+
+def reprice_scope(values):
+    """
+    Условие отбора заказов для пересчёта: только «Запланировано», с ценой услуги,
+    в диапазоне дат (по умолчанию с сегодняшнего дня) и, если задано, по одной услуге.
+    Выбираются только заказы, чья стоимость отличается от рассчитанной.
+    """
+    where = ['s.Status = "Запланировано"', 'srv.PricePerUnit IS NOT NULL',
+             f'(s.Cost IS NULL OR s.Cost <> {REPRICE_COST_SQL})']
+    params = []
+    where.append('s.ScheduledDate >= %s')
+    params.append(values['date_from'])
+    if values['date_to']:
+        where.append('s.ScheduledDate <= %s')
+        params.append(values['date_to'])
+    if values['service_id']:
+        where.append('s.ServiceID = %s')
+        params.append(int(values['service_id']))
+    return ' AND '.join(where), params
+
+
+def reprice_values(source):
+    """
+    Параметры отбора из формы или строки запроса и признак, что они верны.
+    При неверной дате или услуге — flash и отбор по умолчанию (с сегодняшнего дня, все услуги).
+    """
+    values = {
+        'date_from': source.get('date_from') or date.today().isoformat(),
+        'date_to': source.get('date_to', ''),
+        'service_id': source.get('service_id', ''),
+    }
+    try:
+        values['date_from'] = date.fromisoformat(values['date_from']).isoformat()
+        if values['date_to']:
+            values['date_to'] = date.fromisoformat(values['date_to']).isoformat()
+        if values['service_id']:
+            values['service_id'] = str(int(values['service_id']))
+    except ValueError:
+        flash('Неверные параметры отбора: даты — ГГГГ-ММ-ДД, услуга — из списка', 'error')
+        return {'date_from': date.today().isoformat(), 'date_to': '', 'service_id': ''}, False
+    return values, True
+
+
+@app.route('/schedules/reprice', methods=['GET', 'POST'])
 @login_required
-def report_services():
-    """Отчет по услугам"""
+def reprice_schedules():
+    """
+    GET — предпросмотр (что изменится, без записи), POST — пересчёт одним UPDATE ... JOIN
+    по тем же условиям.
+    """
+    values, valid = reprice_values(request.form if request.method == 'POST' else request.args)
+    if request.method == 'POST' and not valid:
+        # Пересчитывать по подставленному отбору нельзя — показываем предпросмотр
+        return redirect(url_for('reprice_schedules'))
+    where, params = reprice_scope(values)
+
     conn = get_db_connection()
     if not conn:
         flash('Ошибка подключения к базе данных', 'error')
-        return render_template('report_services.html', services=[], stats={})
-
-    cursor = conn.cursor(dictionary=True)
-    stats = {}
-    try:
-        cursor.execute('''
-            SELECT s.*,
-                   COUNT(sch.ID) as total_orders,
-                   COALESCE(SUM(CASE WHEN sch.Status = "Выполнено" THEN sch.Cost ELSE 0 END), 0) as total_revenue,
-                   COUNT(CASE WHEN sch.Status = "Выполнено" THEN 1 END) as completed_orders
-            FROM Service s
-            LEFT JOIN Schedule sch ON s.ID = sch.ServiceID
-            GROUP BY s.ID
-            ORDER BY s.ServiceName
-        ''')
-        services = cursor.fetchall()
-
-        # Статистика
-        cursor.execute('SELECT COUNT(*) as total FROM Service')
-        stats['total'] = cursor.fetchone()['total'] or 0
+        return redirect(url_for('schedules'))
 
-        cursor.execute('SELECT AVG(PricePerUnit) as avg FROM Service WHERE PricePerUnit IS NOT NULL')
-        result = cursor.fetchone()
-        stats['avg_price'] = result['avg'] if result['avg'] else 0
+    if request.method == 'POST':
+        cursor = conn.cursor()
+        try:
+            scope = '''Schedule s
+                JOIN Service srv ON s.ServiceID = srv.ID
+                JOIN Object o ON s.ObjectID = o.ID'''
+            with rollup_changes_for(conn, f'SELECT s.ID FROM {scope} WHERE {where}', params):
+                cursor.execute(f'UPDATE {scope} SET s.Cost = {REPRICE_COST_SQL} WHERE {where}', params)
+            updated = cursor.rowcount
+            conn.commit()
+            touch_tables('Schedule')
+            flash(f'Стоимость пересчитана: {updated} заказ(ов)', 'success')
+        except mysql.connector.Error as err:
+            conn.rollback()
+            flash(f'Ошибка при пересчёте стоимости: {err}', 'error')
+        finally:
+            cursor.close()
+        return redirect(url_for('reprice_schedules', **values))
+
+    cursor = conn.cursor(dictionary=True)
+    rows = []
+    services = []
+    summary = {'total': 0, 'old_sum': 0, 'new_sum': 0}
+    try:
+        services = get_services_reference().rows
+        cursor.execute(f'''
+            SELECT COUNT(*) as total, COALESCE(SUM(s.Cost), 0) as old_sum,
+                   COALESCE(SUM({REPRICE_COST_SQL}), 0) as new_sum
+            FROM Schedule s
+            JOIN Service srv ON s.ServiceID = srv.ID
+            JOIN Object o ON s.ObjectID = o.ID
+            WHERE {where}
+        ''', params)
+        summary = cursor.fetchone()
+        cursor.execute(f'''
+            SELECT s.ID, s.ScheduledDate, o.ObjectName, srv.ServiceName,
+                   s.Cost as OldCost, {REPRICE_COST_SQL} as NewCost
+            FROM Schedule s
+            JOIN Service srv ON s.ServiceID = srv.ID
+            JOIN Object o ON s.ObjectID = o.ID
+            WHERE {where}
+            ORDER BY s.ScheduledDate, s.ID
+            LIMIT %s
+        ''', params + [REPRICE_PREVIEW_LIMIT])
+        rows = cursor.fetchall()
+    except mysql.connector.Error as err:
+        flash(f'Ошибка при расчёте: {err}', 'error')
+    finally:
+        cursor.close()
+
+    return render_template('reprice_schedules.html', rows=rows, summary=summary, values=values,
+                           services=services, preview_limit=REPRICE_PREVIEW_LIMIT)
+
+
+# Автоматическое назначение сотрудников на заказы без исполнителя
+ASSIGN_PREVIEW_LIMIT = 300
+ASSIGN_UPDATE_CHUNK = 1000     # ID в одном UPDATE ... WHERE ID IN (...)
+
+# Заказ для планировщика: StartMinute — минуты от начала суток (NULL, если время не задано)
+AssignmentRow = namedtuple('AssignmentRow', [
+    'ID', 'EmployeeID', 'ScheduledDate', 'StartMinute', 'Minutes', 'Status', 'ObjectName', 'ServiceName',
+])
 
-        cursor.execute('''
-            SELECT SUM(CASE WHEN sch.Status = "Выполнено" THEN sch.Cost ELSE 0 END) as total
-            FROM Schedule sch
-        ''')
-        stats['total_revenue'] = cursor.fetchone()['total'] or 0
 
+def load_assignment_rows(conn, date_from, date_to):
+    """Все неотменённые заказы периода одним запросом: и уже назначенные, и без исполнителя"""
+    cursor = conn.cursor()
+    try:
         cursor.execute('''
-            SELECT COUNT(*) as total
-            FROM Schedule
-            WHERE Status = "Выполнено"
-        ''')
-        stats['completed_orders'] = cursor.fetchone()['total'] or 0
+            SELECT s.ID, s.EmployeeID, s.ScheduledDate, TIME_TO_SEC(s.ScheduledTime) DIV 60 as StartMinute,
+                   COALESCE(s.Duration, srv.Duration, %s) as Minutes, s.Status, o.ObjectName, srv.ServiceName
+            FROM Schedule s
+            JOIN Service srv ON s.ServiceID = srv.ID
+            JOIN Object o ON s.ObjectID = o.ID
+            WHERE s.ScheduledDate >= %s AND s.ScheduledDate <= %s AND s.Status != "Отменено"
+        ''', (app.config['DEFAULT_ORDER_DURATION'], date_from, date_to))
+        return fetch_rows(cursor, AssignmentRow)
+    finally:
+        cursor.close()
+
+
+def plan_assignments(employee_ids, rows):
+    """
+    План назначения: заказы «Запланировано» без сотрудника раздаются по порядку времени,
+    каждый — наименее загруженному (по минутам работы за период) сотруднику, свободному
+    в это время. Уже назначенные заказы занимают время и входят в загрузку.
+    Сотрудники лежат в куче по загрузке, поэтому обычно выбор стоит O(log n).
+    Возвращает (план [(заказ, сотрудник)], заказы без свободного сотрудника, загрузка до плана).
+    """
+    load = dict.fromkeys(employee_ids, 0)
+    busy = defaultdict(list)   # (сотрудник, день) -> [(начало, конец)]
+    pending = []
+    for row in rows:
+        if row.EmployeeID is None:
+            if row.Status == 'Запланировано':
+                pending.append(row)
+        elif row.EmployeeID in load:
+            load[row.EmployeeID] += row.Minutes
+            if row.StartMinute is not None:
+                busy[(row.EmployeeID, row.ScheduledDate)].append((row.StartMinute, row.StartMinute + row.Minutes))
+    initial_load = dict(load)
+
+    heap = [(minutes, employee_id) for employee_id, minutes in load.items()]
+    heapq.heapify(heap)
+    plan, unassigned = [], []
+    # Заказы с временем — по порядку, без времени — в конце дня
+    pending.sort(key=lambda row: (row.ScheduledDate, row.StartMinute is None, row.StartMinute or 0, row.ID))
+    for row in pending:
+        skipped = []
+        chosen = None
+        while heap:
+            minutes, employee_id = heapq.heappop(heap)
+            intervals = busy.get((employee_id, row.ScheduledDate), ())
+            if row.StartMinute is None or all(end <= row.StartMinute or start >= row.StartMinute + row.Minutes
+                                              for start, end in intervals):
+                chosen = employee_id
+                break
+            skipped.append((minutes, employee_id))
+        for item in skipped:
+            heapq.heappush(heap, item)
+        if chosen is None:
+            unassigned.append(row)
+            continue
+        load[chosen] += row.Minutes
+        heapq.heappush(heap, (load[chosen], chosen))
+        if row.StartMinute is not None:
+            busy[(chosen, row.ScheduledDate)].append((row.StartMinute, row.StartMinute + row.Minutes))
+        plan.append((row, chosen))
+    return plan, unassigned, initial_load
+
+
+def plan_digest(plan):
+    """Отпечаток плана (пары заказ — сотрудник): POST применяет план, только если он совпал с показанным"""
+    pairs = sorted((row.ID, employee_id) for row, employee_id in plan)
+    return hashlib.sha256(';'.join(f'{order_id}:{employee_id}' for order_id, employee_id in pairs).encode()).hexdigest()
+
+
+def apply_assignments(conn, plan):
+    """
+    Записать план в одной транзакции: по одному UPDATE на сотрудника (кусками по ASSIGN_UPDATE_CHUNK).
+    Заказы, которым за это время уже назначили сотрудника вручную или которые перестали
+    быть запланированными (отменены, выполнены), не трогаются.
+    Возвращает число назначенных заказов.
+    """
+    by_employee = defaultdict(list)
+    for row, employee_id in plan:
+        by_employee[employee_id].append(row.ID)
+    chunk = ASSIGN_UPDATE_CHUNK
+    cursor = conn.cursor()
+    updated = 0
+    try:
+        for employee_id, ids in by_employee.items():
+            for i in range(0, len(ids), chunk):
+                part = ids[i:i + chunk]
+                id_list = ', '.join(['%s'] * len(part))
+                with rollup_changes(conn, f's.ID IN ({id_list})', part):
+                    cursor.execute(
+                        f'''UPDATE Schedule SET EmployeeID = %s
+                            WHERE EmployeeID IS NULL AND Status = "Запланировано" AND ID IN ({id_list})''',
+                        [employee_id] + part)
+                updated += cursor.rowcount
+        conn.commit()
+    except mysql.connector.Error:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+    touch_tables('Schedule')
+    return updated
+
+
+def assign_period(source):
+    """
+    Период плана из формы или строки запроса и признак, что он верен.
+    При неверной дате — flash и период по умолчанию (неделя с сегодняшнего дня).
+    """
+    today = date.today()
+    try:
+        date_from = date.fromisoformat(source['date_from']) if source.get('date_from') else today
+        date_to = date.fromisoformat(source['date_to']) if source.get('date_to') else date_from + timedelta(days=6)
+        if date_from > date_to:
+            raise ValueError('начало периода позже конца')
+    except ValueError:
+        flash('Неверный период: даты — ГГГГ-ММ-ДД, начало не позже конца', 'error')
+        return today.isoformat(), (today + timedelta(days=6)).isoformat(), False
+    return date_from.isoformat(), date_to.isoformat(), True
 
+
+@app.route('/schedules/assign', methods=['GET', 'POST'])
+@login_required
+def assign_schedules():
+    """
+    GET — план назначения сотрудников на заказы без исполнителя за период (без записи),
+    POST — план пересчитывается на текущих данных и записывается одной транзакцией, только если
+    он совпал с показанным (plan_digest); иначе показывается новый план для проверки.
+    """
+    date_from, date_to, valid = assign_period(request.form if request.method == 'POST' else request.args)
+    if request.method == 'POST' and not valid:
+        return redirect(url_for('assign_schedules'))
+
+    conn = get_db_connection()
+    if not conn:
+        flash('Ошибка подключения к базе данных', 'error')
+        return redirect(url_for('schedules'))
+
+    try:
+        employees = get_active_employees()
+        rows = load_assignment_rows(conn, date_from, date_to)
+        plan, unassigned, initial_load = plan_assignments([e['ID'] for e in employees.rows], rows)
+        if request.method == 'POST':
+            if request.form.get('plan_digest') != plan_digest(plan):
+                flash('С момента предпросмотра заказы или сотрудники изменились — проверьте новый план', 'error')
+                return redirect(url_for('assign_schedules', date_from=date_from, date_to=date_to))
+            updated = apply_assignments(conn, plan)
+            flash(f'Назначено заказов: {updated}', 'success')
+            if updated < len(plan):
+                flash(f'{len(plan) - updated} заказ(ов) уже получили исполнителя вручную '
+                      f'или больше не запланированы — пропущены', 'info')
+            return redirect(url_for('assign_schedules', date_from=date_from, date_to=date_to))
     except mysql.connector.Error as err:
-        flash(f'Ошибка при получении данных: {err}', 'error')
-        services = []
+        flash(f'Ошибка при назначении сотрудников: {err}', 'error')
+        employees = ReferenceData([])
+        plan, unassigned, initial_load = [], [], {}
+
+    added = defaultdict(lambda: [0, 0])   # сотрудник -> [заказов, минут] по плану
+    for row, employee_id in plan:
+        added[employee_id][0] += 1
+        added[employee_id][1] += row.Minutes
+    workload = [{
+        'name': employee['FullName'],
+        'before': initial_load.get(employee['ID'], 0),
+        'orders': added[employee['ID']][0],
+        'after': initial_load.get(employee['ID'], 0) + added[employee['ID']][1],
+    } for employee in employees.rows]
+
+    def describe(row):
+        return {'ID': row.ID, 'ScheduledDate': row.ScheduledDate, 'ObjectName': row.ObjectName,
+                'ServiceName': row.ServiceName, 'Minutes': row.Minutes,
+                'ScheduledTime': minutes_to_time(row.StartMinute) if row.StartMinute is not None else ''}
+
+    preview = [dict(describe(row), EmployeeName=employees.by_id[employee_id]['FullName'])
+               for row, employee_id in plan[:ASSIGN_PREVIEW_LIMIT]]
+    return render_template('assign_schedules.html', date_from=date_from, date_to=date_to,
+                           plan=preview, plan_total=len(plan), plan_digest=plan_digest(plan), workload=workload,
+                           unassigned=[describe(row) for row in unassigned[:ASSIGN_PREVIEW_LIMIT]],
+                           unassigned_total=len(unassigned))
+
+
+# Календарь: окно дат + сводка по дням
+CALENDAR_MAX_DAYS = 42        # месяц в сетке по неделям — не больше шести недель
+CALENDAR_MAX_ITEMS = 2000
+
+CalendarItem = namedtuple('CalendarItem', [
+    'ID', 'ScheduledDate', 'ScheduledTime', 'Minutes', 'Status', 'Cost', 'ObjectName', 'ServiceName', 'EmployeeName',
+])
+
+
+def calendar_scope(args):
+    """
+    Окно [start, end) и фильтр по сотруднику/объекту из параметров запроса.
+    Условие начинается с диапазона по ScheduledDate: с фильтром оно читается по индексу
+    (EmployeeID, ScheduledDate) или (ObjectID, ScheduledDate), без фильтра — по (ScheduledDate, ScheduledTime).
+    Возвращает (start, end, where, params); при неверных параметрах — ValueError с текстом ошибки.
+    """
+    where = ['s.ScheduledDate >= %s', 's.ScheduledDate < %s']
+    try:
+        start = date.fromisoformat(args.get('start', ''))
+        end = date.fromisoformat(args.get('end', ''))
+        params = [start, end]
+        for arg, column in (('employee_id', 's.EmployeeID'), ('object_id', 's.ObjectID')):
+            if args.get(arg):
+                where.append(f'{column} = %s')
+                params.append(int(args[arg]))
+    except ValueError:
+        raise ValueError('Неверные параметры: start, end — даты YYYY-MM-DD, employee_id и object_id — числа')
+    if not start < end <= start + timedelta(days=CALENDAR_MAX_DAYS):
+        raise ValueError(f'Окно календаря — от 1 до {CALENDAR_MAX_DAYS} дней')
+    return start, end, ' AND '.join(where), params
+
+
+@app.route('/api/schedules/calendar')
+@login_required
+def calendar_api():
+    """
+    Заказы окна ?start=YYYY-MM-DD&end=YYYY-MM-DD (end не включается), опционально
+    &employee_id= или &object_id=, и сводка по дням (заказы, сумма, минуты работы без отменённых).
+    """
+    try:
+        start, end, where, params = calendar_scope(request.args)
+    except ValueError as err:
+        return jsonify(error=str(err)), 400
+
+    conn = get_db_connection()
+    if not conn:
+        return jsonify(error='Ошибка подключения к базе данных'), 503
+
+    default_minutes = app.config['DEFAULT_ORDER_DURATION']
+    cursor = conn.cursor()
+    try:
+        cursor.execute(f'''
+            SELECT s.ScheduledDate, COUNT(*), COALESCE(SUM(s.Cost), 0),
+                   SUM(COALESCE(s.Duration, srv.Duration, %s))
+            FROM Schedule s
+            JOIN Service srv ON s.ServiceID = srv.ID
+            WHERE {where} AND s.Status != "Отменено"
+            GROUP BY s.ScheduledDate
+        ''', [default_minutes] + params)
+        days = [{'date': day.isoformat(), 'count': count, 'cost': float(cost), 'minutes': int(minutes)}
+                for day, count, cost, minutes in cursor.fetchall()]
+
+        cursor.execute(f'''
+            SELECT s.ID, s.ScheduledDate, {SCHEDULE_TIME_SQL}, COALESCE(s.Duration, srv.Duration, %s),
+                   s.Status, s.Cost, o.ObjectName, srv.ServiceName, e.FullName
+            FROM Schedule s
+            JOIN Object o ON s.ObjectID = o.ID
+            JOIN Service srv ON s.ServiceID = srv.ID
+            LEFT JOIN Employee e ON s.EmployeeID = e.ID
+            WHERE {where}
+            ORDER BY s.ScheduledDate, s.ScheduledTime, s.ID
+            LIMIT %s
+        ''', [default_minutes] + params + [CALENDAR_MAX_ITEMS + 1])
+        items = fetch_rows(cursor, CalendarItem)
+    except mysql.connector.Error as err:
+        return jsonify(error=str(err)), 500
     finally:
         cursor.close()
-        conn.close()
 
-    return render_template('report_services.html', services=services, stats=stats, current_date=datetime.now())
+    return jsonify(
+        start=start.isoformat(),
+        end=end.isoformat(),
+        days=days,
+        truncated=len(items) > CALENDAR_MAX_ITEMS,
+        items=[{
+            'id': item.ID,
+            'date': item.ScheduledDate.isoformat(),
+            'time': item.ScheduledTime,
+            'minutes': int(item.Minutes),
+            'status': item.Status,
+            'cost': float(item.Cost) if item.Cost is not None else None,
+            'object': item.ObjectName,
+            'service': item.ServiceName,
+            'employee': item.EmployeeName,
+            'url': url_for('edit_schedule', id=item.ID),
+        } for item in items[:CALENDAR_MAX_ITEMS]],
+    )
+
+
+@app.route('/schedules/calendar')
+@login_required
+def schedule_calendar():
+    """Календарь на день/неделю/месяц; данные окна подгружаются из /api/schedules/calendar"""
+    view = request.args.get('view') if request.args.get('view') in ('day', 'week', 'month') else 'week'
+    try:
+        current = date.fromisoformat(request.args.get('date', ''))
+    except ValueError:
+        current = date.today()
+
+    # Подписи выбранных в фильтре сотрудника и объекта — из справочников в памяти
+    employee_id = request.args.get('employee_id', type=int)
+    object_id = request.args.get('object_id', type=int)
+    employee = obj = None
+    try:
+        employee = get_active_employees().by_id.get(employee_id) if employee_id else None
+        obj = get_object_choices().by_id.get(object_id) if object_id else None
+    except mysql.connector.Error as err:
+        flash(f'Ошибка при получении справочников: {err}', 'error')
+    return render_template('calendar.html', view=view, current=current,
+                           employee_id=employee_id if employee else '',
+                           employee_label=employee['FullName'] if employee else '',
+                           object_id=object_id if obj else '',
+                           object_label=f"{obj['ObjectName']} ({obj['ClientName']})" if obj else '')
+
+
+# ========== REPORTS (Отчеты) ==========
+# Запросы строк отчётов — общие для HTML-страниц и выгрузки в CSV/JSONL.
+# Итоги по сущностям берутся из ScheduleRollup (фильтр по датам — по дням сводки) и
+# присоединяются через LEFT JOIN, поэтому сущности без заказов не пропадают. Статуса в сводке
+# нет: с фильтром status итоги считаются по самим заказам.
+REPORT_FILTER_ARGS = ('status', 'date_from', 'date_to')
+
+
+def report_filters(args):
+    return {key: args.get(key, '').strip() for key in REPORT_FILTER_ARGS}
+
+
+def schedule_filter_sql(filters):
+    """Условия на заказы (s.*) из фильтров отчёта: (' AND ...', params)"""
+    sql, params = '', []
+    if filters['status']:
+        sql += ' AND s.Status = %s'
+        params.append(filters['status'])
+    if filters['date_from']:
+        sql += ' AND s.ScheduledDate >= %s'
+        params.append(filters['date_from'])
+    if filters['date_to']:
+        sql += ' AND s.ScheduledDate <= %s'
+        params.append(filters['date_to'])
+    return sql, params
+
+
+def rollup_period_sql(filters):
+    """Условия на дни сводки (ScheduleRollup) из фильтров отчёта: (' AND ...', params)"""
+    sql, params = '', []
+    if filters['date_from']:
+        sql += ' AND Day >= %s'
+        params.append(filters['date_from'])
+    if filters['date_to']:
+        sql += ' AND Day <= %s'
+        params.append(filters['date_to'])
+    return sql, params
+
+
+def entity_totals_sql(entity, filters):
+    """
+    Подзапрос итогов по сущностям одного типа: EntityID, total_orders, completed_orders,
+    total_revenue, last_service_date. Возвращает (sql, params).
+    """
+    if filters['status']:
+        column, join = {name: (column, join) for name, column, join in ROLLUP_ENTITIES}[entity]
+        schedule_sql, params = schedule_filter_sql(filters)
+        return f'''
+            SELECT {column} as EntityID, COUNT(*) as total_orders,
+                   COUNT(CASE WHEN s.Status = "Выполнено" THEN 1 END) as completed_orders,
+                   COALESCE(SUM(CASE WHEN s.Status = "Выполнено" THEN s.Cost END), 0) as total_revenue,
+                   MAX(s.ScheduledDate) as last_service_date
+            FROM Schedule s {join}
+            WHERE {column} IS NOT NULL{schedule_sql}
+            GROUP BY {column}''', params
+
+    sql, params = rollup_period_sql(filters)
+    return f'''
+        SELECT EntityID, CAST(SUM(OrderCount) AS SIGNED) as total_orders,
+               CAST(SUM(CompletedCount) AS SIGNED) as completed_orders,
+               SUM(CompletedRevenue) as total_revenue,
+               MAX(CASE WHEN OrderCount > 0 THEN Day END) as last_service_date
+        FROM ScheduleRollup
+        WHERE EntityType = %s{sql}
+        GROUP BY EntityID''', [entity] + params
+
+
+def client_report_query(filters):
+    totals, params = entity_totals_sql('client', filters)
+    return f'''
+        SELECT c.ID, c.FullName, c.CompanyName, c.Phone, c.Email, c.Address,
+               (SELECT COUNT(*) FROM Object o WHERE o.ClientID = c.ID) as objects_count,
+               COALESCE(t.total_revenue, 0) as total_revenue,
+               COALESCE(t.total_orders, 0) as total_orders
+        FROM Client c
+        LEFT JOIN ({totals}) t ON t.EntityID = c.ID
+    ''', params
+
+
+def object_report_query(filters):
+    totals, params = entity_totals_sql('object', filters)
+    return f'''
+        SELECT o.ID, o.ObjectName, c.FullName as ClientName, o.Address, o.ObjectType, o.Area,
+               COALESCE(t.total_orders, 0) as total_orders,
+               COALESCE(t.total_revenue, 0) as total_revenue,
+               t.last_service_date
+        FROM Object o
+        JOIN Client c ON o.ClientID = c.ID
+        LEFT JOIN ({totals}) t ON t.EntityID = o.ID
+    ''', params
+
+
+def employee_report_query(filters):
+    totals, params = entity_totals_sql('employee', filters)
+    return f'''
+        SELECT e.ID, e.FullName, e.Position, e.Phone, e.Email, e.Salary, e.Status,
+               COALESCE(t.total_orders, 0) as total_orders,
+               COALESCE(t.total_revenue, 0) as total_revenue,
+               COALESCE(t.completed_orders, 0) as completed_orders
+        FROM Employee e
+        LEFT JOIN ({totals}) t ON t.EntityID = e.ID
+    ''', params
+
+
+def service_report_query(filters):
+    totals, params = entity_totals_sql('service', filters)
+    return f'''
+        SELECT srv.ID, srv.ServiceName, srv.Description, srv.PricePerUnit, srv.Unit, srv.Duration,
+               COALESCE(t.total_orders, 0) as total_orders,
+               COALESCE(t.total_revenue, 0) as total_revenue,
+               COALESCE(t.completed_orders, 0) as completed_orders
+        FROM Service srv
+        LEFT JOIN ({totals}) t ON t.EntityID = srv.ID
+    ''', params
+
+
+def schedule_report_query(filters):
+    schedule_sql, params = schedule_filter_sql(filters)
+    return (SCHEDULE_REPORT_SQL + ' WHERE 1=1' + schedule_sql +
+            ' ORDER BY s.ScheduledDate DESC, s.ScheduledTime DESC'), params
+
+
+# Поиск, сортировка и страницы отчётов по сущностям — те же параметры q, sort, dir, page,
+# что у списков (list_query_args). Сортировка по итогам по умолчанию — от больших к меньшим:
+# ?sort=revenue на первой странице — это топ клиентов по выручке.
+REPORT_CLIENT_LIST = {
+    'search': ['c.FullName', 'c.CompanyName', 'c.Phone'],
+    'sort': {'name': 'c.FullName', 'revenue': 'total_revenue', 'orders': 'total_orders',
+             'objects': 'objects_count', 'id': 'c.ID'},
+    'default_sort': 'name',
+    'default_dir': {'revenue': 'desc', 'orders': 'desc', 'objects': 'desc'},
+    'id_column': 'c.ID',
+}
+REPORT_OBJECT_LIST = {
+    'search': ['o.ObjectName', 'o.Address'],
+    'sort': {'name': 'o.ObjectName', 'client': 'c.FullName', 'revenue': 'total_revenue',
+             'orders': 'total_orders', 'last_service': 'last_service_date', 'id': 'o.ID'},
+    'default_sort': 'name',
+    'default_dir': {'revenue': 'desc', 'orders': 'desc', 'last_service': 'desc'},
+    'id_column': 'o.ID',
+}
+REPORT_EMPLOYEE_LIST = {
+    'search': ['e.FullName', 'e.Position', 'e.Phone'],
+    'sort': {'name': 'e.FullName', 'revenue': 'total_revenue', 'orders': 'total_orders',
+             'completed': 'completed_orders', 'id': 'e.ID'},
+    'default_sort': 'name',
+    'default_dir': {'revenue': 'desc', 'orders': 'desc', 'completed': 'desc'},
+    'id_column': 'e.ID',
+}
+REPORT_SERVICE_LIST = {
+    'search': ['srv.ServiceName'],
+    'sort': {'name': 'srv.ServiceName', 'revenue': 'total_revenue', 'orders': 'total_orders',
+             'completed': 'completed_orders', 'id': 'srv.ID'},
+    'default_sort': 'name',
+    'default_dir': {'revenue': 'desc', 'orders': 'desc', 'completed': 'desc'},
+    'id_column': 'srv.ID',
+}
+
+# Подписи сортировок для формы отчёта
+REPORT_SORT_LABELS = {
+    'name': 'По названию', 'client': 'По клиенту', 'revenue': 'По выручке', 'orders': 'По числу заказов',
+    'completed': 'По выполненным', 'objects': 'По числу объектов', 'last_service': 'По последней уборке',
+    'id': 'По ID',
+}
+
+REPORT_LISTS = {
+    'clients': REPORT_CLIENT_LIST,
+    'objects': REPORT_OBJECT_LIST,
+    'employees': REPORT_EMPLOYEE_LIST,
+    'services': REPORT_SERVICE_LIST,
+}
+
+# Все параметры, от которых зависят строки отчёта (для выгрузки и фоновых заданий)
+REPORT_QUERY_ARGS = REPORT_FILTER_ARGS + ('q', 'sort', 'dir')
+
+
+def report_sorts(name):
+    """[(ключ, подпись)] сортировок отчёта для формы"""
+    return [(key, REPORT_SORT_LABELS[key]) for key in REPORT_LISTS[name]['sort']]
+
+
+def report_query(name, args, paged=False):
+    """
+    Запрос строк отчёта name по параметрам args: фильтры заказов, поиск, сортировка и,
+    если paged, страница. Возвращает (query, params, list_args); у отчёта по заказам
+    своих сортировок нет, list_args для него None.
+    """
+    build_query, _ = REPORT_EXPORTS[name]
+    query, params = build_query(report_filters(args))
+    spec = REPORT_LISTS.get(name)
+    if spec is None:
+        return query, params, None
+    list_args = list_query_args(spec, args)
+    query, params = build_list_query(query, spec, list_args, params=params, paged=paged)
+    return query, params, list_args
+
+
+def schedule_report_stats_query(filters):
+    """
+    Сводка отчёта по расписанию одним проходом по тем же строкам, что и сам отчёт
+    (те же фильтры), — условными агрегатами вместо отдельного запроса на каждую цифру.
+    """
+    schedule_sql, params = schedule_filter_sql(filters)
+    month_start, month_end = month_bounds()
+    return f'''
+        SELECT COUNT(*) as total,
+               COUNT(CASE WHEN s.Status = "Запланировано" THEN 1 END) as scheduled,
+               COUNT(CASE WHEN s.Status = "Выполнено" THEN 1 END) as completed,
+               COUNT(CASE WHEN s.Status = "Отменено" THEN 1 END) as cancelled,
+               SUM(CASE WHEN s.Status = "Выполнено" THEN s.Cost END) as total_revenue,
+               SUM(CASE WHEN s.Status = "Выполнено" AND s.ScheduledDate >= %s AND s.ScheduledDate < %s
+                        THEN s.Cost END) as revenue_month,
+               AVG(CASE WHEN s.Status = "Выполнено" THEN s.Cost END) as avg_order_cost
+        FROM Schedule s
+        WHERE 1=1{schedule_sql}
+    ''', [month_start, month_end] + params
+
+
+app.config.update(
+    REPORT_CACHE_TTL=600,      # секунд; в своём процессе сбрасывается сразу после записи в таблицы отчёта
+    REPORT_CACHE_SIZE=32,      # не больше стольких результатов (отчёт + фильтры) в памяти
+)
+
+# Готовые результаты отчётов по сущностям: (строки, сводка, время формирования)
+report_cache = TableCache(ttl=app.config['REPORT_CACHE_TTL'], maxsize=app.config['REPORT_CACHE_SIZE'])
+REPORT_TABLES_CLIENTS = ('Client', 'Object', 'Schedule')
+REPORT_TABLES_OBJECTS = ('Object', 'Client', 'Schedule')
+REPORT_TABLES_EMPLOYEES = ('Employee', 'Schedule')
+REPORT_TABLES_SERVICES = ('Service', 'Schedule')
+
+
+def cached_report(name, tables, filters, load):
+    """
+    Результат отчёта из report_cache. Ключ — имя отчёта и непустые параметры (фильтры,
+    сортировка, страница) без учёта их порядка, поэтому одинаковые запросы с разными URL
+    попадают в одну запись.
+    load(conn) -> (строки, сводка); возвращает (строки, сводка, время формирования).
+    """
+    key = (name,) + tuple(sorted((arg, value) for arg, value in filters.items() if value))
+
+    def loader():
+        # Соединение нужно только при промахе кэша
+        conn = get_db_connection()
+        if not conn:
+            raise mysql.connector.Error('Ошибка подключения к базе данных')
+        rows, stats = load(conn)
+        return rows, stats, datetime.now()
+
+    return report_cache.get_or_load(key, tables, loader)
+
+
+@app.route('/reports')
+@login_required
+def reports():
+    """Главная страница отчетов"""
+    return render_template('reports.html', current_date=datetime.now())
+
+
+@app.route('/reports/clients')
+@login_required
+def report_clients():
+    """Отчет по клиентам"""
+    filters = report_filters(request.args)
+    query, params, list_args = report_query('clients', request.args, paged=True)
+
+    def load(conn):
+        cursor = conn.cursor(dictionary=True)
+        stats = {}
+        try:
+            # Клиенты текущей страницы с итогами за период
+            cursor.execute(query, params)
+            clients = cursor.fetchall()
+
+            # Статистика
+            cursor.execute('SELECT COUNT(*) as total FROM Client')
+            stats['total'] = cursor.fetchone()['total'] or 0
+
+            cursor.execute('SELECT COUNT(*) as total FROM Client WHERE Phone IS NOT NULL AND Phone != ""')
+            stats['with_phone'] = cursor.fetchone()['total'] or 0
+
+            cursor.execute('SELECT COUNT(*) as total FROM Client WHERE Email IS NOT NULL AND Email != ""')
+            stats['with_email'] = cursor.fetchone()['total'] or 0
+
+            cursor.execute('''
+                SELECT COUNT(DISTINCT c.ID) as total
+                FROM Client c
+                JOIN Object o ON c.ID = o.ClientID
+            ''')
+            stats['with_objects'] = cursor.fetchone()['total'] or 0
+        finally:
+            cursor.close()
+        return clients, stats
+
+    try:
+        clients, stats, generated_at = cached_report('clients', REPORT_TABLES_CLIENTS, dict(filters, **list_args), load)
+    except mysql.connector.Error as err:
+        flash(f'Ошибка при получении данных: {err}', 'error')
+        clients, stats, generated_at = [], {}, datetime.now()
+
+    return render_template('report_clients.html', clients=page_rows(clients, list_args), stats=stats,
+                           filters=filters, list_args=list_args, sorts=report_sorts('clients'),
+                           current_date=generated_at)
+
+
+@app.route('/reports/objects')
+@login_required
+def report_objects():
+    """Отчет по объектам"""
+    filters = report_filters(request.args)
+    query, params, list_args = report_query('objects', request.args, paged=True)
+
+    def load(conn):
+        cursor = conn.cursor(dictionary=True)
+        stats = {}
+        try:
+            cursor.execute(query, params)
+            objects = cursor.fetchall()
+
+            # Статистика
+            cursor.execute('SELECT COUNT(*) as total FROM Object')
+            stats['total'] = cursor.fetchone()['total'] or 0
+
+            cursor.execute('SELECT SUM(Area) as total FROM Object WHERE Area IS NOT NULL')
+            stats['total_area'] = cursor.fetchone()['total'] or 0
+
+            period_sql, period_params = rollup_period_sql(filters)
+            cursor.execute(f'''
+                SELECT COUNT(DISTINCT EntityID) as total
+                FROM ScheduleRollup
+                WHERE EntityType = 'object' AND CompletedCount > 0{period_sql}
+            ''', period_params)
+            stats['with_services'] = cursor.fetchone()['total'] or 0
+
+            cursor.execute('SELECT COUNT(DISTINCT ObjectType) as total FROM Object WHERE ObjectType IS NOT NULL')
+            stats['types_count'] = cursor.fetchone()['total'] or 0
+        finally:
+            cursor.close()
+        return objects, stats
+
+    try:
+        objects, stats, generated_at = cached_report('objects', REPORT_TABLES_OBJECTS, dict(filters, **list_args), load)
+    except mysql.connector.Error as err:
+        flash(f'Ошибка при получении данных: {err}', 'error')
+        objects, stats, generated_at = [], {}, datetime.now()
+
+    return render_template('report_objects.html', objects=page_rows(objects, list_args), stats=stats,
+                           filters=filters, list_args=list_args, sorts=report_sorts('objects'),
+                           current_date=generated_at)
+
+
+@app.route('/reports/employees')
+@login_required
+def report_employees():
+    """Отчет по сотрудникам"""
+    filters = report_filters(request.args)
+    query, params, list_args = report_query('employees', request.args, paged=True)
+
+    def load(conn):
+        cursor = conn.cursor(dictionary=True)
+        stats = {}
+        try:
+            cursor.execute(query, params)
+            employees = cursor.fetchall()
+
+            # Статистика
+            cursor.execute('SELECT COUNT(*) as total FROM Employee')
+            stats['total'] = cursor.fetchone()['total'] or 0
+
+            cursor.execute('SELECT COUNT(*) as total FROM Employee WHERE Status = "Активен"')
+            stats['active'] = cursor.fetchone()['total'] or 0
+
+            cursor.execute('SELECT COUNT(*) as total FROM Employee WHERE Status = "Неактивен"')
+            stats['inactive'] = cursor.fetchone()['total'] or 0
+
+            cursor.execute('SELECT AVG(Salary) as avg FROM Employee WHERE Salary IS NOT NULL AND Status = "Активен"')
+            result = cursor.fetchone()
+            stats['avg_salary'] = result['avg'] if result['avg'] else 0
+
+            cursor.execute('SELECT SUM(Salary) as total FROM Employee WHERE Status = "Активен"')
+            stats['total_salary'] = cursor.fetchone()['total'] or 0
+        finally:
+            cursor.close()
+        return employees, stats
+
+    try:
+        employees, stats, generated_at = cached_report('employees', REPORT_TABLES_EMPLOYEES, dict(filters, **list_args), load)
+    except mysql.connector.Error as err:
+        flash(f'Ошибка при получении данных: {err}', 'error')
+        employees, stats, generated_at = [], {}, datetime.now()
+
+    return render_template('report_employees.html', employees=page_rows(employees, list_args), stats=stats,
+                           filters=filters, list_args=list_args, sorts=report_sorts('employees'),
+                           current_date=generated_at)
+
+
+@app.route('/reports/services')
+@login_required
+def report_services():
+    """Отчет по услугам"""
+    filters = report_filters(request.args)
+    query, params, list_args = report_query('services', request.args, paged=True)
+
+    def load(conn):
+        cursor = conn.cursor(dictionary=True)
+        stats = {}
+        try:
+            cursor.execute(query, params)
+            services = cursor.fetchall()
+
+            # Статистика
+            cursor.execute('SELECT COUNT(*) as total FROM Service')
+            stats['total'] = cursor.fetchone()['total'] or 0
+
+            cursor.execute('SELECT AVG(PricePerUnit) as avg FROM Service WHERE PricePerUnit IS NOT NULL')
+            result = cursor.fetchone()
+            stats['avg_price'] = result['avg'] if result['avg'] else 0
+
+            # Выручка и выполненные заказы за период — из сводки по услугам
+            period_sql, period_params = rollup_period_sql(filters)
+            cursor.execute(f'''
+                SELECT SUM(CompletedRevenue) as total_revenue, SUM(CompletedCount) as completed_orders
+                FROM ScheduleRollup
+                WHERE EntityType = 'service'{period_sql}
+            ''', period_params)
+            result = cursor.fetchone()
+            stats['total_revenue'] = result['total_revenue'] or 0
+            stats['completed_orders'] = int(result['completed_orders'] or 0)
+        finally:
+            cursor.close()
+        return services, stats
+
+    try:
+        services, stats, generated_at = cached_report('services', REPORT_TABLES_SERVICES, dict(filters, **list_args), load)
+    except mysql.connector.Error as err:
+        flash(f'Ошибка при получении данных: {err}', 'error')
+        services, stats, generated_at = [], {}, datetime.now()
+
+    return render_template('report_services.html', services=page_rows(services, list_args), stats=stats,
+                           filters=filters, list_args=list_args, sorts=report_sorts('services'),
+                           current_date=generated_at)
 
 
 @app.route('/reports/schedules')
@@ -1361,108 +3876,979 @@ def report_schedules():
         flash('Ошибка подключения к базе данных', 'error')
         return render_template('report_schedules.html', schedules=[], stats={})
 
-    # Получаем параметры фильтрации
-    status_filter = request.args.get('status', '')
-    date_from = request.args.get('date_from', '')
-    date_to = request.args.get('date_to', '')
+    # Параметры фильтрации
+    filters = report_filters(request.args)
+    status_filter, date_from, date_to = filters['status'], filters['date_from'], filters['date_to']
+    query, params = schedule_report_query(filters)
 
     cursor = conn.cursor(dictionary=True)
     stats = {}
+    schedules = []
     try:
-        # Базовый запрос
-        query = '''
-            SELECT s.*, o.ObjectName, o.Address as ObjectAddress,
-                   c.FullName as ClientName, c.Phone as ClientPhone,
-                   e.FullName as EmployeeName, srv.ServiceName, srv.PricePerUnit
-            FROM Schedule s
-            JOIN Object o ON s.ObjectID = o.ID
-            JOIN Client c ON o.ClientID = c.ID
-            JOIN Service srv ON s.ServiceID = srv.ID
-            LEFT JOIN Employee e ON s.EmployeeID = e.ID
-            WHERE 1=1
-        '''
-        params = []
-
-        if status_filter:
-            query += ' AND s.Status = %s'
-            params.append(status_filter)
+        # Статистика — до строк: пока строки читаются потоком, соединение занято
+        cursor.execute(*schedule_report_stats_query(filters))
+        stats = {key: value or 0 for key, value in cursor.fetchone().items()}
+        cursor.close()
 
-        if date_from:
-            query += ' AND s.ScheduledDate >= %s'
-            params.append(date_from)
+        # Строки отчёта идут в страницу потоком, не собираясь в список
+        schedules = stream_rows(conn, query, params, row_type=ScheduleReportRow)
+    except mysql.connector.Error as err:
+        flash(f'Ошибка при получении данных: {err}', 'error')
+        cursor.close()
 
-        if date_to:
-            query += ' AND s.ScheduledDate <= %s'
-            params.append(date_to)
+    return stream_page('report_schedules.html', schedules=schedules, stats=stats,
+                       status_filter=status_filter, date_from=date_from, date_to=date_to, current_date=datetime.now())
+
+
+# ========== АНАЛИТИКА (ряды по дням, неделям, месяцам) ==========
+# Ряды строятся по дневным итогам из ScheduleRollup одним запросом; разбивка по периодам,
+# скользящее среднее и изменение к предыдущему периоду считаются массивами NumPy.
+app.config.update(
+    ANALYTICS_MAX_DAYS=5 * 366,     # самое длинное окно
+    ANALYTICS_MAX_SERIES=8,         # в разрезе — столько сущностей с наибольшей выручкой, остальные в «Прочие»
+)
+
+ANALYTICS_GRANULARITIES = ('day', 'week', 'month')
+ANALYTICS_DEFAULT_WINDOW = {'day': 7, 'week': 4, 'month': 3}   # периодов в скользящем среднем
+
+# Разрез -> (таблица, столбец названия, таблицы, от которых зависит кэш ряда). Без разреза
+# итоги берутся из сводки по услугам: у каждого заказа ровно одна услуга, поэтому сумма
+# по услугам за день — итог дня. Клиент заказа определяется через объект: перенос объекта
+# к другому клиенту меняет только Object, поэтому ряд по клиентам зависит и от него.
+ANALYTICS_SLICES = {
+    'service': ('Service', 'ServiceName', ('Service',)),
+    'employee': ('Employee', 'FullName', ('Employee',)),
+    'client': ('Client', 'FullName', ('Object', 'Client')),
+}
 
-        query += ' ORDER BY s.ScheduledDate DESC, s.ScheduledTime DESC'
 
+def analytics_scope(args):
+    """
+    Параметры ряда из строки запроса: granularity, date_from, date_to (включительно),
+    slice, id, window. По умолчанию — помесячно за последние 12 месяцев.
+    ValueError с текстом ошибки, если параметры неверны.
+    """
+    granularity = args.get('granularity') or 'month'
+    if granularity not in ANALYTICS_GRANULARITIES:
+        raise ValueError('granularity: day, week или month')
+    date_to = date.fromisoformat(args['date_to']) if args.get('date_to') else date.today()
+    if args.get('date_from'):
+        date_from = date.fromisoformat(args['date_from'])
+    else:
+        # 12 месяцев, включая текущий
+        first = month_bounds(date_to)[0]
+        if first.month == 12:
+            date_from = first.replace(month=1)
+        else:
+            date_from = first.replace(year=first.year - 1, month=first.month + 1)
+    if not date_from <= date_to or (date_to - date_from).days >= app.config['ANALYTICS_MAX_DAYS']:
+        raise ValueError(f'Период — от 1 до {app.config["ANALYTICS_MAX_DAYS"]} дней')
+    slice_by = args.get('slice') or None
+    if slice_by and slice_by not in ANALYTICS_SLICES:
+        raise ValueError('slice: service, employee или client')
+    entity_id = int(args['id']) if slice_by and args.get('id') else None
+    window = int(args.get('window') or ANALYTICS_DEFAULT_WINDOW[granularity])
+    if window < 1:
+        raise ValueError('window — целое число от 1')
+    return {'granularity': granularity, 'date_from': date_from, 'date_to': date_to,
+            'slice': slice_by, 'id': entity_id, 'window': window}
+
+
+def load_analytics_days(conn, scope):
+    """
+    Дневные итоги окна одним запросом по индексу (EntityType, Day, ...):
+    (дни, ID сущностей, заказы, выполнено, выручка) массивами NumPy. Без разреза ID — 0.
+    """
+    params = [scope['slice'] or 'service', scope['date_from'], scope['date_to']]
+    if scope['slice']:
+        query = '''SELECT Day, EntityID, OrderCount, CompletedCount, CompletedRevenue
+                   FROM ScheduleRollup
+                   WHERE EntityType = %s AND Day >= %s AND Day <= %s'''
+        if scope['id']:
+            query += ' AND EntityID = %s'
+            params.append(scope['id'])
+    else:
+        query = '''SELECT Day, 0, SUM(OrderCount), SUM(CompletedCount), SUM(CompletedRevenue)
+                   FROM ScheduleRollup
+                   WHERE EntityType = %s AND Day >= %s AND Day <= %s
+                   GROUP BY Day'''
+    cursor = conn.cursor()
+    try:
         cursor.execute(query, params)
-        schedules = cursor.fetchall()
+        rows = cursor.fetchall()
+    finally:
+        cursor.close()
+    columns = list(zip(*rows)) or [()] * 5
+    return (np.array(columns[0], dtype='datetime64[D]'), np.array(columns[1], dtype='int64'),
+            np.array(columns[2], dtype=float), np.array(columns[3], dtype=float),
+            np.array(columns[4], dtype=float))
+
+
+def period_keys(days, granularity):
+    """Номер периода для каждого дня (массив datetime64[D])"""
+    if granularity == 'week':
+        # 1970-01-01 — четверг, сдвиг на 3 дня даёт недели с понедельника
+        return (days.astype('int64') + 3) // 7
+    if granularity == 'month':
+        return days.astype('datetime64[M]').astype('int64')
+    return days.astype('int64')
+
+
+def period_starts(keys, granularity):
+    """Первый день каждого периода по его номеру"""
+    if granularity == 'week':
+        return (keys * 7 - 3).astype('datetime64[D]')
+    if granularity == 'month':
+        return keys.astype('datetime64[M]').astype('datetime64[D]')
+    return keys.astype('datetime64[D]')
+
+
+def moving_average(values, window):
+    """Скользящее среднее по window периодам; у первых window-1 периодов — nan"""
+    result = np.full(values.shape, np.nan)
+    if len(values) >= window:
+        sums = np.cumsum(np.insert(values, 0, 0.0))
+        result[window - 1:] = (sums[window:] - sums[:-window]) / window
+    return result
+
+
+def period_change(values):
+    """Изменение к предыдущему периоду (доля); nan, если в предыдущем периоде был ноль"""
+    result = np.full(values.shape, np.nan)
+    previous = values[:-1]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        result[1:] = np.where(previous != 0, values[1:] / previous - 1, np.nan)
+    return result
+
+
+def json_floats(values, digits=2):
+    """Массив -> список для JSON, nan -> None"""
+    return np.where(np.isnan(values), None, np.round(values, digits)).tolist()
+
+
+def series_view(orders, completed, revenue, window):
+    """Ряды одной сущности (или итога) по периодам и их суммы за окно"""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        avg_cost = np.where(completed > 0, revenue / completed, np.nan)
+    total_completed = completed.sum()
+    return {
+        'orders': orders.astype(int).tolist(),
+        'completed': completed.astype(int).tolist(),
+        'revenue': json_floats(revenue),
+        'avg_cost': json_floats(avg_cost),
+        'orders_ma': json_floats(moving_average(orders, window)),
+        'revenue_ma': json_floats(moving_average(revenue, window)),
+        'revenue_change': json_floats(period_change(revenue), 4),
+        'totals': {
+            'orders': int(orders.sum()),
+            'completed': int(total_completed),
+            'revenue': round(float(revenue.sum()), 2),
+            'avg_cost': round(float(revenue.sum() / total_completed), 2) if total_completed else None,
+        },
+    }
+
+
+def build_analytics(conn, scope):
+    """Ответ /api/analytics: периоды, итоговый ряд и (в разрезе) ряды сущностей"""
+    granularity = scope['granularity']
+    days, ids, orders, completed, revenue = load_analytics_days(conn, scope)
+
+    bounds = np.array([scope['date_from'], scope['date_to']], dtype='datetime64[D]')
+    first, last = period_keys(bounds, granularity)
+    keys = np.arange(first, last + 1)
+    column = period_keys(days, granularity) - first
+
+    # Матрицы сущность x период: np.add.at складывает дни одного периода
+    entity_ids, row = np.unique(ids, return_inverse=True)
+    shape = (len(entity_ids), len(keys))
+    matrices = []
+    for values in (orders, completed, revenue):
+        matrix = np.zeros(shape)
+        np.add.at(matrix, (row.ravel(), column), values)
+        matrices.append(matrix)
+
+    window = scope['window']
+    result = {
+        'granularity': granularity,
+        'date_from': scope['date_from'].isoformat(),
+        'date_to': scope['date_to'].isoformat(),
+        'slice': scope['slice'],
+        'window': window,
+        'periods': [str(day) for day in period_starts(keys, granularity)],
+        'total': series_view(*(matrix.sum(axis=0) for matrix in matrices), window),
+        'series': [],
+    }
+    if not scope['slice'] or not len(entity_ids):
+        return result
+
+    order = np.argsort(-matrices[2].sum(axis=1), kind='stable')
+    top, rest = order[:app.config['ANALYTICS_MAX_SERIES']], order[app.config['ANALYTICS_MAX_SERIES']:]
+    top_ids = [int(entity_id) for entity_id in entity_ids[top]]
+    table, name_column, _ = ANALYTICS_SLICES[scope['slice']]
+    cursor = conn.cursor()
+    try:
+        cursor.execute(f'''SELECT ID, {name_column} FROM {table}
+                           WHERE ID IN ({', '.join(['%s'] * len(top_ids))})''', top_ids)
+        names = dict(cursor.fetchall())
+    finally:
+        cursor.close()
 
-        # Конвертируем timedelta в строку времени для каждого расписания
-        for schedule in schedules:
-            if schedule.get('ScheduledTime') and isinstance(schedule['ScheduledTime'], timedelta):
-                # Конвертируем timedelta в строку формата HH:MM
-                total_seconds = int(schedule['ScheduledTime'].total_seconds())
-                hours = total_seconds // 3600
-                minutes = (total_seconds % 3600) // 60
-                schedule['ScheduledTime'] = f"{hours:02d}:{minutes:02d}"
+    for index, entity_id in zip(top, top_ids):
+        series = series_view(*(matrix[index] for matrix in matrices), window)
+        series.update(id=entity_id, name=names.get(entity_id, f'#{entity_id}'))
+        result['series'].append(series)
+    if len(rest):
+        series = series_view(*(matrix[rest].sum(axis=0) for matrix in matrices), window)
+        series.update(id=None, name=f'Прочие ({len(rest)})')
+        result['series'].append(series)
+    return result
 
-        # Статистика
-        cursor.execute('SELECT COUNT(*) as total FROM Schedule')
-        stats['total'] = cursor.fetchone()['total'] or 0
 
-        cursor.execute('SELECT COUNT(*) as total FROM Schedule WHERE Status = "Запланировано"')
-        stats['scheduled'] = cursor.fetchone()['total'] or 0
+@app.route('/api/analytics')
+@login_required
+def analytics_api():
+    """
+    Ряды заказов, выполненных заказов, выручки и средней стоимости:
+    ?granularity=day|week|month&date_from=&date_to=&slice=service|employee|client&id=&window=
+    """
+    try:
+        scope = analytics_scope(request.args)
+    except ValueError as err:
+        return jsonify(error=str(err) or 'Неверные параметры'), 400
 
-        cursor.execute('SELECT COUNT(*) as total FROM Schedule WHERE Status = "Выполнено"')
-        stats['completed'] = cursor.fetchone()['total'] or 0
+    tables = ('Schedule',) + (ANALYTICS_SLICES[scope['slice']][2] if scope['slice'] else ())
+    key = ('analytics',) + tuple(sorted((name, str(value)) for name, value in scope.items()))
 
-        cursor.execute('SELECT COUNT(*) as total FROM Schedule WHERE Status = "Отменено"')
-        stats['cancelled'] = cursor.fetchone()['total'] or 0
+    def loader():
+        conn = get_db_connection()
+        if not conn:
+            raise mysql.connector.Error('Ошибка подключения к базе данных')
+        return build_analytics(conn, scope)
 
-        cursor.execute('''
-            SELECT SUM(Cost) as total
-            FROM Schedule
-            WHERE Status = "Выполнено"
-        ''')
-        stats['total_revenue'] = cursor.fetchone()['total'] or 0
+    try:
+        result = report_cache.get_or_load(key, tables, loader)
+    except mysql.connector.Error as err:
+        return jsonify(error=str(err)), 500
+    return jsonify(result)
 
-        cursor.execute('''
-            SELECT SUM(Cost) as total
-            FROM Schedule
-            WHERE Status = "Выполнено"
-            AND MONTH(ScheduledDate) = MONTH(CURDATE())
-            AND YEAR(ScheduledDate) = YEAR(CURDATE())
-        ''')
-        stats['revenue_month'] = cursor.fetchone()['total'] or 0
 
-        cursor.execute('''
-            SELECT AVG(Cost) as avg
-            FROM Schedule
-            WHERE Status = "Выполнено" AND Cost IS NOT NULL
-        ''')
-        result = cursor.fetchone()
-        stats['avg_order_cost'] = result['avg'] if result['avg'] else 0
+@app.route('/analytics')
+@login_required
+def analytics():
+    """Графики по периодам; данные подгружаются из /api/analytics"""
+    try:
+        scope = analytics_scope(request.args)
+    except ValueError as err:
+        flash(str(err) or 'Неверные параметры', 'error')
+        scope = analytics_scope({})
+    return render_template('analytics.html', scope=scope, slices=ANALYTICS_SLICES)
+
+
+# ========== ВЫГРУЗКА ОТЧЁТОВ (CSV / JSON Lines) ==========
+app.config.update(
+    EXPORT_CSV_DELIMITER=';',   # так CSV открывается в Excel с русской локалью без мастера импорта
+)
+
+# Отчёт -> (запрос строк, [(столбец, заголовок CSV)])
+REPORT_EXPORTS = {
+    'clients': (client_report_query, [
+        ('ID', 'ID'), ('FullName', 'ФИО'), ('CompanyName', 'Компания'), ('Phone', 'Телефон'),
+        ('Email', 'Email'), ('Address', 'Адрес'), ('objects_count', 'Объектов'),
+        ('total_orders', 'Заказов'), ('total_revenue', 'Выручка'),
+    ]),
+    'objects': (object_report_query, [
+        ('ID', 'ID'), ('ObjectName', 'Объект'), ('ClientName', 'Клиент'), ('Address', 'Адрес'),
+        ('ObjectType', 'Тип'), ('Area', 'Площадь'), ('total_orders', 'Заказов'),
+        ('total_revenue', 'Выручка'), ('last_service_date', 'Последняя уборка'),
+    ]),
+    'employees': (employee_report_query, [
+        ('ID', 'ID'), ('FullName', 'ФИО'), ('Position', 'Должность'), ('Phone', 'Телефон'),
+        ('Email', 'Email'), ('Salary', 'Зарплата'), ('Status', 'Статус'), ('total_orders', 'Заказов'),
+        ('completed_orders', 'Выполнено'), ('total_revenue', 'Выручка'),
+    ]),
+    'services': (service_report_query, [
+        ('ID', 'ID'), ('ServiceName', 'Услуга'), ('Description', 'Описание'), ('PricePerUnit', 'Цена'),
+        ('Unit', 'Единица'), ('Duration', 'Длительность, мин'), ('total_orders', 'Заказов'),
+        ('completed_orders', 'Выполнено'), ('total_revenue', 'Выручка'),
+    ]),
+    'schedules': (schedule_report_query, [
+        ('ID', 'ID'), ('ScheduledDate', 'Дата'), ('ScheduledTime', 'Время'), ('Status', 'Статус'),
+        ('ObjectName', 'Объект'), ('ObjectAddress', 'Адрес'), ('ClientName', 'Клиент'),
+        ('ClientPhone', 'Телефон клиента'), ('ServiceName', 'Услуга'), ('EmployeeName', 'Сотрудник'),
+        ('Cost', 'Стоимость'),
+    ]),
+}
 
+EXPORT_FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'jsonl': 'application/x-ndjson; charset=utf-8',
+}
+
+
+def export_value(value):
+    """Decimal, даты -> строка; None остаётся None"""
+    if value is None or isinstance(value, (str, int, float)):
+        return value
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return str(value)
+
+
+def export_chunks(rows, fmt, columns):
+    """
+    Строки отчёта -> куски текста CSV/JSONL размером около STREAM_FLUSH_BYTES.
+    Строки приходят из stream_rows, поэтому память не зависит от размера выгрузки.
+    """
+    flush_bytes = app.config['STREAM_FLUSH_BYTES']
+    keys = [key for key, _ in columns]
+    buffer = io.StringIO()
+    if fmt == 'csv':
+        writer = csv.writer(buffer, delimiter=app.config['EXPORT_CSV_DELIMITER'])
+        buffer.write('\ufeff')   # BOM: Excel иначе читает UTF-8 как cp1251
+        writer.writerow([title for _, title in columns])
+        write = lambda row: writer.writerow([export_value(row[key]) for key in keys])
+    else:
+        write = lambda row: buffer.write(
+            json.dumps({key: export_value(row[key]) for key in keys}, ensure_ascii=False) + '\n')
+
+    for row in rows:
+        write(row)
+        if buffer.tell() >= flush_bytes:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+@app.route('/reports/<name>/export.<fmt>')
+@login_required
+def export_report(name, fmt):
+    """Выгрузка всех строк отчёта с теми же фильтрами, поиском и сортировкой, что и на странице"""
+    if name not in REPORT_EXPORTS or fmt not in EXPORT_FORMATS:
+        flash('Неизвестный отчёт или формат выгрузки', 'error')
+        return redirect(url_for('reports'))
+
+    conn = get_db_connection()
+    if not conn:
+        flash('Ошибка подключения к базе данных', 'error')
+        return redirect(url_for('reports'))
+
+    _, columns = REPORT_EXPORTS[name]
+    query, params, _ = report_query(name, request.args)
+    try:
+        rows = stream_rows(conn, query, params)
     except mysql.connector.Error as err:
-        flash(f'Ошибка при получении данных: {err}', 'error')
-        schedules = []
+        flash(f'Ошибка при выгрузке отчёта: {err}', 'error')
+        return redirect(url_for('reports'))
+
+    filename = f'{name}_{date.today().isoformat()}.{fmt}'
+    # stream_with_context: соединение вернётся в пул только после отдачи последней строки
+    return Response(stream_with_context(export_chunks(rows, fmt, columns)), content_type=EXPORT_FORMATS[fmt],
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+
+
+# ========== ФОНОВЫЕ ЗАДАНИЯ (выгрузки отчётов) ==========
+# Большая выгрузка занимает рабочий процесс на всё время чтения. Вместо этого её можно поставить
+# в очередь: задание пишется в ReportJob, выполняется пулом потоков, пишет файл в REPORT_JOB_DIR
+# и отмечает прогресс; готовый файл скачивается со страницы /jobs.
+# Очередь — сама таблица ReportJob: любой рабочий процесс со свободным потоком забирает задания
+# (queued -> running), поэтому ограничения по отчётам действуют на все процессы вместе, а задания
+# перезапущенного процесса подхватывают остальные. Процесс ищет задания, когда ставит новое,
+# когда у него завершается задание, при старте и при открытии страницы /jobs.
+app.config.update(
+    REPORT_JOB_WORKERS=4,                 # потоков для заданий в одном процессе
+    REPORT_JOB_LIMITS={'schedules': 1},   # одновременно выполняемых заданий по типу (отчёту) во всех процессах
+    REPORT_JOB_DEFAULT_LIMIT=2,           # ... для отчётов, которых нет в REPORT_JOB_LIMITS
+    REPORT_JOB_MAX_ACTIVE=3,              # незавершённых заданий у одного пользователя
+    REPORT_JOB_RETENTION=24 * 3600,       # сколько хранится готовый файл, секунд
+    REPORT_JOB_STALE_AFTER=30 * 60,       # выполняющееся задание без отметки прогресса дольше этого считается прерванным
+    REPORT_JOB_PROGRESS_ROWS=5000,        # как часто записывать прогресс и проверять отмену
+    REPORT_JOB_DIR=os.path.join(app.instance_path, 'report_jobs'),
+)
+
+JOB_STATUS_LABELS = {
+    'queued': 'В очереди',
+    'running': 'Выполняется',
+    'done': 'Готово',
+    'failed': 'Ошибка',
+    'cancelled': 'Отменено',
+    'expired': 'Файл удалён по сроку',
+}
+JOB_ACTIVE_STATUSES = ('queued', 'running')
+
+# Пул потоков этого процесса и число занятых в нём потоков
+_job_executor = None
+_job_lock = threading.Lock()
+_job_threads = 0
+
+
+class JobCancelled(Exception):
+    pass
+
+
+def get_job_executor():
+    """Пул потоков создаётся при первом задании, как и пул соединений"""
+    global _job_executor
+    if _job_executor is None:
+        with _job_lock:
+            if _job_executor is None:
+                _job_executor = ThreadPoolExecutor(max_workers=app.config['REPORT_JOB_WORKERS'],
+                                                   thread_name_prefix='report-job')
+    return _job_executor
+
+
+def job_limit(job_type):
+    return app.config['REPORT_JOB_LIMITS'].get(job_type, app.config['REPORT_JOB_DEFAULT_LIMIT'])
+
+
+def claim_jobs(conn, slots):
+    """
+    Забрать из очереди до slots заданий, у отчёта которых есть свободное место во всех процессах:
+    queued -> running. Процессы забирают задания по очереди под именованной блокировкой MySQL,
+    иначе два процесса могли бы одновременно насчитать свободное место. Задания без отметки
+    прогресса дольше REPORT_JOB_STALE_AFTER место не занимают. Возвращает [ID задания].
+    """
+    claimed = []
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT GET_LOCK(CONCAT(DATABASE(), '.report_jobs'), 5)")
+        if not cursor.fetchone()[0]:
+            return claimed
+        try:
+            conn.commit()   # читать счётчики уже после того, как блокировку отпустил другой процесс
+            cursor.execute('''SELECT JobType, COUNT(*) FROM ReportJob
+                              WHERE Status = 'running' AND UpdatedAt >= NOW() - INTERVAL %s SECOND
+                              GROUP BY JobType''', (app.config['REPORT_JOB_STALE_AFTER'],))
+            running = defaultdict(int, cursor.fetchall())
+            cursor.execute("SELECT ID, JobType FROM ReportJob WHERE Status = 'queued' ORDER BY ID")
+            for job_id, job_type in cursor.fetchall():
+                if len(claimed) >= slots:
+                    break
+                if running[job_type] >= job_limit(job_type):
+                    continue
+                cursor.execute('''UPDATE ReportJob SET Status = 'running', StartedAt = NOW(), UpdatedAt = NOW()
+                                  WHERE ID = %s AND Status = 'queued' ''', (job_id,))
+                if cursor.rowcount:    # иначе отменено, пока ждало в очереди
+                    running[job_type] += 1
+                    claimed.append(job_id)
+            conn.commit()
+        except mysql.connector.Error:
+            conn.rollback()
+            raise
+        finally:
+            cursor.execute("SELECT RELEASE_LOCK(CONCAT(DATABASE(), '.report_jobs'))")
+            cursor.fetchone()
+        return claimed
+    finally:
+        cursor.close()
+
+
+def dispatch_jobs():
+    """Забрать из очереди задания для свободных потоков этого процесса и запустить их"""
+    global _job_threads
+    with _job_lock:
+        slots = app.config['REPORT_JOB_WORKERS'] - _job_threads
+        if slots <= 0:
+            return
+        _job_threads += slots    # занимаем потоки заранее, лишние вернём ниже
+
+    claimed = []
+    pool = get_pool()
+    conn = None
+    try:
+        conn = pool.acquire()
+        claimed = claim_jobs(conn, slots)
+    except mysql.connector.Error as err:
+        # Задания остаются в очереди — их заберёт следующий вызов в любом процессе
+        print(f'Очередь выгрузок: {err}')
+    finally:
+        if conn is not None:
+            pool.release(conn)
+        with _job_lock:
+            _job_threads -= slots - len(claimed)
+    for job_id in claimed:
+        get_job_executor().submit(run_job, job_id)
+
+
+def run_job(job_id):
+    global _job_threads
+    try:
+        execute_job(job_id)
+    except Exception:
+        traceback.print_exc()
+    finally:
+        with _job_lock:
+            _job_threads -= 1
+        dispatch_jobs()
+
+
+def report_job_stats():
+    with _job_lock:
+        return {'threads_busy': _job_threads, 'threads': app.config['REPORT_JOB_WORKERS']}
+
+
+def job_file_path(job_id, fmt):
+    return os.path.join(app.config['REPORT_JOB_DIR'], f'{job_id}.{fmt}')
+
+
+def execute_job(job_id):
+    """
+    Выполнить задание, уже взятое из очереди (claim_jobs): посчитать строки, записать файл
+    через export_chunks и отметить результат. Работает вне запроса, поэтому соединения берёт
+    из пула сам: одно для чтения отчёта потоком, второе для прогресса и проверки отмены.
+    Если соединение не получено, задание остаётся running без отметок прогресса и через
+    REPORT_JOB_STALE_AFTER помечается прерванным (purge_jobs).
+    """
+    pool = get_pool()
+    conn = None
+    data_conn = None
+    part_path = None
+    cursor = None
+    try:
+        conn = pool.acquire()
+        cursor = conn.cursor()
+        cursor.execute('SELECT JobType, Format, Params FROM ReportJob WHERE ID = %s', (job_id,))
+        job_type, fmt, job_params = cursor.fetchone()
+        _, columns = REPORT_EXPORTS[job_type]
+        query, params, _ = report_query(job_type, json.loads(job_params))
+
+        cursor.execute(f'SELECT COUNT(*) FROM ({query}) t', params)
+        total = cursor.fetchone()[0]
+        cursor.execute('UPDATE ReportJob SET RowsTotal = %s, UpdatedAt = NOW() WHERE ID = %s', (total, job_id))
+        conn.commit()
+
+        def progress(done):
+            cursor.execute('UPDATE ReportJob SET RowsDone = %s, UpdatedAt = NOW() WHERE ID = %s', (done, job_id))
+            conn.commit()
+            cursor.execute('SELECT CancelRequested FROM ReportJob WHERE ID = %s', (job_id,))
+            if cursor.fetchone()[0]:
+                raise JobCancelled()
+
+        def counted(rows):
+            every = app.config['REPORT_JOB_PROGRESS_ROWS']
+            done = 0
+            for done, row in enumerate(rows, 1):
+                yield row
+                if done % every == 0:
+                    progress(done)
+            progress(done)
+
+        os.makedirs(app.config['REPORT_JOB_DIR'], exist_ok=True)
+        path = job_file_path(job_id, fmt)
+        part_path = path + '.part'
+        data_conn = pool.acquire()
+        rows = stream_rows(data_conn, query, params)
+        try:
+            with open(part_path, 'w', encoding='utf-8', newline='') as out:
+                for chunk in export_chunks(counted(rows), fmt, columns):
+                    out.write(chunk)
+        finally:
+            rows.close()
+        os.replace(part_path, path)
+        part_path = None
+
+        cursor.execute('''UPDATE ReportJob SET Status = 'done', FinishedAt = NOW(),
+                                 ExpiresAt = NOW() + INTERVAL %s SECOND, FileName = %s
+                          WHERE ID = %s''',
+                       (app.config['REPORT_JOB_RETENTION'], os.path.basename(path), job_id))
+        conn.commit()
+    except JobCancelled:
+        conn.rollback()
+        cursor.execute('''UPDATE ReportJob SET Status = 'cancelled', FinishedAt = NOW() WHERE ID = %s''', (job_id,))
+        conn.commit()
+    except Exception as err:
+        if cursor is not None:
+            conn.rollback()
+            cursor.execute('''UPDATE ReportJob SET Status = 'failed', FinishedAt = NOW(), Error = %s WHERE ID = %s''',
+                           (str(err)[:1000], job_id))
+            conn.commit()
+        raise
+    finally:
+        if cursor is not None:
+            cursor.close()
+        if part_path and os.path.exists(part_path):
+            os.remove(part_path)
+        if data_conn is not None:
+            pool.release(data_conn)
+        if conn is not None:
+            pool.release(conn)
+
+
+def purge_jobs(conn):
+    """
+    Удалить файлы заданий с истёкшим сроком хранения и пометить прерванными выполняющиеся задания,
+    которые дольше REPORT_JOB_STALE_AFTER не отмечали прогресс (процесс, выполнявший их, перезапущен).
+    Задания в очереди не трогаем — их заберёт любой процесс.
+    """
+    cursor = conn.cursor()
+    try:
+        cursor.execute('''SELECT ID, FileName FROM ReportJob
+                          WHERE Status = 'done' AND ExpiresAt < NOW() FOR UPDATE''')
+        expired = cursor.fetchall()
+        for _, file_name in expired:
+            path = os.path.join(app.config['REPORT_JOB_DIR'], file_name)
+            if os.path.exists(path):
+                os.remove(path)
+        if expired:
+            cursor.execute(f'''UPDATE ReportJob SET Status = 'expired', FileName = NULL
+                               WHERE ID IN ({', '.join(['%s'] * len(expired))})''',
+                           [job_id for job_id, _ in expired])
+        cursor.execute('''UPDATE ReportJob SET Status = 'failed', FinishedAt = NOW(),
+                                 Error = 'Задание прервано перезапуском сервера'
+                          WHERE Status = 'running'
+                            AND COALESCE(UpdatedAt, StartedAt, CreatedAt) < NOW() - INTERVAL %s SECOND''',
+                       (app.config['REPORT_JOB_STALE_AFTER'],))
+        conn.commit()
+    except mysql.connector.Error:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+def job_view(job):
+    """Строка ReportJob -> словарь для страницы и JSON"""
+    total, done = job['RowsTotal'], job['RowsDone']
+    return {
+        'id': job['ID'],
+        'report': job['JobType'],
+        'format': job['Format'],
+        'status': job['Status'],
+        'status_label': JOB_STATUS_LABELS.get(job['Status'], job['Status']),
+        'rows_done': done,
+        'rows_total': total,
+        'percent': 100 if job['Status'] == 'done' else (min(99, done * 100 // total) if total else 0),
+        'created_at': job['CreatedAt'],
+        'finished_at': job['FinishedAt'],
+        'expires_at': job['ExpiresAt'],
+        'error': job['Error'],
+        'filters': json.loads(job['Params']),
+        'download_url': url_for('download_report_job', id=job['ID']) if job['Status'] == 'done' else None,
+    }
+
+
+JOB_COLUMNS_SQL = '''ID, JobType, Format, Params, Status, RowsDone, RowsTotal, Error,
+                     CreatedAt, FinishedAt, ExpiresAt, FileName'''
+
+
+def load_user_job(conn, job_id):
+    cursor = conn.cursor(dictionary=True)
+    try:
+        cursor.execute(f'SELECT {JOB_COLUMNS_SQL} FROM ReportJob WHERE ID = %s AND UserID = %s',
+                       (job_id, session['user_id']))
+        return cursor.fetchone()
     finally:
         cursor.close()
-        conn.close()
 
-    return render_template('report_schedules.html', schedules=schedules, stats=stats,
-                          status_filter=status_filter, date_from=date_from, date_to=date_to, current_date=datetime.now())
+
+@app.route('/reports/<name>/jobs', methods=['POST'])
+@login_required
+def submit_report_job(name):
+    """Поставить выгрузку отчёта в очередь; фильтры — те же параметры запроса, что у страницы отчёта"""
+    fmt = request.args.get('fmt', 'csv')
+    if name not in REPORT_EXPORTS or fmt not in EXPORT_FORMATS:
+        flash('Неизвестный отчёт или формат выгрузки', 'error')
+        return redirect(url_for('reports'))
+
+    conn = get_db_connection()
+    if not conn:
+        flash('Ошибка подключения к базе данных', 'error')
+        return redirect(url_for('reports'))
+
+    cursor = conn.cursor()
+    try:
+        cursor.execute('''SELECT COUNT(*) FROM ReportJob
+                          WHERE UserID = %s AND Status IN ('queued', 'running')''', (session['user_id'],))
+        if cursor.fetchone()[0] >= app.config['REPORT_JOB_MAX_ACTIVE']:
+            flash(f'У вас уже {app.config["REPORT_JOB_MAX_ACTIVE"]} незавершённых выгрузки — дождитесь их или отмените', 'error')
+            return redirect(url_for('report_jobs'))
+        cursor.execute('''INSERT INTO ReportJob (UserID, JobType, Format, Params) VALUES (%s, %s, %s, %s)''',
+                       (session['user_id'], name, fmt,
+                        json.dumps({arg: request.args.get(arg, '') for arg in REPORT_QUERY_ARGS}, ensure_ascii=False)))
+        job_id = cursor.lastrowid
+        conn.commit()
+    except mysql.connector.Error as err:
+        conn.rollback()
+        flash(f'Ошибка при постановке выгрузки в очередь: {err}', 'error')
+        return redirect(url_for('reports'))
+    finally:
+        cursor.close()
+
+    dispatch_jobs()
+    flash('Выгрузка поставлена в очередь — файл появится на этой странице', 'success')
+    return redirect(url_for('report_jobs'))
+
+
+@app.route('/jobs')
+@login_required
+def report_jobs():
+    """Выгрузки текущего пользователя (последние 50)"""
+    conn = get_db_connection()
+    if not conn:
+        flash('Ошибка подключения к базе данных', 'error')
+        return redirect(url_for('reports'))
+
+    cursor = conn.cursor(dictionary=True)
+    try:
+        purge_jobs(conn)
+        dispatch_jobs()   # подхватить задания, оставшиеся в очереди без свободного процесса
+        cursor.execute(f'''SELECT {JOB_COLUMNS_SQL} FROM ReportJob WHERE UserID = %s
+                           ORDER BY ID DESC LIMIT 50''', (session['user_id'],))
+        jobs = [job_view(job) for job in cursor.fetchall()]
+    except mysql.connector.Error as err:
+        flash(f'Ошибка при получении списка выгрузок: {err}', 'error')
+        jobs = []
+    finally:
+        cursor.close()
+
+    return render_template('report_jobs.html', jobs=jobs,
+                           active=any(job['status'] in JOB_ACTIVE_STATUSES for job in jobs))
+
+
+@app.route('/api/jobs/<int:id>')
+@login_required
+def report_job_api(id):
+    """Состояние задания: статус, прогресс, ссылка на файл"""
+    conn = get_db_connection()
+    if not conn:
+        return jsonify(error='Ошибка подключения к базе данных'), 503
+    try:
+        job = load_user_job(conn, id)
+    except mysql.connector.Error as err:
+        return jsonify(error=str(err)), 500
+    if not job:
+        return jsonify(error='Задание не найдено'), 404
+    view = job_view(job)
+    for key in ('created_at', 'finished_at', 'expires_at'):
+        view[key] = view[key].isoformat() if view[key] else None
+    return jsonify(view)
+
+
+@app.route('/jobs/<int:id>/cancel', methods=['POST'])
+@login_required
+def cancel_report_job(id):
+    """Отменить задание: из очереди — сразу, выполняющееся — на ближайшей проверке прогресса"""
+    conn = get_db_connection()
+    if not conn:
+        flash('Ошибка подключения к базе данных', 'error')
+        return redirect(url_for('report_jobs'))
+
+    cursor = conn.cursor()
+    try:
+        cursor.execute('''UPDATE ReportJob SET Status = 'cancelled', FinishedAt = NOW()
+                          WHERE ID = %s AND UserID = %s AND Status = 'queued' ''', (id, session['user_id']))
+        if not cursor.rowcount:
+            cursor.execute('''UPDATE ReportJob SET CancelRequested = 1
+                              WHERE ID = %s AND UserID = %s AND Status = 'running' ''', (id, session['user_id']))
+        cancelled = cursor.rowcount
+        conn.commit()
+    except mysql.connector.Error as err:
+        conn.rollback()
+        flash(f'Ошибка при отмене выгрузки: {err}', 'error')
+        return redirect(url_for('report_jobs'))
+    finally:
+        cursor.close()
+
+    if cancelled:
+        flash('Выгрузка отменена', 'success')
+    else:
+        flash('Выгрузка уже завершена', 'info')
+    return redirect(url_for('report_jobs'))
+
+
+@app.route('/jobs/<int:id>/download')
+@login_required
+def download_report_job(id):
+    conn = get_db_connection()
+    if not conn:
+        flash('Ошибка подключения к базе данных', 'error')
+        return redirect(url_for('report_jobs'))
+    try:
+        job = load_user_job(conn, id)
+    except mysql.connector.Error as err:
+        flash(f'Ошибка при получении выгрузки: {err}', 'error')
+        return redirect(url_for('report_jobs'))
+
+    path = os.path.join(app.config['REPORT_JOB_DIR'], job['FileName']) if job and job['FileName'] else None
+    if job is None or job['Status'] != 'done' or not os.path.exists(path):
+        flash('Файл выгрузки недоступен', 'error')
+        return redirect(url_for('report_jobs'))
+    # send_file сам добавляет charset к text/*
+    return send_file(path, mimetype=EXPORT_FORMATS[job['Format']].split(';')[0], as_attachment=True,
+                     download_name=f"{job['JobType']}_{job['CreatedAt']:%Y-%m-%d_%H%M}.{job['Format']}")
 
 
 # ========== Доп. маршруты / утилиты ==========
+@app.route('/stats')
+@login_required
+def runtime_stats():
+    """Счётчики пула соединений и кэшей (для мониторинга)"""
+    return jsonify(
+        pid=os.getpid(),   # при нескольких рабочих процессах у каждого свои пул и кэши
+        db_pool=get_pool().stats(),
+        caches={
+            'dashboard': dashboard_cache.stats(),
+            'reference': reference_cache.stats(),
+            'reports': report_cache.stats(),
+        },
+        report_jobs=report_job_stats(),
+        login={
+            'user_limiter': login_user_limiter.stats(),
+            'ip_limiter': login_ip_limiter.stats(),
+        },
+    )
+
+
 @app.route('/favicon.ico')
 def favicon():
     """Обработчик для favicon.ico, чтобы избежать ошибок 404/500"""
     return '', 204  # No Content
 
 
+# ========== ЗАПУСК (фабрика приложения, настройки из окружения) ==========
+# Любой параметр app.config в верхнем регистре переопределяется переменной окружения
+# CLEANPRO_<ИМЯ>: CLEANPRO_DB_HOST, CLEANPRO_DB_POOL_SIZE, CLEANPRO_REPORT_CACHE_TTL, CLEANPRO_DEBUG...
+# Значение приводится к типу значения по умолчанию; словари и списки задаются в JSON.
+# Для продакшена — gunicorn с gunicorn.conf.py и wsgi.py (несколько процессов, см. README).
+ENV_PREFIX = 'CLEANPRO_'
+DEFAULT_SECRET_KEY = app.secret_key
+
+app.config.update(
+    WARM_UP_DB_POOL=True,       # при старте процесса сразу открыть DB_POOL_SIZE соединений
+    WARM_UP_CACHES=True,        # ... и загрузить справочники и счётчики главной страницы
+)
+
+
+def env_value(raw, default):
+    """Строка из окружения -> значение того же типа, что и default"""
+    if isinstance(default, bool):
+        value = raw.strip().lower()
+        if value in ('1', 'true', 'yes', 'on'):
+            return True
+        if value in ('0', 'false', 'no', 'off', ''):
+            return False
+        raise ValueError('ожидается 1/0 или true/false')
+    if isinstance(default, int):
+        return int(raw)
+    if isinstance(default, float):
+        return float(raw)
+    if isinstance(default, timedelta):
+        return timedelta(seconds=int(raw))
+    if isinstance(default, (dict, list, tuple)):
+        value = json.loads(raw)
+        if not isinstance(value, dict if isinstance(default, dict) else list):
+            raise ValueError('ожидается ' + ('объект' if isinstance(default, dict) else 'список') + ' JSON')
+        return value
+    return raw
+
+
+def load_env_config(environ=None):
+    """
+    Настройки из переменных окружения с префиксом CLEANPRO_. Переменные, которым
+    не соответствует параметр app.config, пропускаются (их читает, например, gunicorn.conf.py).
+    ValueError с именем переменной, если значение не разбирается.
+    """
+    environ = os.environ if environ is None else environ
+    config = {}
+    for name, raw in environ.items():
+        key = name[len(ENV_PREFIX):]
+        if not name.startswith(ENV_PREFIX) or not key.isupper() or key not in app.config:
+            continue
+        try:
+            config[key] = env_value(raw, app.config[key])
+        except ValueError as err:
+            raise ValueError(f'{name}: {err}') from None
+    return config
+
+
+def configure_runtime():
+    """
+    Применить app.config к объектам, созданным при импорте (кэши, ограничители входа,
+    очередь хэширования) и подключить ProxyFix, если задан PROXY_FIX_X_FOR.
+    """
+    global _password_slots
+    dashboard_cache.ttl = app.config['DASHBOARD_CACHE_TTL']
+    reference_cache.ttl = app.config['REFERENCE_CACHE_TTL']
+    reference_cache.maxsize = app.config['REFERENCE_CACHE_SIZE']
+    report_cache.ttl = app.config['REPORT_CACHE_TTL']
+    report_cache.maxsize = app.config['REPORT_CACHE_SIZE']
+    login_user_limiter.limit = app.config['LOGIN_USER_FAILURES']
+    login_user_limiter.window = app.config['LOGIN_USER_WINDOW']
+    login_ip_limiter.limit = app.config['LOGIN_IP_FAILURES']
+    login_ip_limiter.window = app.config['LOGIN_IP_WINDOW']
+    _password_slots = threading.BoundedSemaphore(app.config['PASSWORD_HASH_QUEUE'])
+    apply_proxy_fix()
+
+
+def create_app(config=None):
+    """
+    Приложение с настройками запуска: сначала config (значения по умолчанию для этого запуска),
+    поверх — переменные окружения CLEANPRO_*. Вызывать до первого запроса: пул соединений
+    и пулы потоков создаются при первом обращении уже с этими настройками.
+    """
+    if config:
+        app.config.update(config)
+    app.config.update(load_env_config())
+    configure_runtime()
+    if not app.debug and app.secret_key == DEFAULT_SECRET_KEY:
+        print('Внимание: используется ключ сессий по умолчанию, задайте CLEANPRO_SECRET_KEY')
+    return app
+
+
+def reset_process_state():
+    """
+    Сбросить состояние, унаследованное от родительского процесса при fork (gunicorn --preload):
+    соединения пула и потоки пулов принадлежат родителю, в дочернем процессе они создаются заново.
+    Унаследованные соединения не закрываем — это закрыло бы их и у родителя.
+    """
+    global _pool, _pool_lock, _job_executor, _job_lock, _job_threads, _password_executor, _password_lock
+    _pool, _pool_lock = None, threading.Lock()
+    _job_executor, _job_lock, _job_threads = None, threading.Lock(), 0
+    _password_executor, _password_lock = None, threading.Lock()
+    configure_runtime()
+
+
+def warm_up():
+    """
+    Подготовить процесс к первым запросам: открыть соединения пула, заполнить кэши
+    справочников и главной страницы, подготовить сжатую статику. Ошибки БД не мешают старту — всё догрузится по запросу.
+    """
+    started = time.monotonic()
+    if app.config['WARM_UP_DB_POOL']:
+        pool = get_pool()
+        conns = []
+        try:
+            for _ in range(pool.size):
+                conns.append(pool.acquire())
+        except mysql.connector.Error as err:
+            print(f'Прогрев пула соединений: {err}')
+        finally:
+            for conn in conns:
+                pool.release(conn)
+
+    def load_dashboard():
+        conn = get_db_connection()
+        if not conn:
+            raise mysql.connector.Error('Ошибка подключения к базе данных')
+        return load_dashboard_stats(conn)
+
+    if app.config['WARM_UP_CACHES']:
+        with app.app_context():
+            try:
+                get_client_choices()
+                get_object_choices()
+                get_services_reference()
+                get_active_employees()
+                dashboard_cache.get_or_load(date.today(), DASHBOARD_TABLES, load_dashboard)
+            except mysql.connector.Error as err:
+                print(f'Прогрев кэшей: {err}')
+    # Задания, оставшиеся в очереди (например, от перезапущенного процесса)
+    dispatch_jobs()
+    preload_assets()
+    print(f'Процесс {os.getpid()} готов за {time.monotonic() - started:.2f} с')
+
+
 if __name__ == '__main__':
-    app.run(debug=True, host='0.0.0.0', port=5001)
+    # Сервер разработки (с отладчиком, если не задано CLEANPRO_DEBUG=0); в продакшене — gunicorn
+    create_app({'DEBUG': True}).run(host='0.0.0.0', port=5001, debug=app.debug)
@@ -0,0 +1,37 @@
+"""
+Настройки gunicorn для продакшена:
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+Переменные окружения:
+    CLEANPRO_BIND     адрес, по умолчанию 0.0.0.0:5001
+    CLEANPRO_WORKERS  рабочих процессов, по умолчанию число ядер + 1
+    CLEANPRO_THREADS  потоков в процессе, по умолчанию 4
+    CLEANPRO_TIMEOUT  секунд без ответа процесса до его перезапуска, по умолчанию 60
+
+У каждого процесса свои пул соединений и кэши: всего соединений с MySQL может быть до
+CLEANPRO_WORKERS * (CLEANPRO_DB_POOL_SIZE + CLEANPRO_DB_POOL_MAX_OVERFLOW).
+"""
+import os
+
+bind = os.environ.get('CLEANPRO_BIND', '0.0.0.0:5001')
+workers = int(os.environ.get('CLEANPRO_WORKERS', (os.cpu_count() or 1) + 1))
+# Потоки: пока один запрос ждёт MySQL, процесс обслуживает другие; пул соединений потокобезопасен
+worker_class = 'gthread'
+threads = int(os.environ.get('CLEANPRO_THREADS', 4))
+timeout = int(os.environ.get('CLEANPRO_TIMEOUT', 60))
+graceful_timeout = 30
+keepalive = 5
+accesslog = '-'
+
+
+def post_fork(server, worker):
+    # С --preload приложение импортировано в главном процессе: пулы и блокировки,
+    # унаследованные при fork, в рабочем процессе создаются заново
+    from app import reset_process_state
+    reset_process_state()
+
+
+def post_worker_init(worker):
+    # Приложение загружено — открываем соединения и заполняем кэши до первого запроса
+    from app import warm_up
+    warm_up()
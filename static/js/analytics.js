@@ -0,0 +1,142 @@
+(function () {
+    var COLORS = ['#667eea', '#48bb78', '#ed8936', '#e53e3e', '#38b2ac', '#d53f8c', '#805ad5', '#dd6b20', '#a0aec0'];
+    var form = document.getElementById('analytics-filters');
+    var API = form.dataset.api;
+    var canvas = document.getElementById('chart');
+    var legend = document.getElementById('chart-legend');
+    var totals = document.getElementById('analytics-totals');
+    var notice = document.getElementById('analytics-notice');
+    var data = null;
+
+    function money(value) {
+        return value === null ? '—' : value.toLocaleString('ru-RU', {minimumFractionDigits: 2, maximumFractionDigits: 2});
+    }
+
+    function lines() {
+        // Без разреза — итог и его скользящее среднее, в разрезе — по линии на сущность
+        var metric = form.elements.metric.value;
+        if (!data.series.length) {
+            var result = [{name: 'Все заказы', values: data.total[metric], color: COLORS[0]}];
+            if (data.total[metric + '_ma']) {
+                result.push({name: 'Скользящее среднее (' + data.window + ')', values: data.total[metric + '_ma'],
+                             color: COLORS[1], dashed: true});
+            }
+            return result;
+        }
+        return data.series.map(function (series, index) {
+            return {name: series.name, values: series[metric], color: COLORS[index % COLORS.length]};
+        });
+    }
+
+    function draw() {
+        var ratio = window.devicePixelRatio || 1;
+        var width = canvas.clientWidth, height = canvas.clientHeight;
+        canvas.width = width * ratio;
+        canvas.height = height * ratio;
+        var ctx = canvas.getContext('2d');
+        ctx.scale(ratio, ratio);
+        ctx.clearRect(0, 0, width, height);
+
+        var series = lines();
+        var max = 0;
+        series.forEach(function (line) {
+            line.values.forEach(function (value) { if (value !== null && value > max) { max = value; } });
+        });
+        max = max || 1;
+        var left = 70, right = 10, top = 10, bottom = 30;
+        var count = data.periods.length;
+        var x = function (index) { return left + (count > 1 ? index * (width - left - right) / (count - 1) : 0); };
+        var y = function (value) { return top + (1 - value / max) * (height - top - bottom); };
+
+        // Оси и подписи
+        ctx.strokeStyle = '#e2e8f0';
+        ctx.fillStyle = '#718096';
+        ctx.font = '12px sans-serif';
+        for (var step = 0; step <= 4; step++) {
+            var value = max * step / 4;
+            ctx.beginPath();
+            ctx.moveTo(left, y(value));
+            ctx.lineTo(width - right, y(value));
+            ctx.stroke();
+            ctx.fillText(Math.round(value).toLocaleString('ru-RU'), 4, y(value) + 4);
+        }
+        var every = Math.max(1, Math.ceil(count / 12));
+        for (var index = 0; index < count; index += every) {
+            ctx.fillText(data.periods[index].split('-').reverse().join('.'), x(index) - 30, height - 8);
+        }
+
+        series.forEach(function (line) {
+            ctx.strokeStyle = line.color;
+            ctx.lineWidth = 2;
+            ctx.setLineDash(line.dashed ? [6, 4] : []);
+            ctx.beginPath();
+            var open = false;
+            line.values.forEach(function (value, index) {
+                if (value === null) { open = false; return; }
+                if (open) { ctx.lineTo(x(index), y(value)); } else { ctx.moveTo(x(index), y(value)); open = true; }
+            });
+            ctx.stroke();
+        });
+        ctx.setLineDash([]);
+
+        legend.innerHTML = '';
+        series.forEach(function (line) {
+            var item = document.createElement('span');
+            item.style.setProperty('--swatch', line.color);
+            item.textContent = line.name;
+            legend.appendChild(item);
+        });
+    }
+
+    function fillTotals() {
+        totals.innerHTML = '';
+        var rows = [{name: 'Итого', view: data.total}].concat(data.series.map(function (series) {
+            return {name: series.name, view: series};
+        }));
+        rows.forEach(function (row) {
+            var change = row.view.revenue_change[row.view.revenue_change.length - 1];
+            var tr = document.createElement('tr');
+            [row.name, row.view.totals.orders, row.view.totals.completed, money(row.view.totals.revenue),
+             money(row.view.totals.avg_cost)].forEach(function (text) {
+                var td = document.createElement('td');
+                td.textContent = text;
+                tr.appendChild(td);
+            });
+            var td = document.createElement('td');
+            if (change === null || change === undefined) {
+                td.textContent = '—';
+            } else {
+                td.textContent = (change > 0 ? '+' : '') + (change * 100).toFixed(1) + ' %';
+                td.className = change >= 0 ? 'change-up' : 'change-down';
+            }
+            tr.appendChild(td);
+            totals.appendChild(tr);
+        });
+    }
+
+    function load() {
+        var params = new URLSearchParams(new FormData(form));
+        params.delete('metric');
+        fetch(API + '?' + params.toString(), {credentials: 'same-origin'})
+            .then(function (response) {
+                return response.json().then(function (body) {
+                    if (!response.ok) { throw new Error(body.error || response.statusText); }
+                    return body;
+                });
+            })
+            .then(function (body) {
+                data = body;
+                notice.hidden = true;
+                draw();
+                fillTotals();
+            })
+            .catch(function (error) {
+                notice.hidden = false;
+                notice.textContent = 'Не удалось загрузить данные: ' + error.message;
+            });
+    }
+
+    form.elements.metric.addEventListener('change', function () { if (data) { draw(); } });
+    window.addEventListener('resize', function () { if (data) { draw(); } });
+    load();
+})();
@@ -0,0 +1,46 @@
+document.querySelectorAll('[data-autocomplete]').forEach(function (input) {
+    var hidden = document.getElementById(input.dataset.target);
+    var list = input.parentNode.querySelector('.autocomplete-list');
+    var timer = null;
+    var lastQuery = null;
+
+    function render(items) {
+        list.innerHTML = '';
+        items.forEach(function (item) {
+            var li = document.createElement('li');
+            li.textContent = item.label;
+            li.addEventListener('mousedown', function (event) {
+                event.preventDefault();
+                input.value = item.label;
+                hidden.value = item.id;
+                input.setCustomValidity('');
+                list.hidden = true;
+            });
+            list.appendChild(li);
+        });
+        list.hidden = items.length === 0;
+    }
+
+    function load() {
+        var query = input.value.trim();
+        if (query === lastQuery) { list.hidden = list.children.length === 0; return; }
+        lastQuery = query;
+        fetch(input.dataset.autocomplete + '?q=' + encodeURIComponent(query), {credentials: 'same-origin'})
+            .then(function (response) { return response.ok ? response.json() : []; })
+            .then(function (items) { if (query === input.value.trim()) { render(items); } })
+            .catch(function () { render([]); });
+    }
+
+    input.addEventListener('input', function () {
+        // Текст изменили вручную — выбранное значение больше не действительно
+        hidden.value = '';
+        clearTimeout(timer);
+        timer = setTimeout(load, 200);
+    });
+    input.addEventListener('focus', load);
+    input.addEventListener('blur', function () {
+        list.hidden = true;
+        if (input.value.trim() === '') { hidden.value = ''; }
+        input.setCustomValidity(input.value.trim() && !hidden.value ? 'Выберите значение из списка' : '');
+    });
+});
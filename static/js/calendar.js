@@ -0,0 +1,145 @@
+(function () {
+    var MONTHS = ['Январь', 'Февраль', 'Март', 'Апрель', 'Май', 'Июнь',
+                  'Июль', 'Август', 'Сентябрь', 'Октябрь', 'Ноябрь', 'Декабрь'];
+    var WEEKDAYS = ['Пн', 'Вт', 'Ср', 'Чт', 'Пт', 'Сб', 'Вс'];
+    var STATUS_CLASS = {'Запланировано': 'status-scheduled', 'Выполнено': 'status-completed', 'Отменено': 'status-cancelled'};
+    var form = document.getElementById('calendar-filters');
+    var grid = document.getElementById('calendar');
+    // Адрес API, вид и дата приходят из data-атрибутов сетки
+    var API = grid.dataset.api;
+    var view = grid.dataset.view;
+    var title = document.getElementById('calendar-title');
+    var notice = document.getElementById('calendar-notice');
+    var current = parse(grid.dataset.date);
+    var request = 0;
+
+    // Даты — полночь UTC, чтобы переход на летнее время не сдвигал дни
+    function parse(value) {
+        var parts = value.split('-');
+        return new Date(Date.UTC(+parts[0], parts[1] - 1, +parts[2]));
+    }
+    function iso(day) { return day.toISOString().slice(0, 10); }
+    function addDays(day, count) { return new Date(day.getTime() + count * 86400000); }
+    function monday(day) { return addDays(day, -((day.getUTCDay() + 6) % 7)); }
+    function label(day) { return iso(day).split('-').reverse().join('.'); }
+
+    function window_() {
+        if (view === 'day') { return [current, addDays(current, 1)]; }
+        if (view === 'week') { var start = monday(current); return [start, addDays(start, 7)]; }
+        var first = new Date(Date.UTC(current.getUTCFullYear(), current.getUTCMonth(), 1));
+        var next = new Date(Date.UTC(current.getUTCFullYear(), current.getUTCMonth() + 1, 1));
+        return [monday(first), addDays(monday(addDays(next, -1)), 7)];
+    }
+
+    function shift(direction) {
+        if (direction === 0) {
+            var now = new Date();
+            current = new Date(Date.UTC(now.getFullYear(), now.getMonth(), now.getDate()));
+        } else if (view === 'day') {
+            current = addDays(current, direction);
+        } else if (view === 'week') {
+            current = addDays(current, 7 * direction);
+        } else {
+            current = new Date(Date.UTC(current.getUTCFullYear(), current.getUTCMonth() + direction, 1));
+        }
+        form.elements.date.value = iso(current);
+        var params = new URLSearchParams(location.search);
+        params.set('view', view);
+        params.set('date', iso(current));
+        history.replaceState(null, '', '?' + params.toString());
+        load();
+    }
+
+    function summary(day) {
+        if (!day || !day.count) { return ''; }
+        var hours = Math.floor(day.minutes / 60), minutes = day.minutes % 60;
+        return day.count + ' зак. · ' + day.cost.toLocaleString('ru-RU') + ' ₽ · ' +
+               (hours ? hours + ' ч ' : '') + (minutes ? minutes + ' мин' : '');
+    }
+
+    function render(data, start, end) {
+        var byDay = {}, items = {};
+        data.days.forEach(function (day) { byDay[day.date] = day; });
+        data.items.forEach(function (item) { (items[item.date] = items[item.date] || []).push(item); });
+        var today = iso(new Date(Date.now() - new Date().getTimezoneOffset() * 60000));
+
+        grid.innerHTML = '';
+        grid.classList.toggle('day-view', view === 'day');
+        if (view !== 'day') {
+            WEEKDAYS.forEach(function (name) {
+                var cell = document.createElement('div');
+                cell.className = 'calendar-weekday';
+                cell.textContent = name;
+                grid.appendChild(cell);
+            });
+        }
+        for (var day = start; day < end; day = addDays(day, 1)) {
+            var key = iso(day);
+            var cell = document.createElement('div');
+            cell.className = 'calendar-day';
+            if (view === 'month' && day.getUTCMonth() !== current.getUTCMonth()) { cell.classList.add('other-month'); }
+            if (key === today) { cell.classList.add('today'); }
+
+            var number = document.createElement('div');
+            number.className = 'calendar-day-number';
+            number.textContent = view === 'month' ? day.getUTCDate() : WEEKDAYS[(day.getUTCDay() + 6) % 7] + ', ' + label(day);
+            cell.appendChild(number);
+
+            var line = document.createElement('div');
+            line.className = 'calendar-summary';
+            line.textContent = summary(byDay[key]);
+            cell.appendChild(line);
+
+            (items[key] || []).forEach(function (item) {
+                var link = document.createElement('a');
+                link.className = 'calendar-item ' + (STATUS_CLASS[item.status] || '');
+                link.href = item.url;
+                link.textContent = (item.time ? item.time + ' ' : '') + item.object;
+                link.title = [item.time, item.object, item.service, item.employee || 'Не назначен',
+                              item.minutes + ' мин', item.status].filter(Boolean).join(' · ');
+                cell.appendChild(link);
+            });
+            grid.appendChild(cell);
+        }
+    }
+
+    function load() {
+        var range = window_(), start = range[0], end = range[1];
+        if (view === 'month') {
+            title.textContent = MONTHS[current.getUTCMonth()] + ' ' + current.getUTCFullYear();
+        } else if (view === 'week') {
+            title.textContent = label(start) + ' – ' + label(addDays(end, -1));
+        } else {
+            title.textContent = label(start);
+        }
+
+        var params = new URLSearchParams({start: iso(start), end: iso(end)});
+        ['employee_id', 'object_id'].forEach(function (name) {
+            if (form.elements[name].value) { params.set(name, form.elements[name].value); }
+        });
+        var id = ++request;
+        fetch(API + '?' + params.toString(), {credentials: 'same-origin'})
+            .then(function (response) {
+                return response.json().then(function (data) {
+                    if (!response.ok) { throw new Error(data.error || response.statusText); }
+                    return data;
+                });
+            })
+            .then(function (data) {
+                if (id !== request) { return; }   // пока ждали, пользователь уже перелистнул
+                notice.hidden = !data.truncated;
+                notice.textContent = data.truncated ? 'Показаны не все заказы окна — уточните фильтр или выберите вид «Неделя»' : '';
+                render(data, start, end);
+            })
+            .catch(function (error) {
+                if (id !== request) { return; }
+                notice.hidden = false;
+                notice.textContent = 'Не удалось загрузить календарь: ' + error.message;
+            });
+    }
+
+    document.querySelectorAll('[data-shift]').forEach(function (button) {
+        button.addEventListener('click', function () { shift(+button.dataset.shift); });
+    });
+    load();
+})();
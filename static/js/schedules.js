@@ -0,0 +1,17 @@
+(function () {
+    var all = document.getElementById('bulk-all');
+    var count = document.getElementById('bulk-count');
+    var submit = document.getElementById('bulk-submit');
+    function update() {
+        var checked = document.querySelectorAll('.bulk-id:checked').length;
+        count.textContent = checked;
+        submit.disabled = checked === 0;
+    }
+    all.addEventListener('change', function () {
+        document.querySelectorAll('.bulk-id').forEach(function (box) { box.checked = all.checked; });
+        update();
+    });
+    document.addEventListener('change', function (event) {
+        if (event.target.classList.contains('bulk-id')) { update(); }
+    });
+})();
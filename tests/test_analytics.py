@@ -0,0 +1,108 @@
+"""Аналитика: разбивка дневных итогов по периодам и ряды (NumPy, без базы данных)"""
+from datetime import date
+from decimal import Decimal
+
+import numpy as np
+
+import app as cleanpro
+from app import build_analytics, moving_average, period_change, period_keys, period_starts
+
+
+class RowsConnection:
+    """Вместо соединения с БД: на каждый запрос отдаёт следующий заранее заданный набор строк"""
+
+    def __init__(self, *results):
+        self.results = list(results)
+        self.queries = []
+
+    def cursor(self):
+        return RowsCursor(self)
+
+
+class RowsCursor:
+    def __init__(self, conn):
+        self.conn = conn
+        self.rows = []
+
+    def execute(self, query, params=()):
+        self.conn.queries.append((query, list(params)))
+        self.rows = self.conn.results.pop(0)
+
+    def fetchall(self):
+        return self.rows
+
+    def close(self):
+        pass
+
+
+def scope(granularity, date_from, date_to, slice_by=None, window=2):
+    return {'granularity': granularity, 'date_from': date_from, 'date_to': date_to,
+            'slice': slice_by, 'id': None, 'window': window}
+
+
+def test_weeks_start_on_monday():
+    days = np.array(['2026-03-02', '2026-03-04', '2026-03-08', '2026-03-09', '1970-01-01'], dtype='datetime64[D]')
+    starts = period_starts(period_keys(days, 'week'), 'week')
+    assert [str(day) for day in starts] == ['2026-03-02', '2026-03-02', '2026-03-02', '2026-03-09', '1969-12-29']
+
+
+def test_month_periods_across_year_end():
+    days = np.array(['2025-12-31', '2026-01-01', '2026-02-28'], dtype='datetime64[D]')
+    starts = period_starts(period_keys(days, 'month'), 'month')
+    assert [str(day) for day in starts] == ['2025-12-01', '2026-01-01', '2026-02-01']
+
+
+def test_moving_average_and_change():
+    values = np.array([10.0, 20.0, 0.0, 30.0])
+    np.testing.assert_allclose(moving_average(values, 2), [np.nan, 15, 10, 15])
+    assert np.isnan(moving_average(values, 5)).all()
+    # после нулевого периода изменение не определено
+    np.testing.assert_allclose(period_change(values), [np.nan, 1.0, -1.0, np.nan])
+
+
+def test_monthly_totals():
+    rows = [
+        (date(2026, 1, 5), 0, 2, 1, Decimal('100.00')),
+        (date(2026, 1, 20), 0, 1, 1, Decimal('50.00')),
+        (date(2026, 3, 31), 0, 3, 2, Decimal('300.00')),
+    ]
+    result = build_analytics(RowsConnection(rows), scope('month', date(2026, 1, 1), date(2026, 3, 31)))
+
+    assert result['periods'] == ['2026-01-01', '2026-02-01', '2026-03-01']
+    total = result['total']
+    assert total['orders'] == [3, 0, 3]
+    assert total['completed'] == [2, 0, 2]
+    assert total['revenue'] == [150.0, 0.0, 300.0]
+    assert total['avg_cost'] == [75.0, None, 150.0]
+    assert total['revenue_ma'] == [None, 75.0, 150.0]
+    assert total['revenue_change'] == [None, -1.0, None]
+    assert total['totals'] == {'orders': 6, 'completed': 4, 'revenue': 450.0, 'avg_cost': 112.5}
+    assert result['series'] == []
+
+
+def test_empty_window_has_zero_periods():
+    result = build_analytics(RowsConnection([]), scope('day', date(2026, 3, 1), date(2026, 3, 3)))
+    assert result['periods'] == ['2026-03-01', '2026-03-02', '2026-03-03']
+    assert result['total']['orders'] == [0, 0, 0]
+    assert result['total']['totals']['avg_cost'] is None
+
+
+def test_slice_keeps_top_entities_and_groups_the_rest(monkeypatch):
+    monkeypatch.setitem(cleanpro.app.config, 'ANALYTICS_MAX_SERIES', 2)
+    day = date(2026, 3, 2)
+    rows = [
+        (day, 10, 1, 1, 100.0),
+        (day, 20, 1, 1, 500.0),
+        (day, 30, 2, 2, 300.0),
+        (day, 40, 1, 0, 0.0),
+    ]
+    # Названия есть только у одной из двух первых сущностей
+    conn = RowsConnection(rows, [(20, 'Иванов')])
+    result = build_analytics(conn, scope('week', day, day, slice_by='employee'))
+
+    assert [(series['id'], series['name']) for series in result['series']] == [
+        (20, 'Иванов'), (30, '#30'), (None, 'Прочие (2)'),
+    ]
+    assert result['series'][2]['totals'] == {'orders': 2, 'completed': 1, 'revenue': 100.0, 'avg_cost': 100.0}
+    assert result['total']['totals']['orders'] == 5
+    assert conn.queries[1][1] == [20, 30]
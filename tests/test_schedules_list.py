@@ -0,0 +1,45 @@
+"""Курсоры постраничного списка заказов (/schedules?after=...&before=...)"""
+from datetime import date
+
+import pytest
+
+from app import ScheduleListRow, parse_schedule_cursor, schedule_cursor, schedule_keyset_condition
+
+
+def list_row(schedule_id, day, scheduled_time):
+    return ScheduleListRow(schedule_id, day, scheduled_time, 'Запланировано', None, None, 'o', 'c', None, 's')
+
+
+def test_cursor_round_trip():
+    cursor = schedule_cursor(list_row(17, date(2024, 5, 1), '09:30'))
+    assert cursor == '2024-05-01_09:30_17'
+    assert parse_schedule_cursor(cursor) == (date(2024, 5, 1), '09:30', 17)
+
+
+def test_cursor_without_time():
+    cursor = schedule_cursor(list_row(17, date(2024, 5, 1), None))
+    assert cursor == '2024-05-01__17'
+    assert parse_schedule_cursor(cursor) == (date(2024, 5, 1), None, 17)
+
+
+def test_cursor_with_seconds_from_old_links():
+    assert parse_schedule_cursor('2024-05-01_09:30:00_17') == (date(2024, 5, 1), '09:30:00', 17)
+
+
+@pytest.mark.parametrize('value', [
+    None, '', 'abc', '2024-05-01_17', '2024-05-01_09:30_17_1',
+    '2024-13-01__17', '2024-05-01_25:00_17', '2024-05-01_9-30_17', '2024-05-01_09:30_x',
+])
+def test_invalid_cursor_means_first_page(value):
+    assert parse_schedule_cursor(value) is None
+
+
+def test_keyset_condition_params():
+    day = date(2024, 5, 1)
+    _, params = schedule_keyset_condition((day, '09:30', 17), backward=False)
+    assert params == [day, day, '09:30', '09:30', 17]
+    _, params = schedule_keyset_condition((day, None, 17), backward=False)
+    assert params == [day, day, 17]
+    sql, params = schedule_keyset_condition((day, None, 17), backward=True)
+    # Перед строкой без времени в том же дне идут все строки со временем
+    assert 'IS NOT NULL' in sql and params == [day, day, 17]
@@ -0,0 +1,206 @@
+"""Расписания: серии заказов, пересечения, автоназначение (без базы данных)"""
+from datetime import date, timedelta
+
+from werkzeug.datastructures import MultiDict
+
+from app import (AssignmentRow, check_booking, expand_recurrence, find_overlapping_pairs, parse_recurrence,
+                 plan_assignments, plan_digest, time_to_minutes)
+
+MON, TUE, WED, THU, FRI, SAT, SUN = range(7)
+
+
+# ---------- серии ----------
+
+def test_weekly_across_month_end():
+    assert expand_recurrence(date(2026, 1, 29), [MON, THU], until=date(2026, 2, 9)) == [
+        date(2026, 1, 29), date(2026, 2, 2), date(2026, 2, 5), date(2026, 2, 9),
+    ]
+
+
+def test_every_second_week_across_year_end():
+    assert expand_recurrence(date(2025, 12, 29), [MON], interval=2, count=3) == [
+        date(2025, 12, 29), date(2026, 1, 12), date(2026, 1, 26),
+    ]
+
+
+def test_start_day_not_in_weekdays_is_skipped():
+    # 31 января — суббота; первая дата серии — понедельник 2 февраля
+    assert expand_recurrence(date(2026, 1, 31), [MON], count=2) == [date(2026, 2, 2), date(2026, 2, 9)]
+
+
+def test_leap_day_is_included():
+    dates = expand_recurrence(date(2028, 2, 28), list(range(7)), until=date(2028, 3, 1))
+    assert dates == [date(2028, 2, 28), date(2028, 2, 29), date(2028, 3, 1)]
+
+
+def test_interval_counts_weeks_from_start_week():
+    # Неделя start — первая: среда той же недели входит, следующая неделя пропускается
+    assert expand_recurrence(date(2026, 1, 26), [MON, WED], interval=2, until=date(2026, 2, 11)) == [
+        date(2026, 1, 26), date(2026, 1, 28), date(2026, 2, 9), date(2026, 2, 11),
+    ]
+
+
+def test_until_is_inclusive_and_count_limit_apply_together():
+    start = date(2026, 3, 2)
+    assert expand_recurrence(start, [MON], until=date(2026, 3, 16)) == [
+        date(2026, 3, 2), date(2026, 3, 9), date(2026, 3, 16),
+    ]
+    assert expand_recurrence(start, [MON], until=date(2026, 12, 31), count=2) == [date(2026, 3, 2), date(2026, 3, 9)]
+    assert len(expand_recurrence(start, [MON], count=10, limit=4)) == 4
+    assert len(expand_recurrence(start, [MON], until=date(2030, 1, 1), limit=5)) == 5
+
+
+def test_parse_recurrence():
+    start = date(2026, 3, 2)
+    rule, error = parse_recurrence(MultiDict([('repeat_days', '3'), ('repeat_days', '0'), ('repeat_days', '3'),
+                                              ('repeat_interval', '2'), ('repeat_count', '5')]), start)
+    assert error is None
+    assert rule == {'weekdays': [MON, THU], 'interval': 2, 'until': None, 'count': 5}
+
+
+def test_parse_recurrence_errors():
+    start = date(2026, 3, 2)
+    cases = [
+        [('repeat_count', '5')],                                        # нет дней недели
+        [('repeat_days', '7'), ('repeat_count', '5')],                  # нет такого дня
+        [('repeat_days', '0')],                                         # ни даты окончания, ни количества
+        [('repeat_days', '0'), ('repeat_until', '2026-03-01')],         # окончание раньше начала
+        [('repeat_days', '0'), ('repeat_count', '0')],
+        [('repeat_days', '0'), ('repeat_interval', '0'), ('repeat_count', '5')],
+        [('repeat_days', 'пн'), ('repeat_count', '5')],
+        [('repeat_days', '0'), ('repeat_until', '02.03.2026')],
+    ]
+    for form in cases:
+        rule, error = parse_recurrence(MultiDict(form), start)
+        assert rule is None and error, form
+
+
+# ---------- пересечения ----------
+
+def booking(booking_id, start, end, employee_id=1, day=date(2026, 3, 2)):
+    return {'ID': booking_id, 'EmployeeID': employee_id, 'ScheduledDate': day, 'start': start, 'end': end}
+
+
+def pair_ids(bookings):
+    bookings = sorted(bookings, key=lambda b: (b['EmployeeID'], b['ScheduledDate'], b['start']))
+    return sorted(tuple(sorted((a['ID'], b['ID']))) for a, b in find_overlapping_pairs(bookings))
+
+
+def test_touching_intervals_do_not_overlap():
+    assert pair_ids([booking(1, 540, 600), booking(2, 600, 660)]) == []
+
+
+def test_overlap_by_one_minute():
+    assert pair_ids([booking(1, 540, 601), booking(2, 600, 660)]) == [(1, 2)]
+
+
+def test_nested_and_chained_intervals():
+    # 2 и 3 внутри 1, 4 пересекает 1 и 3, 5 касается 1 и пересекает 4
+    bookings = [booking(1, 540, 720), booking(2, 560, 600), booking(3, 660, 700), booking(4, 690, 780),
+                booking(5, 720, 740)]
+    assert pair_ids(bookings) == [(1, 2), (1, 3), (1, 4), (3, 4), (4, 5)]
+
+
+def test_same_start_overlaps():
+    assert pair_ids([booking(1, 600, 630), booking(2, 600, 601)]) == [(1, 2)]
+
+
+def test_other_employee_or_day_is_not_a_conflict():
+    bookings = [booking(1, 540, 600), booking(2, 540, 600, employee_id=2),
+                booking(3, 540, 600, day=date(2026, 3, 3))]
+    assert pair_ids(bookings) == []
+
+
+def test_time_to_minutes():
+    assert time_to_minutes(None) is None
+    assert time_to_minutes('') is None
+    assert time_to_minutes('09:30') == 570
+    assert time_to_minutes('09:30:45') == 570
+    assert time_to_minutes(timedelta(hours=23, minutes=59)) == 23 * 60 + 59
+
+
+def test_booking_without_time_or_employee_is_not_checked():
+    # Без времени, без сотрудника или с «Разрешить пересечение» — в базу не обращаемся (conn=None)
+    days = [date(2026, 3, 2)]
+    assert check_booking(None, {'employee_id': '1', 'scheduled_time': '', 'service_id': '1'}, days) is None
+    assert check_booking(None, {'employee_id': '', 'scheduled_time': '10:00', 'service_id': '1'}, days) is None
+    assert check_booking(None, {'employee_id': '1', 'scheduled_time': '10:00', 'service_id': '1',
+                                'allow_overlap': '1'}, days) is None
+
+
+# ---------- автоназначение ----------
+
+DAY = date(2026, 3, 2)
+
+
+def order(order_id, start, minutes=60, employee_id=None, status='Запланировано', day=DAY):
+    return AssignmentRow(order_id, employee_id, day, start, minutes, status, 'o', 's')
+
+
+def assigned(plan):
+    return {row.ID: employee_id for row, employee_id in plan}
+
+
+def test_least_loaded_employee_gets_the_order():
+    rows = [order(1, 540, 120, employee_id=1), order(2, 900)]
+    plan, unassigned, initial_load = plan_assignments([1, 2], rows)
+    assert assigned(plan) == {2: 2}
+    assert unassigned == []
+    assert initial_load == {1: 120, 2: 0}
+
+
+def test_busy_employee_is_skipped_but_touching_is_free():
+    rows = [order(1, 540, 60, employee_id=1), order(2, 540, 300, employee_id=2),
+            order(3, 570), order(4, 600)]
+    plan, unassigned, _ = plan_assignments([1, 2], rows)
+    # 3 пересекается с заказами обоих; 4 начинается ровно в конце заказа 1
+    assert assigned(plan) == {4: 1}
+    assert [row.ID for row in unassigned] == [3]
+
+
+def test_load_grows_as_orders_are_planned():
+    rows = [order(1, 540), order(2, 660), order(3, 780), order(4, 900)]
+    plan, _, _ = plan_assignments([1, 2], rows)
+    assert sorted(assigned(plan).values()) == [1, 1, 2, 2]
+
+
+def test_orders_without_time_go_last_and_ignore_busy_time():
+    rows = [order(1, None, 30), order(2, 540, 480, employee_id=1), order(3, 600)]
+    plan, unassigned, _ = plan_assignments([1], rows)
+    # 3 пересекается с 2, а заказ без времени назначается, хотя сотрудник занят весь день
+    assert [(row.ID, employee_id) for row, employee_id in plan] == [(1, 1)]
+    assert [row.ID for row in unassigned] == [3]
+
+
+def test_only_scheduled_orders_and_active_employees():
+    rows = [order(1, 540, status='Выполнено'), order(2, 540, 600, employee_id=9), order(3, 540)]
+    plan, _, initial_load = plan_assignments([1], rows)
+    # сотрудник 9 не в списке активных: его заказ не даёт загрузки и не мешает
+    assert assigned(plan) == {3: 1}
+    assert initial_load == {1: 0}
+
+
+def test_no_employees_leaves_everything_unassigned():
+    plan, unassigned, _ = plan_assignments([], [order(1, 540), order(2, None)])
+    assert plan == [] and [row.ID for row in unassigned] == [1, 2]
+
+
+def test_digest_ignores_plan_order():
+    plan, _, _ = plan_assignments([1, 2], [order(1, 540), order(2, 540), order(3, 660)])
+    assert plan_digest(plan) == plan_digest(list(reversed(plan)))
+    assert plan_digest([]) == plan_digest([])
+
+
+def test_digest_mismatch_rejects_stale_plan():
+    rows = [order(1, 540), order(2, 660)]
+    preview, _, _ = plan_assignments([1, 2], rows)
+    shown = plan_digest(preview)
+
+    # Пока план был открыт, сотруднику 1 вручную назначили заказ на всё утро
+    current, _, _ = plan_assignments([1, 2], rows + [order(3, 480, 300, employee_id=1)])
+    assert assigned(current) != assigned(preview)
+    assert plan_digest(current) != shown
+
+    # Те же данные — тот же отпечаток, план применяется
+    again, _, _ = plan_assignments([1, 2], rows)
+    assert plan_digest(again) == shown
@@ -0,0 +1,40 @@
+"""Поиск для форм: PrefixIndex"""
+from app import PrefixIndex
+
+ITEMS = [
+    (1, 'Офис на Лесной (Иванов)', 'Офис на Лесной Иванов'),
+    (2, 'Склад (Ёлкин)', 'Склад Ёлкин'),
+    (3, 'Офис Центр (Петров)', 'Офис Центр Петров'),
+    (4, 'Лесопилка (Сидоров)', 'Лесопилка Сидоров'),
+]
+
+
+def ids(found):
+    return [item['id'] for item in found]
+
+
+def test_matches_start_of_any_word():
+    index = PrefixIndex(ITEMS)
+    assert sorted(ids(index.search('лес', 10))) == [1, 4]
+    assert ids(index.search('петр', 10)) == [3]
+
+
+def test_case_and_yo_are_ignored():
+    index = PrefixIndex(ITEMS)
+    assert ids(index.search('ЕЛК', 10)) == [2]
+    assert ids(index.search('  Ёлкин ', 10)) == [2]
+
+
+def test_item_found_once_even_if_several_keys_match():
+    # "офис" — начало и всей строки, и её первого слова
+    index = PrefixIndex(ITEMS)
+    found = index.search('офис', 10)
+    assert sorted(ids(found)) == [1, 3]
+    assert found[0]['label'] in ('Офис на Лесной (Иванов)', 'Офис Центр (Петров)')
+
+
+def test_limit_and_no_match():
+    index = PrefixIndex(ITEMS)
+    assert len(index.search('о', 1)) == 1
+    assert index.search('xyz', 10) == []
+    assert PrefixIndex([]).search('офис', 10) == []
@@ -0,0 +1,8 @@
+"""
+Точка входа для WSGI-сервера:
+    gunicorn -c gunicorn.conf.py wsgi:app
+Настройки берутся из переменных окружения CLEANPRO_* (см. create_app в app.py).
+"""
+from app import create_app
+
+app = create_app()